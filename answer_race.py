@@ -0,0 +1,273 @@
+"""Hedged Gemini/Wikipedia lookups for Orion Voice Assistant
+
+General questions can be answered by Gemini (preferred) or Wikipedia.
+Trying them one after the other means a failing Gemini call costs its
+whole timeout before Wikipedia even starts. ``race`` runs the backends
+under one of three strategies and a per-request deadline:
+
+* ``sequential`` - start the fallback only after the preferred backend fails
+* ``parallel``   - start every backend at once
+* ``hedged``     - start the fallback after ``hedge_delay`` seconds, or as
+  soon as the preferred backend fails
+
+The most preferred successful answer available when the race settles (or
+the deadline passes) wins, and the losers are cancelled. Blocking calls
+already running in a thread can't be interrupted, so their results are
+simply discarded; in ``race_async`` the losing tasks are really cancelled.
+Callers should also bound each backend's own timeout by what is left of
+the deadline (``capped_timeout``), so abandoned calls don't pile up.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+
+import config
+import tracing
+
+STRATEGIES = ("sequential", "parallel", "hedged")
+
+# answer is None when no backend succeeded in time; errors maps backend -> message
+AnswerResult = namedtuple("AnswerResult", ["answer", "backend", "cache_status", "errors", "elapsed"])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=config.ANSWER_RACE_WORKERS, thread_name_prefix="orion-answer"
+                )
+    return _executor
+
+
+def _settings(strategy, deadline, hedge_delay):
+    strategy = strategy or config.ANSWER_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown answer strategy {strategy!r}; expected one of {STRATEGIES}")
+    deadline = config.ANSWER_DEADLINE if deadline is None else deadline
+    hedge_delay = config.ANSWER_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    return strategy, deadline, hedge_delay
+
+
+def start_delay(strategy, position, hedge_delay):
+    """Seconds before the backend at ``position`` starts; None means only on failure"""
+    if position == 0 or strategy == "parallel":
+        return 0
+    if strategy == "hedged":
+        return hedge_delay * position
+    return None
+
+
+def capped_timeout(timeout, started, deadline=None):
+    """Return ``timeout`` cut down to what is left of a race that began at ``started``"""
+    deadline = config.ANSWER_DEADLINE if deadline is None else deadline
+    return max(0.1, min(timeout, deadline - (time.monotonic() - started)))
+
+
+class _Timer:
+    """One shared thread that runs callbacks after a delay
+
+    Delayed hedges wait here instead of each parking a pool worker.
+    """
+
+    def __init__(self):
+        self._queue = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._order), callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="orion-hedge-timer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, callback = heapq.heappop(self._queue)
+            try:
+                callback()
+            except Exception as e:
+                print(f"Hedge Timer Error: {type(e).__name__}: {e}")
+
+
+_timer = _Timer()
+
+
+class HedgedCall:
+    """A backend call on the shared pool that starts after a delay
+
+    The call starts early with ``start_now()`` and is abandoned with
+    ``cancel()``; a delay of None waits for ``start_now()``. Until it
+    starts, the call holds no pool thread.
+    """
+
+    def __init__(self, fetch, delay=0):
+        self.future = Future()
+        self._fetch = tracing.wrap(fetch)
+        self._lock = threading.Lock()
+        self._started = False
+        self._running = None
+        if delay == 0:
+            self.start_now()
+        elif delay is not None:
+            _timer.schedule(delay, self.start_now)
+
+    def start_now(self):
+        with self._lock:
+            if self._started or not self.future.set_running_or_notify_cancel():
+                return
+            self._started = True
+            self._running = _get_executor().submit(self._fetch)
+        self._running.add_done_callback(self._finish)
+
+    def _finish(self, running):
+        if running.cancelled():
+            self.future.set_exception(CancelledError())
+        elif running.exception() is not None:
+            self.future.set_exception(running.exception())
+        else:
+            self.future.set_result(running.result())
+
+    def cancel(self):
+        with self._lock:
+            if self._started:
+                self._running.cancel()
+            else:
+                self.future.cancel()
+
+
+def _outcome(future):
+    """Return (answer, cache_status, error) for a finished backend future"""
+    try:
+        answer, cache_status = future.result()
+    except (CancelledError, asyncio.CancelledError):
+        return None, None, "cancelled"
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+    if not answer:
+        return None, None, "no answer"
+    return answer, cache_status, None
+
+
+def _settle(backends, answers, errors, started, start_next, final=False):
+    """Return the winning AnswerResult once the race is decided, else None
+
+    The race is decided when the most preferred backend that hasn't failed
+    has answered. Each failure lets the next backend start immediately.
+    With ``final`` the best answer so far wins regardless.
+    """
+    for position, (name, _) in enumerate(backends):
+        if name in answers:
+            answer, cache_status = answers[name]
+            return AnswerResult(answer, name, cache_status, errors, time.monotonic() - started)
+        if name not in errors and not final:
+            return None
+        if position + 1 < len(backends):
+            start_next(position + 1)
+    if final:
+        return AnswerResult(None, None, None, errors, time.monotonic() - started)
+    return None
+
+
+def race(backends, strategy=None, deadline=None, hedge_delay=None):
+    """Answer with the most preferred backend that succeeds within the deadline
+
+    ``backends`` is a list of (name, fetch) pairs, most preferred first;
+    ``fetch()`` returns (answer, cache_status) and a falsy answer or an
+    exception counts as a failure. Returns an AnswerResult.
+    """
+    strategy, deadline, hedge_delay = _settings(strategy, deadline, hedge_delay)
+    started = time.monotonic()
+    calls = [
+        HedgedCall(fetch, start_delay(strategy, position, hedge_delay))
+        for position, (_, fetch) in enumerate(backends)
+    ]
+    names = {call.future: name for call, (name, _) in zip(calls, backends)}
+    answers, errors = {}, {}
+    pending = {call.future for call in calls}
+
+    try:
+        while pending:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                answer, cache_status, error = _outcome(future)
+                if error:
+                    errors[names[future]] = error
+                else:
+                    answers[names[future]] = (answer, cache_status)
+
+            result = _settle(backends, answers, errors, started, lambda i: calls[i].start_now())
+            if result is not None:
+                return result
+
+        for future in pending:
+            errors.setdefault(names[future], "deadline exceeded")
+        return _settle(backends, answers, errors, started, lambda i: None, final=True)
+    finally:
+        for call in calls:
+            call.cancel()
+
+
+async def delayed(fetch, delay, go):
+    """Await ``fetch()`` after ``delay`` seconds or once ``go`` is set (None waits for ``go``)"""
+    if delay != 0:
+        try:
+            await asyncio.wait_for(go.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    return await fetch()
+
+
+async def race_async(backends, strategy=None, deadline=None, hedge_delay=None):
+    """Awaitable version of `race`; ``fetch()`` is a coroutine function"""
+    strategy, deadline, hedge_delay = _settings(strategy, deadline, hedge_delay)
+    started = time.monotonic()
+    gates = [asyncio.Event() for _ in backends]
+    tasks = [
+        asyncio.ensure_future(delayed(fetch, start_delay(strategy, position, hedge_delay), gate))
+        for position, ((_, fetch), gate) in enumerate(zip(backends, gates))
+    ]
+    names = {task: name for task, (name, _) in zip(tasks, backends)}
+    answers, errors = {}, {}
+    pending = set(tasks)
+
+    try:
+        while pending:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                answer, cache_status, error = _outcome(task)
+                if error:
+                    errors[names[task]] = error
+                else:
+                    answers[names[task]] = (answer, cache_status)
+
+            result = _settle(backends, answers, errors, started, lambda i: gates[i].set())
+            if result is not None:
+                return result
+
+        for task in pending:
+            errors.setdefault(names[task], "deadline exceeded")
+        return _settle(backends, answers, errors, started, lambda i: None, final=True)
+    finally:
+        for task in tasks:
+            task.cancel()
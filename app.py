@@ -1,57 +1,142 @@
 """Flask Web Application for Orion Voice Assistant"""
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import speech_recognition as sr
-from gtts import gTTS
-import os
 import threading
 import time
 from datetime import datetime
 from dotenv import load_dotenv
 import config
-from client import get_ai_response
+from client import (get_ai_response, stream_ai_response, generate_text,
+                    get_ai_response_async, stream_ai_response_async)
 import wikipedia
 import musiclibrary
-import re
+from tts_cache import synthesize_speech, iter_speech_segments, tts_cache
+from tts_backends import audio_mimetype
+from response_cache import response_cache
+from knowledge_store import wikipedia_summary
+from song_cache import get_song_cache
+from intents import classify, website_for, GENERAL
+from calculator import calculate, CalculationError
+import answer_race
+import metrics
+import tracing
+from tracing import span
+from sessions import SessionStore
 import io
-import google.generativeai as genai
+import json
+import gzip
+import hashlib
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
 
-# Configure Google Generative AI
-google_api_key = os.getenv('GOOGLE_API_KEY')
-if google_api_key:
-    genai.configure(api_key=google_api_key)
+# Google Generative AI is configured once by the shared client in client.py
+google_api_key = config.GOOGLE_API_KEY
 
-def get_gemini_response(query):
+def get_gemini_response(query, timeout=None):
     """Get AI response from Google Gemini"""
-    try:
-        if not google_api_key:
-            print("Gemini API: No API key configured")
-            return None
-        
-        print(f"Gemini API: Sending query: {query[:50]}...")
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(query)
-        print(f"Gemini API: Response received successfully")
-        return response.text
-    except Exception as e:
-        print(f"Gemini API Error: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    if not google_api_key:
+        print("Gemini API: No API key configured")
         return None
+    
+    print(f"Gemini API: Sending query: {query[:50]}...")
+    response = get_ai_response(query, timeout=timeout)
+    if response:
+        print(f"Gemini API: Response received successfully")
+    return response
+
+def stream_gemini_response(query, timeout=None):
+    """Yield partial Gemini output as it is generated"""
+    if not google_api_key:
+        print("Gemini API: No API key configured")
+        return
+    
+    print(f"Gemini API: Streaming query: {query[:50]}...")
+    yield from stream_ai_response(query, timeout=timeout)
+
+# Thread pool for blocking library calls (Wikipedia, gTTS) made from the
+# async serving mode in asgi.py; sized for hundreds of in-flight requests
+_blocking_executor = None
+_blocking_executor_lock = threading.Lock()
+
+def get_blocking_executor():
+    """Return the shared executor used by run_blocking"""
+    global _blocking_executor
+    if _blocking_executor is None:
+        with _blocking_executor_lock:
+            if _blocking_executor is None:
+                _blocking_executor = ThreadPoolExecutor(
+                    max_workers=config.ASYNC_BLOCKING_WORKERS, thread_name_prefix='orion-blocking'
+                )
+    return _blocking_executor
+
+async def run_blocking(func, *args, **kwargs):
+    """Await a blocking call on the shared executor without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), tracing.wrap(functools.partial(func, *args, **kwargs)))
 
 app = Flask(__name__)
 CORS(app)
 
-# Global state
-assistant_state = {
-    'listening': False,
-    'last_command': '',
-    'last_response': '',
-    'history': []
-}
+# Per-browser conversation state, keyed by the session cookie
+sessions = SessionStore()
+
+def current_session():
+    """Return the SessionState for this request, creating one if needed"""
+    if 'session' not in g:
+        g.session_id, g.session, _ = sessions.resolve(request.cookies.get(config.SESSION_COOKIE_NAME))
+    return g.session
+
+def _endpoint_label():
+    """Route pattern for metrics labels (bounded, unlike raw paths)"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = _endpoint_label()
+    metrics.HTTP_IN_FLIGHT.inc(g.metrics_endpoint)
+    g.request_id = tracing.new_request_id(request.headers.get('X-Request-ID'))
+    g.trace = tracing.start(g.request_id, f"{request.method} {g.metrics_endpoint}")
+    tracing.activate(g.trace)
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint:
+        metrics.HTTP_IN_FLIGHT.dec(endpoint)
+        metrics.HTTP_REQUESTS.inc(endpoint, str(g.pop('metrics_status', 500)))
+    # Streaming routes finish their own trace once the last chunk is sent
+    if not g.get('trace_streamed'):
+        tracing.finish(g.pop('trace', None))
+    tracing.activate(None)
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    response.headers['X-Request-ID'] = g.request_id
+    if g.trace is not None:
+        # For streams this covers the work done before the first byte
+        response.headers['Server-Timing'] = g.trace.server_timing()
+    return response
+
+@app.after_request
+def set_session_cookie(response):
+    """Send the session cookie with a fresh Max-Age whenever the session was used
+
+    The server's idle timeout slides with every request, so the cookie's
+    lifetime has to slide with it.
+    """
+    session_id = g.pop('session_id', None)
+    if session_id:
+        response.set_cookie(
+            config.SESSION_COOKIE_NAME, session_id,
+            max_age=config.SESSION_IDLE_TIMEOUT, httponly=True, samesite='Lax'
+        )
+    return response
 
 class VoiceAssistant:
     """Voice assistant handler for web interface"""
@@ -59,181 +144,380 @@ class VoiceAssistant:
     def __init__(self):
         self.recognizer = sr.Recognizer()
     
-    def process_command(self, command):
-        """Process command and return response"""
+    def process_command(self, command, defer_general=False):
+        """Process command and return response
+
+        The command is classified by the shared intent router and dispatched
+        to the matching ``_handle_<intent>`` method. With ``defer_general``
+        set, general questions are not answered here and None is returned so
+        the caller can stream the answer itself.
+        """
         command = command.lower()
-        response = ""
-        action = None
-        url = None
+        with span('route'):
+            intent = classify(command)
         
-        # Exit command
-        if "exit" in command or "quit" in command:
-            response = "Goodbye! Refresh to restart."
+        if intent.name == GENERAL and defer_general:
+            return None
         
-        # Time and date
-        elif "time" in command:
-            now = datetime.now()
-            time_str = now.strftime("%I:%M %p")
-            response = f"The time is {time_str}"
+        handler = getattr(self, f'_handle_{intent.name}', self._handle_general)
+        started = time.perf_counter()
+        try:
+            with span(intent.name):
+                result = handler(command, **intent.slots)
+        except Exception:
+            metrics.observe_command(intent.name, time.perf_counter() - started, failed=True)
+            raise
+        metrics.observe_command(self._metric_label(intent.name, result), time.perf_counter() - started)
+        return result
+    
+    @staticmethod
+    def _metric_label(intent_name, result):
+        """Metrics label: general questions are labelled by the backend that answered"""
+        return result.get('source') or intent_name
+    
+    def _observe_stream(self, events):
+        """Pass through answer stream events, recording the command's metrics"""
+        started = time.perf_counter()
+        try:
+            for kind, payload in events:
+                if kind == 'result':
+                    metrics.observe_command(self._metric_label(GENERAL, payload), time.perf_counter() - started)
+                yield kind, payload
+        except Exception:
+            metrics.observe_command(GENERAL, time.perf_counter() - started, failed=True)
+            raise
+    
+    async def _observe_stream_async(self, events):
+        """Async counterpart of _observe_stream"""
+        started = time.perf_counter()
+        try:
+            async for kind, payload in events:
+                if kind == 'result':
+                    metrics.observe_command(self._metric_label(GENERAL, payload), time.perf_counter() - started)
+                yield kind, payload
+        except Exception:
+            metrics.observe_command(GENERAL, time.perf_counter() - started, failed=True)
+            raise
+    
+    @staticmethod
+    def _reply(response, action=None, url=None, cache_status=None, source=None):
+        """Return dict with response and optional action/url"""
+        return {
+            'response': response,
+            'action': action,
+            'url': url,
+            'cache': cache_status,
+            'source': source
+        }
+    
+    def _handle_exit(self, command):
+        return self._reply("Goodbye! Refresh to restart.")
+    
+    def _handle_time(self, command):
+        now = datetime.now()
+        time_str = now.strftime("%I:%M %p")
+        return self._reply(f"The time is {time_str}")
+    
+    def _handle_date(self, command):
+        now = datetime.now()
+        date_str = now.strftime("%B %d, %Y")
+        return self._reply(f"Today is {date_str}")
+    
+    def _handle_calculate(self, command, expression):
+        try:
+            response = f"The answer is {calculate(expression)}"
+        except CalculationError as e:
+            response = str(e)
+        return self._reply(response)
+    
+    def _handle_show_songs(self, command):
+        return self._reply("I can play any song you'd like! Just say 'play' followed by the song name. For example: 'play Blinding Lights' or 'play Tum Hi Ho'.")
+    
+    def _handle_open_site(self, command, site):
+        name, url = website_for(site)
+        return self._reply(f"Ready to open {name}", action="pending_action", url=url)
+    
+    def _handle_play(self, command, song):
+        song_name = song
         
-        elif "date" in command or "today" in command:
-            now = datetime.now()
-            date_str = now.strftime("%B %d, %Y")
-            response = f"Today is {date_str}"
+        if not song_name:
+            return self._reply("What would you like me to play?")
         
-        # Calculations
-        elif "calculate" in command or ("what" in command and any(op in command for op in ["plus", "minus", "times", "divided"])):
-            try:
-                expression = re.sub(r'(calculate|what is|whats)', '', command, flags=re.IGNORECASE).strip()
-                expression = expression.replace('plus', '+').replace('minus', '-')
-                expression = expression.replace('times', '*').replace('multiplied by', '*')
-                expression = expression.replace('divided by', '/').replace('divide', '/')
-                
-                # Validate expression contains only safe characters
-                if re.match(r'^[\d\s\+\-\*\/\(\)\.]+$', expression):
-                    result = eval(expression, {"__builtins__": None}, {})
-                    response = f"The answer is {result}"
-                else:
-                    response = "Sorry, I can only calculate mathematical expressions."
-            except ZeroDivisionError:
-                response = "Cannot divide by zero."
-            except Exception as e:
-                response = "Sorry, I couldn't perform that calculation. Please try again."
+        # First, check the shared fuzzy index of the music library (the first
+        # get_song_cache() call brings back songs promoted by earlier lookups)
+        get_song_cache()
+        match = musiclibrary.find_song(song_name)
         
-        # Show songs
-        elif "show songs" in command or "list songs" in command:
-            response = "I can play any song you'd like! Just say 'play' followed by the song name. For example: 'play Blinding Lights' or 'play Tum Hi Ho'."
+        if match:
+            # Song found in library - use direct video URL
+            print(f"✅ Found '{song_name}' in music library: {match.url}")
+            return self._reply(f"I found {match.name}. Click to play it.", action="pending_action", url=match.url)
         
-        # Web browsing
-        elif "open google" in command:
-            action = "pending_action"
-            url = "https://google.com"
-            response = "Ready to open Google"
-        elif "open youtube" in command:
-            action = "pending_action"
-            url = "https://youtube.com"
-            response = "Ready to open YouTube"
-        elif "open facebook" in command:
-            action = "pending_action"
-            url = "https://facebook.com"
-            response = "Ready to open Facebook"
-        elif "open linkedin" in command:
-            action = "pending_action"
-            url = "https://linkedin.com"
-            response = "Ready to open LinkedIn"
+        # Song not in library - try Gemini if available
+        if not google_api_key:
+            return self._reply("No song found in my music library. Please enable Google API for dynamic search.")
         
-        # Music playback
-        elif command.startswith("play"):
-            song_name = command.replace("play", "").strip()
-            
-            if not song_name:
-                response = "What would you like me to play?"
-            else:
-                # First, check if song exists in the music library
-                song_key = song_name.lower().replace(" ", "_")
-                
-                # Search for exact or partial match in music library
-                found_url = None
-                found_song_name = song_name
-                
-                # Try exact match first
-                if song_key in musiclibrary.music:
-                    found_url = musiclibrary.music[song_key]
-                    found_song_name = song_key.replace("_", " ").title()
-                else:
-                    # Try partial match
-                    for key in musiclibrary.music.keys():
-                        if song_key in key or key in song_key:
-                            found_url = musiclibrary.music[key]
-                            found_song_name = key.replace("_", " ").title()
-                            break
-                
-                if found_url:
-                    # Song found in library - use direct video URL
-                    action = "pending_action"
-                    url = found_url
-                    response = f"I found {found_song_name}. Click to play it."
-                    print(f"✅ Found '{song_name}' in music library: {found_url}")
-                    
-                    return {
-                        'response': response,
-                        'action': action,
-                        'url': url
-                    }
-                else:
-                    # Song not in library - try Gemini if available
-                    if google_api_key:
-                        print(f"❌ '{song_name}' not in library, searching with Gemini...")
-                        youtube_url = self._find_song_on_youtube(song_name)
-                        if youtube_url:
-                            # Determine if it's a direct video URL or search fallback
-                            is_direct_video = 'watch?v=' in youtube_url
-                            
-                            action = "pending_action"
-                            url = youtube_url
-                            
-                            if is_direct_video:
-                                response = f"I found {song_name}. Click to play it."
-                                print(f"✅ Found '{song_name}' via Gemini")
-                            else:
-                                response = f"Searching for {song_name} on YouTube"
-                                print(f"📺 Using YouTube search for '{song_name}'")
-                            
-                            return {
-                                'response': response,
-                                'action': action,
-                                'url': url
-                            }
-                        else:
-                            response = f"No song found in my music library. Try another song or search manually."
-                    else:
-                        response = f"No song found in my music library. Please enable Google API for dynamic search."
+        print(f"❌ '{song_name}' not in library, searching with Gemini...")
+        youtube_url = self._find_song_on_youtube(song_name)
+        if not youtube_url:
+            return self._reply("No song found in my music library. Try another song or search manually.")
         
-        # AI or Wikipedia
+        # Determine if it's a direct video URL or search fallback
+        if 'watch?v=' in youtube_url:
+            response = f"I found {song_name}. Click to play it."
+            print(f"✅ Found '{song_name}' via Gemini")
         else:
-            # Try Google Gemini AI response first
-            if google_api_key:
-                ai_response = get_gemini_response(command)
-                if ai_response:
-                    response = ai_response
-                else:
-                    response = self._search_wikipedia(command)
+            response = f"Searching for {song_name} on YouTube"
+            print(f"📺 Using YouTube search for '{song_name}'")
+        return self._reply(response, action="pending_action", url=youtube_url)
+    
+    def _handle_general(self, command, **slots):
+        # AI or Wikipedia
+        response, cache_status, source = self._answer_question(command)
+        return self._reply(response, cache_status=cache_status, source=source)
+    
+    def process_command_stream(self, command):
+        """Process command, yielding ('delta', text) events then ('result', dict)"""
+        result = self.process_command(command, defer_general=True)
+        if result is not None:
+            yield 'delta', result['response']
+            yield 'result', result
+            return
+
+        yield from self._observe_stream(self._stream_answer(command.lower()))
+
+    def _stream_answer(self, command):
+        """Stream the answer to a general question"""
+        cached_answer = response_cache.get('gemini', command) if google_api_key else None
+        if cached_answer:
+            yield 'delta', cached_answer
+            yield 'result', self._reply(cached_answer, cache_status='hit', source='gemini')
+            return
+
+        if not google_api_key:
+            response, cache_status = self._lookup_wikipedia(command)
+            yield 'delta', response
+            yield 'result', self._reply(response, cache_status=cache_status, source='wikipedia')
+            return
+
+        # Wikipedia is hedged per config.ANSWER_STRATEGY and dropped once Gemini starts talking
+        started = time.monotonic()
+        fallback = answer_race.HedgedCall(
+            lambda: self._fetch_wikipedia(command),
+            answer_race.start_delay(config.ANSWER_STRATEGY, 1, config.ANSWER_HEDGE_DELAY),
+        )
+        parts = []
+        try:
+            # Don't let a stalled stream outlive the deadline the hedge enforces
+            timeout = answer_race.capped_timeout(config.GEMINI_TIMEOUT, started)
+            for text in stream_gemini_response(command, timeout=timeout):
+                if not parts:
+                    fallback.cancel()
+                parts.append(text)
+                yield 'delta', text
+
+            if parts:
+                response = ''.join(parts)
+                response_cache.put('gemini', command, response)
+                cache_status, source = 'miss', 'gemini'
             else:
-                # Fallback to Wikipedia if no API key
-                response = self._search_wikipedia(command)
+                fallback.start_now()
+                remaining = max(0, config.ANSWER_DEADLINE - (time.monotonic() - started))
+                try:
+                    response, cache_status = fallback.future.result(timeout=remaining)
+                    source = 'wikipedia'
+                except Exception as e:
+                    print(f"Answer Error: wikipedia: {type(e).__name__}: {e}")
+                    response, cache_status, source = self._no_answer_message(), None, None
+                yield 'delta', response
+        finally:
+            fallback.cancel()
+
+        yield 'result', self._reply(response, cache_status=cache_status, source=source)
+
+    async def process_command_async(self, command):
+        """Async counterpart of process_command used by the ASGI server
         
-        # Return dict with response and optional action/url
-        return {
-            'response': response,
-            'action': action,
-            'url': url
-        }
+        General questions await Gemini directly; song lookups and Wikipedia
+        run on the blocking executor. Other intents are instant and run inline.
+        """
+        command = command.lower()
+        with span('route'):
+            intent = classify(command)
+        
+        if intent.name == GENERAL:
+            started = time.perf_counter()
+            try:
+                response, cache_status, source = await self._answer_question_async(command)
+            except Exception:
+                metrics.observe_command(GENERAL, time.perf_counter() - started, failed=True)
+                raise
+            metrics.observe_command(source or GENERAL, time.perf_counter() - started)
+            return self._reply(response, cache_status=cache_status, source=source)
+        if intent.name == 'play':
+            return await run_blocking(self.process_command, command)
+        return self.process_command(command)
     
-    def _search_wikipedia(self, query):
-        """Search Wikipedia and return result"""
+    async def process_command_stream_async(self, command):
+        """Async counterpart of process_command_stream"""
+        command = command.lower()
+        if classify(command).name != GENERAL:
+            result = await self.process_command_async(command)
+            yield 'delta', result['response']
+            yield 'result', result
+            return
+        
+        async for event in self._observe_stream_async(self._stream_answer_async(command)):
+            yield event
+    
+    async def _stream_answer_async(self, command):
+        """Async counterpart of _stream_answer"""
+        # The cache may be SQLite-backed, so keep it off the event loop
+        cached_answer = await run_blocking(response_cache.get, 'gemini', command) if google_api_key else None
+        if cached_answer:
+            yield 'delta', cached_answer
+            yield 'result', self._reply(cached_answer, cache_status='hit', source='gemini')
+            return
+        
+        if not google_api_key:
+            response, cache_status = await run_blocking(self._lookup_wikipedia, command)
+            yield 'delta', response
+            yield 'result', self._reply(response, cache_status=cache_status, source='wikipedia')
+            return
+        
+        started = time.monotonic()
+        gate = asyncio.Event()
+        fallback = asyncio.ensure_future(answer_race.delayed(
+            lambda: run_blocking(self._fetch_wikipedia, command),
+            answer_race.start_delay(config.ANSWER_STRATEGY, 1, config.ANSWER_HEDGE_DELAY),
+            gate,
+        ))
+        parts = []
         try:
-            summary = wikipedia.summary(query, sentences=2)
-            return summary
+            timeout = answer_race.capped_timeout(config.GEMINI_TIMEOUT, started)
+            async for text in stream_ai_response_async(command, timeout=timeout):
+                if not parts:
+                    fallback.cancel()
+                parts.append(text)
+                yield 'delta', text
+            
+            if parts:
+                response = ''.join(parts)
+                await run_blocking(response_cache.put, 'gemini', command, response)
+                cache_status, source = 'miss', 'gemini'
+            else:
+                gate.set()
+                remaining = max(0, config.ANSWER_DEADLINE - (time.monotonic() - started))
+                try:
+                    response, cache_status = await asyncio.wait_for(fallback, remaining)
+                    source = 'wikipedia'
+                except Exception as e:
+                    print(f"Answer Error: wikipedia: {type(e).__name__}: {e}")
+                    response, cache_status, source = self._no_answer_message(), None, None
+                yield 'delta', response
+        finally:
+            fallback.cancel()
+        
+        yield 'result', self._reply(response, cache_status=cache_status, source=source)
+    
+    async def _answer_question_async(self, query):
+        """Async counterpart of _answer_question"""
+        async def ask_gemini():
+            cached_answer = await run_blocking(response_cache.get, 'gemini', query)
+            if cached_answer is not None:
+                return cached_answer, 'hit'
+            answer = await get_ai_response_async(
+                query, timeout=answer_race.capped_timeout(config.GEMINI_TIMEOUT, started)
+            )
+            await run_blocking(response_cache.put, 'gemini', query, answer)
+            return answer, 'miss'
+        
+        started = time.monotonic()
+        backends = [('gemini', ask_gemini)] if google_api_key else []
+        backends.append(('wikipedia', lambda: run_blocking(self._fetch_wikipedia, query)))
+        return self._race_result(await answer_race.race_async(backends))
+
+    def _answer_question(self, query):
+        """Answer a general question with Gemini and/or Wikipedia
+        
+        The backends are raced per config.ANSWER_STRATEGY within
+        config.ANSWER_DEADLINE. Returns a (response, cache_status, source)
+        tuple, where source names the backend that answered.
+        """
+        started = time.monotonic()
+        
+        def ask_gemini(query):
+            # Don't let an abandoned call outlive the race
+            return get_gemini_response(query, timeout=answer_race.capped_timeout(config.GEMINI_TIMEOUT, started))
+        
+        backends = []
+        if google_api_key:
+            backends.append(('gemini', lambda: response_cache.cached('gemini', query, ask_gemini)))
+        backends.append(('wikipedia', lambda: self._fetch_wikipedia(query)))
+        return self._race_result(answer_race.race(backends))
+
+    def _race_result(self, result):
+        """Turn an answer_race.AnswerResult into (response, cache_status, source)"""
+        for backend, error in result.errors.items():
+            print(f"Answer Error: {backend}: {error}")
+        if result.answer is None:
+            return self._no_answer_message(), None, None
+        print(f"Answer: {result.backend} won in {result.elapsed:.2f}s")
+        return result.answer, result.cache_status, result.backend
+
+    @staticmethod
+    def _no_answer_message():
+        return "Sorry, I couldn't find an answer to that right now."
+
+    def _fetch_wikipedia(self, query):
+        """Search Wikipedia through the response cache, returning (result, cache_status)
+        
+        Ambiguous and unknown topics produce a message; other errors propagate.
+        """
+        try:
+            return response_cache.cached('wikipedia', query, lambda q: wikipedia_summary(q, sentences=2))
         except wikipedia.exceptions.DisambiguationError:
-            return f"Multiple results found for '{query}'. Please be more specific."
+            return f"Multiple results found for '{query}'. Please be more specific.", 'miss'
         except wikipedia.exceptions.PageError:
-            return f"Sorry, I couldn't find information about '{query}'."
+            return f"Sorry, I couldn't find information about '{query}'.", 'miss'
+
+    def _lookup_wikipedia(self, query):
+        """Search Wikipedia through the response cache, returning (result, cache_status)"""
+        try:
+            return self._fetch_wikipedia(query)
         except:
-            return "Sorry, I encountered an error searching Wikipedia."
-    
+            return "Sorry, I encountered an error searching Wikipedia.", 'miss'
+
     def _find_song_on_youtube(self, song_name):
+        """Find a song on YouTube and return the video URL
+        
+        Earlier resolutions are served from the persistent song cache; otherwise
+        Gemini is asked and its answer is stored for next time.
+        """
+        cached = get_song_cache().lookup(song_name)
+        if cached:
+            print(f"💾 Song cache: '{song_name}' -> {cached['url']} (confidence {cached['confidence']})")
+            return cached['url']
+        
+        url, resolved = self._ask_gemini_for_song(song_name)
+        if resolved:
+            get_song_cache().store(song_name, url)
+        return url
+    
+    def _ask_gemini_for_song(self, song_name):
         """Use Gemini to find a song on YouTube and return the video URL
         
-        Returns a direct YouTube watch URL if found, otherwise returns a search URL.
+        Returns a (url, resolved) tuple: a direct YouTube watch URL if found,
+        otherwise a search URL. ``resolved`` is False when Gemini could not be
+        asked at all, so the fallback is not worth remembering.
         """
         try:
             if not google_api_key:
                 # Fallback to search if no API key
                 search_query = song_name.replace(" ", "+")
-                return f"https://www.youtube.com/results?search_query={search_query}"
+                return f"https://www.youtube.com/results?search_query={search_query}", False
             
             print(f"🎵 Gemini: Searching for '{song_name}'...")
-            model = genai.GenerativeModel('gemini-2.5-flash')
             
             # Improved prompt to get the most accurate result
             prompt = f"""Find the OFFICIAL or MOST POPULAR YouTube video for: "{song_name}"
@@ -248,43 +532,42 @@ Rules:
 - Return ONLY the URL, nothing else
 - If you cannot find any result, respond with: SEARCH:{song_name}"""
             
-            response = model.generate_content(prompt)
-            result = response.text.strip()
+            response = generate_text(prompt, max_output_tokens=config.GEMINI_SONG_MAX_OUTPUT_TOKENS)
+            if not response:
+                raise ValueError("empty Gemini response")
+            result = response.strip()
             
             # Check if Gemini wants us to do a search instead
             if result.startswith("SEARCH:"):
                 search_query = song_name.replace(" ", "+")
                 fallback_url = f"https://www.youtube.com/results?search_query={search_query}"
                 print(f"⚠️ Gemini: Falling back to search for '{song_name}'")
-                return fallback_url
+                return fallback_url, True
             
             # Validate it's a proper YouTube direct video URL
             if 'youtube.com' in result and 'watch?v=' in result:
                 # Extract video ID to verify it's valid format
                 if len(result.split('v=')[-1]) >= 10:  # YouTube video IDs are typically 11 chars
                     print(f"✅ Gemini: Found video for '{song_name}': {result}")
-                    return result
+                    return result, True
             
             # If response doesn't look right, fall back to search
             search_query = song_name.replace(" ", "+")
             fallback_url = f"https://www.youtube.com/results?search_query={search_query}"
             print(f"⚠️ Gemini: Invalid response format, using search: {result[:50]}...")
-            return fallback_url
+            return fallback_url, True
             
         except Exception as e:
             print(f"❌ Gemini Song Search Error: {e}")
             # Fallback to YouTube search
             search_query = song_name.replace(" ", "+")
-            return f"https://www.youtube.com/results?search_query={search_query}"
+            return f"https://www.youtube.com/results?search_query={search_query}", False
     
     def text_to_speech(self, text):
         """Convert text to speech audio"""
         try:
-            tts = gTTS(text, lang=config.TTS_LANGUAGE)
-            audio_fp = io.BytesIO()
-            tts.write_to_fp(audio_fp)
-            audio_fp.seek(0)
-            return audio_fp
+            audio = synthesize_speech(text, config.TTS_LANGUAGE)
+            return io.BytesIO(audio) if audio else None
         except Exception as e:
             print(f"TTS Error: {e}")
             return None
@@ -304,14 +587,43 @@ def status():
         'status': 'online',
         'name': config.ASSISTANT_NAME,
         'gemini_enabled': bool(google_api_key),
-        'song_count': musiclibrary.get_song_count()
+        'song_count': musiclibrary.get_song_count(),
+        'song_cache': get_song_cache().stats(),
+        'tts_cache': tts_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'sessions': sessions.stats()
     })
 
+def collect_cache_metrics():
+    """Scrape-time cache and session metrics for /metrics"""
+    hits, misses, ratios = [], [], []
+    caches = {name: stats for name, stats in response_cache.stats().items() if isinstance(stats, dict)}
+    caches['tts'] = tts_cache.stats()
+    for name, stats in caches.items():
+        labels = {'cache': name}
+        hits.append((labels, stats.get('hits', 0)))
+        misses.append((labels, stats.get('misses', 0)))
+        ratios.append((labels, stats.get('hit_ratio', 0.0)))
+    session_stats = sessions.stats()
+    return [
+        ('orion_cache_hits_total', 'counter', 'Cache hits', hits),
+        ('orion_cache_misses_total', 'counter', 'Cache misses', misses),
+        ('orion_cache_hit_ratio', 'gauge', 'Cache hit ratio since start', ratios),
+        ('orion_sessions', 'gauge', 'Live web sessions',
+         [({'backend': session_stats['backend']}, session_stats['sessions'])]),
+    ]
+
+metrics.registry.add_collector(collect_cache_metrics)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/process', methods=['POST'])
 def process():
     """Process a command from the web interface"""
-    data = request.json
-    command = data.get('command', '')
+    command = json_body().get('command', '')
     
     if not command:
         return jsonify({'error': 'No command provided'}), 400
@@ -324,30 +636,34 @@ def process():
         response_text = result.get('response', '')
         action = result.get('action')
         url = result.get('url')
+        cache_status = result.get('cache')
+        source = result.get('source')
     else:
         # Backward compatibility with old string format
         response_text = result
         action = None
         url = None
+        cache_status = None
+        source = None
     
-    # Update state
-    assistant_state['last_command'] = command
-    assistant_state['last_response'] = response_text
-    assistant_state['history'].append({
-        'command': command,
-        'response': response_text,
-        'timestamp': datetime.now().isoformat()
-    })
-    
-    # Keep only last 50 items
-    if len(assistant_state['history']) > 50:
-        assistant_state['history'] = assistant_state['history'][-50:]
-    
-    # Build response
+    with span('history'):
+        response_data = record_exchange(command, response_text, action, url, cache_status, source)
+    with span('serialize'):
+        return jsonify(response_data)
+
+def record_exchange(command, response_text, action=None, url=None, cache_status=None, source=None,
+                    session=None):
+    """Add a command/response pair to the session history and build the API payload"""
+    entry = (session or current_session()).record(command, response_text)
+    return exchange_payload(entry, action, url, cache_status, source)
+
+def exchange_payload(entry, action=None, url=None, cache_status=None, source=None):
+    """Build the API payload for a recorded history entry"""
     response_data = {
-        'command': command,
-        'response': response_text,
-        'timestamp': datetime.now().isoformat()
+        'id': entry['id'],
+        'command': entry['command'],
+        'response': entry['response'],
+        'timestamp': entry['timestamp']
     }
     
     # Add action and URL if present
@@ -355,46 +671,257 @@ def process():
         response_data['action'] = action
     if url:
         response_data['url'] = url
+    # Report whether a Gemini/Wikipedia answer came from the response cache
+    if cache_status:
+        response_data['cache'] = cache_status
+    # Report which backend (gemini or wikipedia) answered a general question
+    if source:
+        response_data['source'] = source
+    
+    return response_data
+
+# Bounded pool shared by all /api/process/batch requests
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Return the shared executor used for batch commands"""
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=config.BATCH_WORKERS, thread_name_prefix='orion-batch'
+                )
+    return _batch_executor
+
+def run_batch_item(command):
+    """Process one batch command, returning (result or None, error or None, elapsed ms)"""
+    started = time.perf_counter()
+    if not isinstance(command, str) or not command.strip():
+        return None, 'No command provided', 0.0
+    try:
+        result, error = assistant.process_command(command), None
+    except Exception as e:
+        print(f"Batch Error: {type(e).__name__}: {str(e)}")
+        result, error = None, 'Processing failed'
+    return result, error, round((time.perf_counter() - started) * 1000, 2)
+
+def json_body():
+    """Return the request's JSON object, or {} for a missing, invalid or non-object body"""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+@app.route('/api/process/batch', methods=['POST'])
+def process_batch():
+    """Process a list of commands concurrently, returning results in order
+    
+    Commands don't depend on each other, so they run on a bounded shared
+    pool. Each result carries its own timing and either the usual
+    /api/process payload or an error. Successful exchanges are appended to
+    the session history in one atomic step, in request order.
+    """
+    commands = json_body().get('commands')
+    if not isinstance(commands, list) or not commands:
+        return jsonify({'error': 'No commands provided'}), 400
+    if len(commands) > config.BATCH_MAX_COMMANDS:
+        return jsonify({'error': f'At most {config.BATCH_MAX_COMMANDS} commands per batch'}), 413
+    
+    started = time.perf_counter()
+    executor = get_batch_executor()
+    outcomes = [future.result() for future in
+                [executor.submit(tracing.wrap(run_batch_item), command) for command in commands]]
+    
+    succeeded = [(index, result) for index, (result, error, _) in enumerate(outcomes) if error is None]
+    entries = current_session().record_many(
+        (commands[index], result['response']) for index, result in succeeded
+    )
+    payloads = {
+        index: exchange_payload(entry, result.get('action'), result.get('url'),
+                                result.get('cache'), result.get('source'))
+        for (index, result), entry in zip(succeeded, entries)
+    }
+    
+    results = []
+    for index, (command, (_, error, elapsed_ms)) in enumerate(zip(commands, outcomes)):
+        item = payloads.get(index) or {'command': command, 'error': error}
+        item.update(index=index, elapsed_ms=elapsed_ms)
+        results.append(item)
     
-    return jsonify(response_data)
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'errors': len(results) - len(payloads),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
+def format_sse(event, data):
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/process/stream', methods=['GET', 'POST'])
+def process_stream():
+    """Process a command, streaming the answer as Server-Sent Events
+    
+    Emits ``delta`` events with partial text as it is generated and a final
+    ``done`` event carrying the same payload as /api/process.
+    """
+    if request.method == 'POST':
+        command = json_body().get('command', '')
+    else:
+        command = request.args.get('command', '')
+    
+    if not command:
+        return jsonify({'error': 'No command provided'}), 400
+    
+    # Resolve the session now so a new cookie goes out with the stream headers
+    session = current_session()
+    trace = g.trace
+    g.trace_streamed = True
+    
+    def generate():
+        # The body is produced after the view returns, so carry the trace along
+        tracing.activate(trace)
+        try:
+            result = {'response': '', 'action': None, 'url': None}
+            try:
+                for kind, payload in assistant.process_command_stream(command):
+                    if kind == 'delta':
+                        yield format_sse('delta', {'text': payload})
+                    else:
+                        result = payload
+            except Exception as e:
+                print(f"Stream Error: {type(e).__name__}: {str(e)}")
+                yield format_sse('error', {'error': 'Processing failed'})
+                return
+            
+            with span('history'):
+                response_data = record_exchange(
+                    command, result['response'], result.get('action'), result.get('url'), result.get('cache'),
+                    result.get('source'), session=session
+                )
+            yield format_sse('done', response_data)
+        finally:
+            tracing.finish(trace)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/tts', methods=['POST'])
 def text_to_speech_endpoint():
     """Convert text to speech audio"""
-    data = request.json
+    data = json_body()
     text = data.get('text', '')
     
     if not text:
         return jsonify({'error': 'No text provided'}), 400
     
-    audio_fp = assistant.text_to_speech(text)
+    # Streaming mode: send each sentence's MP3 segment as soon as it is ready
+    if data.get('stream') or request.args.get('stream') == '1':
+        # Only MP3 engines here: concatenated WAV segments would not play as one file
+        segments = iter_speech_segments(text, config.TTS_LANGUAGE, formats=("mp3",))
+        return Response(stream_with_context(segments), mimetype='audio/mpeg')
+    
+    with span('tts'):
+        audio_fp = assistant.text_to_speech(text)
     
     if audio_fp:
-        return Response(audio_fp.read(), mimetype='audio/mpeg')
+        audio = audio_fp.read()
+        return Response(audio, mimetype=audio_mimetype(audio))
     else:
         return jsonify({'error': 'TTS failed'}), 500
 
+# Serialized /api/songs payload, rebuilt only when musiclibrary.version changes
+_songs_payload = None
+_songs_payload_lock = threading.Lock()
+
+def songs_payload():
+    """Return (json bytes, gzipped bytes, etag) for the current song library"""
+    global _songs_payload
+    get_song_cache()  # include promoted songs
+    payload = _songs_payload
+    if payload is None or payload[0] != musiclibrary.version:
+        with _songs_payload_lock:
+            payload = _songs_payload
+            if payload is None or payload[0] != musiclibrary.version:
+                version = musiclibrary.version
+                songs = [
+                    {'name': key.replace('_', ' ').title(), 'key': key, 'url': url}
+                    for key, url in list(musiclibrary.music.items())
+                ]
+                body = json.dumps({'songs': songs}, separators=(',', ':')).encode()
+                # Hash of the content, so every worker process agrees on the ETag
+                etag = hashlib.sha256(body).hexdigest()[:32]
+                payload = (version, body, gzip.compress(body, mtime=0), etag)
+                _songs_payload = payload
+    return payload[1:]
+
 @app.route('/api/songs')
 def get_songs():
-    """Get list of available songs"""
-    songs = []
-    for key, url in musiclibrary.music.items():
-        songs.append({
-            'name': key.replace('_', ' ').title(),
-            'key': key,
-            'url': url
-        })
-    return jsonify({'songs': songs})
+    """Get list of available songs (gzipped when accepted, with a strong ETag per encoding)"""
+    body, compressed, etag = songs_payload()
+    gzipped = bool(request.accept_encodings['gzip'])
+    if gzipped:
+        # A strong ETag names exact bytes, so the gzip body gets its own
+        body, etag = compressed, f"{etag}-gz"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={config.SONGS_CACHE_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/api/songs/search')
+def search_songs():
+    """Search the song library by fuzzy name match, best first"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    limit = min(max(request.args.get('limit', 5, type=int), 1), config.SONG_SEARCH_MAX_LIMIT)
+    get_song_cache()  # include promoted songs
+    return jsonify({'songs': [match._asdict() for match in musiclibrary.index.search(query, limit=limit)]})
 
 @app.route('/api/history')
 def get_history():
-    """Get command history"""
-    return jsonify({'history': assistant_state['history']})
+    """Get command history
+    
+    ``?since=<id>`` returns only entries newer than that id, oldest first,
+    and ``limit`` caps the page (``has_more`` says whether to fetch again
+    with ``since=next_since``). Responses carry an ETag, so a poll with
+    If-None-Match gets an empty 304 while the history is unchanged.
+    """
+    session = current_session()
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(limit, 1)
+    # Each page of the same history version is a different representation
+    etag = f"{session.version()}-{since}-{limit or 'all'}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        entries = session.get_history(since, limit + 1 if limit else None)
+        has_more = limit is not None and len(entries) > limit
+        entries = entries[:limit] if has_more else entries
+        response = jsonify({
+            'history': entries,
+            'next_since': entries[-1]['id'] if entries else since,
+            'has_more': has_more
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/clear-history', methods=['POST'])
 def clear_history():
     """Clear command history"""
-    assistant_state['history'] = []
+    current_session().clear()
     return jsonify({'success': True})
 
 if __name__ == '__main__':
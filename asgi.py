@@ -0,0 +1,247 @@
+"""Async serving mode for the Orion web interface
+
+The Flask app in app.py handles one request per worker thread, so a few
+slow Gemini calls can tie up every thread. This module wraps it in an
+ASGI application: the hot endpoints (/api/process, /api/process/stream
+and one-shot /api/tts) are served natively on the event loop, awaiting
+Gemini with the async client and pushing blocking Wikipedia/gTTS calls
+onto app.py's dedicated executor. Every other route is delegated to the
+unchanged Flask app through asgiref's WSGI adapter.
+
+Run with ``python asgi.py`` or ``uvicorn asgi:application``.
+"""
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import config
+import metrics
+import tracing
+from tracing import span
+import app as webapp
+from tts_backends import audio_mimetype
+
+_wsgi = WsgiToAsgi(webapp.app)
+
+# Flask-CORS allows any origin; native routes send the same header
+_CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+async def _read_body(receive):
+    """Read the complete request body"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _replay(body):
+    """Return a receive callable that yields an already-read body"""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+
+def _json_body(body):
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _query_params(scope):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return {key: values[-1] for key, values in query.items()}
+
+
+async def _session(scope):
+    """Return (SessionState, extra response headers) for the request's session cookie
+
+    The session backend may be SQLite or a KV server, so it is resolved on
+    the blocking executor.
+    """
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(config.SESSION_COOKIE_NAME)
+    session_id, session, _ = await webapp.run_blocking(webapp.sessions.resolve, morsel.value if morsel else None)
+    # Refreshed on every request, like app.set_session_cookie, so the idle timeout slides
+    cookie = (f"{config.SESSION_COOKIE_NAME}={session_id}; Max-Age={config.SESSION_IDLE_TIMEOUT}; "
+              "HttpOnly; Path=/; SameSite=Lax")
+    return session, [(b'set-cookie', cookie.encode())]
+
+
+async def _start(send, status, content_type, extra_headers=()):
+    headers = [(b'content-type', content_type.encode())] + _CORS_HEADERS + list(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+
+async def _send_json(send, data, status=200, extra_headers=()):
+    await _start(send, status, 'application/json', extra_headers)
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+
+async def process(scope, receive, send):
+    """Native /api/process"""
+    command = _json_body(await _read_body(receive)).get('command', '')
+    if not command:
+        await _send_json(send, {'error': 'No command provided'}, 400)
+        return
+
+    session, session_headers = await _session(scope)
+    result = await webapp.assistant.process_command_async(command)
+    with span('history'):
+        response_data = await webapp.run_blocking(
+            webapp.record_exchange, command, result.get('response', ''), result.get('action'), result.get('url'),
+            result.get('cache'), result.get('source'), session=session
+        )
+    await _send_json(send, response_data, extra_headers=session_headers)
+
+
+async def process_stream(scope, receive, send):
+    """Native /api/process/stream (Server-Sent Events)"""
+    if scope['method'] == 'POST':
+        command = _json_body(await _read_body(receive)).get('command', '')
+    else:
+        command = _query_params(scope).get('command', '')
+    if not command:
+        await _send_json(send, {'error': 'No command provided'}, 400)
+        return
+
+    session, session_headers = await _session(scope)
+    await _start(send, 200, 'text/event-stream',
+                 [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')] + session_headers)
+
+    async def emit(event, data):
+        await send({'type': 'http.response.body', 'body': webapp.format_sse(event, data).encode(), 'more_body': True})
+
+    result = {'response': '', 'action': None, 'url': None}
+    try:
+        async for kind, payload in webapp.assistant.process_command_stream_async(command):
+            if kind == 'delta':
+                await emit('delta', {'text': payload})
+            else:
+                result = payload
+    except Exception as e:
+        print(f"Stream Error: {type(e).__name__}: {str(e)}")
+        await emit('error', {'error': 'Processing failed'})
+    else:
+        await emit('done', await webapp.run_blocking(
+            webapp.record_exchange, command, result['response'], result.get('action'), result.get('url'),
+            result.get('cache'), result.get('source'), session=session
+        ))
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _wants_tts_stream(scope, body):
+    """Streaming /api/tts requests are served by Flask (see application)"""
+    return bool(_json_body(body).get('stream')) or _query_params(scope).get('stream') == '1'
+
+
+async def text_to_speech(scope, receive, send):
+    """Native one-shot /api/tts"""
+    text = _json_body(await _read_body(receive)).get('text', '')
+    if not text:
+        await _send_json(send, {'error': 'No text provided'}, 400)
+        return
+
+    with span('tts'):
+        audio_fp = await webapp.run_blocking(webapp.assistant.text_to_speech, text)
+    if not audio_fp:
+        await _send_json(send, {'error': 'TTS failed'}, 500)
+        return
+    audio = audio_fp.read()
+    await _start(send, 200, audio_mimetype(audio))
+    await send({'type': 'http.response.body', 'body': audio})
+
+
+ROUTES = {
+    ('POST', '/api/process'): process,
+    ('GET', '/api/process/stream'): process_stream,
+    ('POST', '/api/process/stream'): process_stream,
+    ('POST', '/api/tts'): text_to_speech,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            webapp.get_blocking_executor()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            webapp.get_blocking_executor().shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    handler = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is text_to_speech:
+        # Decide before instrumenting: Flask's hooks already trace and count delegated requests
+        body = await _read_body(receive)
+        receive = _replay(body)
+        if _wants_tts_stream(scope, body):
+            handler = None
+    if handler is None:
+        await _wsgi(scope, receive, send)
+        return
+
+    # Same HTTP metrics and tracing the Flask hooks provide for delegated routes
+    endpoint = scope['path']
+    status = 500
+    incoming_id = dict(scope.get('headers', ())).get(b'x-request-id', b'').decode('latin-1')
+    request_id = tracing.new_request_id(incoming_id)
+    trace = tracing.start(request_id, f"{scope['method']} {endpoint}")
+    tracing.activate(trace)
+
+    async def send_with_status(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            headers = list(message.get('headers', ())) + [(b'x-request-id', request_id.encode())]
+            if trace is not None:
+                headers.append((b'server-timing', trace.server_timing().encode()))
+            message = dict(message, headers=headers)
+        await send(message)
+
+    metrics.HTTP_IN_FLIGHT.inc(endpoint)
+    try:
+        await handler(scope, receive, send_with_status)
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec(endpoint)
+        metrics.HTTP_REQUESTS.inc(endpoint, str(status))
+        tracing.finish(trace)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("="*50)
+    print(f"🚀 {config.ASSISTANT_NAME} Web Interface Starting (async mode)...")
+    print("="*50)
+    print("🌐 Open your browser to: http://localhost:5000")
+    print(f"🤖 Google Gemini AI: {'Enabled ✅' if webapp.google_api_key else 'Disabled ❌'}")
+    print("="*50)
+
+    uvicorn.run(application, host='0.0.0.0', port=5000)
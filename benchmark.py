@@ -0,0 +1,469 @@
+"""Offline benchmark suite for Orion Voice Assistant
+
+Every benchmark runs without network access: Gemini, Wikipedia and gTTS
+are replaced by fakes with configurable latency (see FakeBackends), and
+the workloads are generated from a fixed seed, so two runs differ only by
+the speed of the code under test. Results are written as JSON so runs
+from different commits can be compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json
+    python benchmark.py compare before.json after.json
+
+``python benchmark.py --only tts_backends`` is the exception: it times the
+real speech engines to compare their latency and audio size.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import wikipedia
+
+# Seconds of simulated latency per fake backend call
+DEFAULT_LATENCY = {"gemini": 0.05, "wikipedia": 0.02, "gtts": 0.03}
+
+# Commands answered locally, one per intent
+LOCAL_COMMANDS = [
+    "what time is it",
+    "what's the date today",
+    "calculate 12 times 7",
+    "what is 15 percent of 80",
+    "open youtube",
+    "show songs",
+    "play believer",
+    "play tum hi ho",
+]
+
+GENERAL_COMMANDS = [
+    "who is ada lovelace",
+    "what is a black hole",
+    "tell me about the roman empire",
+    "who invented the telephone",
+]
+
+SONG_WORDS = [
+    "love", "night", "dance", "fire", "heart", "rain", "summer", "dream", "river", "light",
+    "shadow", "golden", "blue", "wild", "forever", "city", "moon", "storm", "home", "road",
+    "tum", "dil", "pyaar", "raat", "sapna", "mohabbat", "kanna", "nenapu", "male", "hrudaya",
+]
+
+
+def percentiles(samples):
+    """Summarize latencies in seconds as milliseconds (nearest-rank percentiles)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": round(rank(50), 4),
+        "p90_ms": round(rank(90), 4),
+        "p99_ms": round(rank(99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def timed(func, *args, **kwargs):
+    """Return (seconds, result) for one call"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+class FakeBackends:
+    """Context manager swapping Gemini, Wikipedia and gTTS for local fakes
+
+    Answers are derived from the query, so they are stable between runs.
+    ``failing`` names backends that raise instead of answering. The
+    response cache is cleared, and the TTS and song resolution caches are
+    moved to a temporary directory while the fakes are installed, so a run
+    leaves nothing behind; everything is restored on exit.
+    """
+
+    def __init__(self, latency=None, failing=()):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.failing = set(failing)
+        self.calls = {"gemini": 0, "wikipedia": 0, "gtts": 0}
+        self._saved = []
+        self._cache_dir = None
+
+    def _call(self, backend):
+        self.calls[backend] += 1
+        time.sleep(self.latency[backend])
+        if backend in self.failing:
+            raise ConnectionError(f"fake {backend} is down")
+
+    def gemini(self, query, conversation_history=None, timeout=None):
+        self._call("gemini")
+        return f"Gemini says: {query} is a well known topic."
+
+    def gemini_stream(self, query, conversation_history=None, timeout=None):
+        for word in self.gemini(query).split(" "):
+            yield word + " "
+
+    async def gemini_async(self, query, conversation_history=None, timeout=None):
+        return await asyncio.to_thread(self.gemini, query)
+
+    async def gemini_stream_async(self, query, conversation_history=None, timeout=None):
+        for chunk in await asyncio.to_thread(lambda: list(self.gemini_stream(query))):
+            yield chunk
+
+    def wikipedia(self, query, sentences=2):
+        self._call("wikipedia")
+        if "nonexistent" in query:
+            raise wikipedia.exceptions.PageError(query)
+        return f"Wikipedia says: {query} has a long history."
+
+    def gtts(self, text, lang):
+        self._call("gtts")
+        # Roughly the size of a real MP3 for the text
+        return (f"{lang}:{text}".encode("utf-8") * 40)[:max(1024, len(text) * 120)]
+
+    def _patch(self, module, name, value):
+        self._saved.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def __enter__(self):
+        import app
+        import config
+        import song_cache
+        import tts_backends
+        import tts_cache
+        from response_cache import response_cache
+
+        self._cache_dir = tempfile.TemporaryDirectory()
+        cache = tts_cache.TTSCache(cache_dir=self._cache_dir.name)
+        self._patch(app, "google_api_key", "offline-benchmark")
+        self._patch(app, "get_ai_response", self.gemini)
+        self._patch(app, "stream_ai_response", self.gemini_stream)
+        self._patch(app, "get_ai_response_async", self.gemini_async)
+        self._patch(app, "stream_ai_response_async", self.gemini_stream_async)
+        self._patch(app, "wikipedia_summary", self.wikipedia)
+        self._patch(tts_backends.get_backend("gtts"), "synthesize", self.gtts)
+        # Only the fake engine, so timings don't depend on which local engines are installed
+        self._patch(config, "TTS_BACKEND", "gtts")
+        self._patch(config, "TTS_FALLBACK_BACKENDS", [])
+        self._patch(tts_cache, "tts_cache", cache)
+        self._patch(app, "tts_cache", cache)
+        self._patch(song_cache, "_cache", song_cache.SongResolutionCache(
+            db_path=os.path.join(self._cache_dir.name, "songs.db")))
+        response_cache.clear()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import song_cache
+        from response_cache import response_cache
+
+        songs = song_cache._cache
+        for module, name, value in reversed(self._saved):
+            setattr(module, name, value)
+        self._saved = []
+        response_cache.clear()
+        songs.close()
+        self._cache_dir.cleanup()
+        return False
+
+
+def bench_routing(rounds=200):
+    """process_command throughput over locally answered commands"""
+    import app
+    from intents import classify
+
+    commands = LOCAL_COMMANDS * rounds
+    random.Random(0).shuffle(commands)
+
+    classify_seconds, _ = timed(lambda: [classify(command) for command in commands])
+    samples = []
+    # Nothing here reaches a backend; the fakes keep the song cache out of ./cache
+    with FakeBackends():
+        for command in commands:
+            seconds, _ = timed(app.assistant.process_command, command)
+            samples.append(seconds)
+    total = sum(samples)
+    return {
+        "commands": len(commands),
+        "classify_per_sec": round(len(commands) / classify_seconds, 1),
+        "commands_per_sec": round(len(commands) / total, 1),
+        "latency": percentiles(samples),
+    }
+
+
+def synthetic_library(size, seed=0):
+    """Return a {song_key: url} dict of ``size`` made-up songs"""
+    rng = random.Random(seed)
+    songs = {}
+    while len(songs) < size:
+        words = rng.sample(SONG_WORDS, rng.randint(1, 4))
+        key = "_".join(words) + (f"_{rng.randint(2, 99)}" if rng.random() < 0.3 else "")
+        songs[key] = f"https://www.youtube.com/watch?v={rng.getrandbits(48):012x}"
+    return songs
+
+
+def misspell(name, rng):
+    """Drop or swap one character to simulate a speech recognition slip"""
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    if rng.random() < 0.5:
+        return name[:i] + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def bench_song_lookup(sizes=(100, 1000, 10000, 50000, 100000), queries=300):
+    """SongIndex build time, lookup latency and accuracy as the library grows"""
+    from song_index import SongIndex
+
+    results = {}
+    for size in sizes:
+        songs = synthetic_library(size)
+        build_seconds, index = timed(SongIndex, songs)
+        rng = random.Random(size)
+        keys = rng.sample(sorted(songs), min(queries, size))
+        names = [key.replace("_", " ") for key in keys]
+        workloads = {
+            "exact": (names, keys),
+            "misspelled": ([misspell(name, rng) for name in names], keys),
+            "missing": ([f"unknown track {i}" for i in range(len(names))], [None] * len(names)),
+        }
+        entry = {"build_ms": round(build_seconds * 1000, 3)}
+        for kind, (workload, expected) in workloads.items():
+            samples, found = [], 0
+            for query, key in zip(workload, expected):
+                seconds, match = timed(index.best_match, query)
+                samples.append(seconds)
+                found += (match.key if match else None) == key
+            entry[kind] = dict(percentiles(samples), hit_rate=round(found / len(workload), 4))
+        results[str(size)] = entry
+    return results
+
+
+def bench_process_endpoint(requests_per_scenario=40, latency=None):
+    """End-to-end /api/process latency through the Flask test client
+
+    Scenarios: local intents, general questions on a cold and a warm
+    response cache, and general questions while Gemini is failing (the
+    Wikipedia fallback answers).
+    """
+    import app
+
+    results = {}
+    client = app.app.test_client()
+
+    def run(commands):
+        samples = []
+        for command in commands:
+            seconds, response = timed(client.post, "/api/process", json={"command": command})
+            assert response.status_code == 200, response.status_code
+            samples.append(seconds)
+        return percentiles(samples)
+
+    local = [LOCAL_COMMANDS[i % len(LOCAL_COMMANDS)] for i in range(requests_per_scenario)]
+    cold = [f"{GENERAL_COMMANDS[i % len(GENERAL_COMMANDS)]} {i}" for i in range(requests_per_scenario)]
+
+    with FakeBackends(latency) as fakes:
+        results["local"] = run(local)
+        results["general_cold"] = run(cold)
+        results["general_warm"] = run(cold)
+        results["backend_calls"] = dict(fakes.calls)
+    with FakeBackends(latency, failing=("gemini",)) as fakes:
+        results["gemini_down"] = run(cold)
+        results["gemini_down"]["backend_calls"] = dict(fakes.calls)
+    return results
+
+
+def bench_tts_cache(phrases=30, latency=None):
+    """Speech synthesis latency on a cache miss, a memory hit and a disk hit"""
+    import tts_cache
+
+    texts = [f"Here is answer number {i} to your question." for i in range(phrases)]
+    results = {}
+    with FakeBackends(latency) as fakes:
+        cache = tts_cache.tts_cache
+        results["miss"] = percentiles([timed(tts_cache.synthesize_speech, text)[0] for text in texts])
+        results["memory_hit"] = percentiles([timed(tts_cache.synthesize_speech, text)[0] for text in texts])
+        # A fresh instance over the same directory only has the disk tier
+        tts_cache.tts_cache = tts_cache.TTSCache(cache_dir=cache.cache_dir)
+        results["disk_hit"] = percentiles([timed(tts_cache.synthesize_speech, text)[0] for text in texts])
+        results["gtts_calls"] = fakes.calls["gtts"]
+    results["memory_hit_speedup"] = round(results["miss"]["mean_ms"] / results["memory_hit"]["mean_ms"], 1)
+    results["disk_hit_speedup"] = round(results["miss"]["mean_ms"] / results["disk_hit"]["mean_ms"], 1)
+    return results
+
+
+def bench_tts_backends(phrases=10, texts=None):
+    """Synthesis latency and audio size per installed TTS engine (live, not offline)
+
+    Unlike the other benchmarks this calls the real engines, so gTTS needs
+    the network. Unavailable engines are reported and skipped; failed
+    calls are counted rather than timed.
+    """
+    import tts_backends
+
+    texts = texts or [f"Here is answer number {i} to your question." for i in range(phrases)]
+    results = {}
+    for name in tts_backends.BACKENDS:
+        backend = tts_backends.get_backend(name)
+        if not backend.available():
+            results[name] = {"available": False}
+            continue
+        seconds, sizes, errors = [], [], 0
+        for text in texts:
+            try:
+                elapsed, audio = timed(backend.synthesize, text, "en")
+            except Exception:
+                errors += 1
+                continue
+            seconds.append(elapsed)
+            sizes.append(len(audio))
+        results[name] = {"available": True, "format": backend.format, "network": backend.network,
+                         "errors": errors}
+        if seconds:
+            results[name]["latency"] = percentiles(seconds)
+            results[name]["mean_bytes"] = round(sum(sizes) / len(sizes))
+    return results
+
+
+BENCHMARKS = {
+    "routing": bench_routing,
+    "song_lookup": bench_song_lookup,
+    "process_endpoint": bench_process_endpoint,
+    "tts_cache": bench_tts_cache,
+}
+
+# Benchmarks against real services; only run when named with --only
+LIVE_BENCHMARKS = {
+    "tts_backends": bench_tts_backends,
+}
+
+# Smaller workloads for --quick smoke runs
+QUICK_SETTINGS = {
+    "routing": {"rounds": 20},
+    "song_lookup": {"sizes": (100, 1000), "queries": 50},
+    "process_endpoint": {"requests_per_scenario": 8},
+    "tts_cache": {"phrases": 5},
+    "tts_backends": {"phrases": 3},
+}
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, quick=False):
+    """Run the selected benchmarks and return the results document"""
+    # Request-level prints from app.py would dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = {}
+        for name in names or BENCHMARKS:
+            benchmark = BENCHMARKS.get(name) or LIVE_BENCHMARKS[name]
+            results[name] = benchmark(**(QUICK_SETTINGS[name] if quick else {}))
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": DEFAULT_LATENCY,
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    """Flatten nested results into {"a.b.c": number}"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old, new, threshold=0.1):
+    """Return (path, old, new, change, regressed) rows for metrics in both runs
+
+    Latencies (``*_ms``) regress when they grow by more than ``threshold``;
+    rates (``*_per_sec``, ``*_speedup``, ``*_hit_rate``) when they shrink by more than it.
+    """
+    before, after = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        old_value, new_value = before[path], after[path]
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        if path.endswith("_ms"):
+            regressed = change > threshold
+        elif path.endswith(("_per_sec", "_speedup", "hit_rate")):
+            regressed = change < -threshold
+        else:
+            regressed = False
+        rows.append((path, old_value, new_value, change, regressed))
+    return rows
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Orion")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="run benchmarks (the default)")
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative change counted as a regression (default 0.1)")
+    for target in (parser, run_parser):
+        target.add_argument("--output", help="JSON results file (default logs/benchmarks/<commit>.json)")
+        target.add_argument("--only", action="append", choices=sorted({**BENCHMARKS, **LIVE_BENCHMARKS}),
+                            help="benchmark to run (live ones such as tts_backends only when named)")
+        target.add_argument("--quick", action="store_true", help="smaller workloads for a smoke test")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold)
+        print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+        for path, old_value, new_value, change, regressed in rows:
+            flag = "  ❌ regression" if regressed else ""
+            print(f"{path:55} {old_value:>12g} {new_value:>12g} {change:+8.1%}{flag}")
+        regressions = sum(1 for row in rows if row[4])
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    document = run_benchmarks(args.only, args.quick)
+    output = args.output or os.path.join("logs", "benchmarks", f"{document['commit'] or 'results'}.json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(json.dumps(document["results"], indent=2))
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
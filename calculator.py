@@ -0,0 +1,200 @@
+"""Arithmetic expression engine for Orion Voice Assistant
+
+Spoken arithmetic ("what is 12 times 7", "15 percent of 80", "square
+root of 144") is rewritten into a plain expression, parsed with `ast`
+and evaluated by walking the tree. Only numbers, + - * / // % **, unary
+signs and ``sqrt()`` are accepted, and every step is bounded (input
+length, node count, exponent size and intermediate magnitude), so a
+request like "9 ** 9 ** 9" fails fast instead of pinning a thread.
+"""
+import ast
+import math
+import operator
+import re
+
+import config
+
+
+class CalculationError(ValueError):
+    """Raised with a user-facing message when an expression can't be evaluated"""
+
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+_TENS_WORDS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+
+# Ordered spoken-form rewrites; longer phrases come before their prefixes
+_SPOKEN_FORMS = [
+    (r"\b(?:the )?square root of\s+(\(?[\d.]+\)?)", r"sqrt(\1)"),
+    (r"([\d.]+)\s*(?:percent|%)\s+of\s+", r"\1/100*"),
+    # "%" followed by an operand is modulo ("10 % 3"), otherwise a percentage
+    (r"([\d.]+)\s*(?:percent\b|%(?!\s*[\d.(]))", r"(\1/100)"),
+    (r"\bsquared\b", "**2"),
+    (r"\bcubed\b", "**3"),
+    (r"\bto the power of\b|\braised to(?: the power of)?\b|\^", "**"),
+    (r"\bmultiplied by\b|\btimes\b|\bx\b|(?<=\d)\s*x\s*(?=\d)", "*"),
+    (r"\bdivided by\b|\bover\b", "/"),
+    (r"\bmod(?:ulo)?\b", "%"),
+    (r"\bplus\b|\band\b", "+"),
+    (r"\bminus\b|\bless\b", "-"),
+    (r"\bnegative\s+", "-"),
+]
+
+
+def _replace_number_words(text):
+    """Turn number words ("twenty five") into digits"""
+    def tens(match):
+        value = _TENS_WORDS[match.group(1)]
+        if match.group(2):
+            value += _NUMBER_WORDS[match.group(2)]
+        return str(value)
+
+    units = "|".join(name for name in _NUMBER_WORDS if 0 < _NUMBER_WORDS[name] < 10)
+    text = re.sub(rf"\b({'|'.join(_TENS_WORDS)})(?:[\s-]+({units}))?\b", tens, text)
+    return re.sub(rf"\b({'|'.join(_NUMBER_WORDS)})\b", lambda m: str(_NUMBER_WORDS[m.group(1)]), text)
+
+
+def parse_spoken(expression):
+    """Rewrite a spoken arithmetic question into a plain expression string"""
+    text = expression.lower().strip().rstrip("?.!")
+    text = re.sub(r"^(?:calculate|compute|evaluate|what is|what's|whats|how much is)\s+", "", text)
+    text = text.replace(",", "")
+    text = _replace_number_words(text)
+    for pattern, replacement in _SPOKEN_FORMS:
+        text = re.sub(pattern, replacement, text)
+    return text.strip()
+
+
+# Node types a calculation may contain; names are only allowed as sqrt()
+_ALLOWED_NODES = (ast.Expression, ast.Constant, ast.UnaryOp, ast.BinOp, ast.Call, ast.Name,
+                  ast.operator, ast.unaryop, ast.expr_context)
+
+
+def is_calculation(expression):
+    """True when a spoken expression rewrites into arithmetic the evaluator accepts
+
+    The intent router uses this so questions that only look like sums
+    ("what is covid-19", "what is ps5 power consumption") go to the
+    general answerer instead of failing here.
+    """
+    text = parse_spoken(expression)
+    if not text or len(text) > config.CALC_MAX_LENGTH:
+        return False
+    try:
+        tree = ast.parse(text, mode="eval")
+    except (SyntaxError, ValueError, RecursionError):
+        return False
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            return False
+        if isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+            return False
+        if isinstance(node, ast.Name) and node.id != "sqrt":
+            return False
+    return isinstance(tree.body, (ast.BinOp, ast.UnaryOp, ast.Call))
+
+
+class _Evaluator:
+    """Walks a parsed expression while enforcing the configured limits"""
+
+    def __init__(self):
+        self.max_nodes = config.CALC_MAX_NODES
+        self.max_exponent = config.CALC_MAX_EXPONENT
+        self.max_magnitude = config.CALC_MAX_MAGNITUDE
+        self.nodes = 0
+
+    def _check(self, value):
+        if isinstance(value, complex) or (isinstance(value, float) and not math.isfinite(value)):
+            raise CalculationError("Sorry, that result isn't a real number I can say.")
+        if abs(value) > self.max_magnitude:
+            raise CalculationError("Sorry, that number is too large for me to calculate.")
+        return value
+
+    def visit(self, node):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise CalculationError("Sorry, that expression is too long for me to calculate.")
+
+        if isinstance(node, ast.Expression):
+            return self.visit(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return self._check(node.value)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+            return _UNARY_OPERATORS[type(node.op)](self.visit(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            left = self.visit(node.left)
+            right = self.visit(node.right)
+            if isinstance(node.op, ast.Pow):
+                self._check_power(left, right)
+            try:
+                return self._check(_BINARY_OPERATORS[type(node.op)](left, right))
+            except ZeroDivisionError:
+                raise CalculationError("Cannot divide by zero.")
+            except OverflowError:
+                raise CalculationError("Sorry, that number is too large for me to calculate.")
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id == "sqrt" and len(node.args) == 1 and not node.keywords):
+            value = self.visit(node.args[0])
+            if value < 0:
+                raise CalculationError("Sorry, I can't take the square root of a negative number.")
+            return math.sqrt(value)
+        raise CalculationError("Sorry, I can only calculate mathematical expressions.")
+
+    def _check_power(self, base, exponent):
+        """Reject powers whose result would be huge before computing them"""
+        if abs(exponent) > self.max_exponent:
+            raise CalculationError("Sorry, that exponent is too large for me to calculate.")
+        if abs(base) > 1 and exponent > 0:
+            estimated_digits = exponent * math.log10(abs(base))
+            if estimated_digits > math.log10(self.max_magnitude):
+                raise CalculationError("Sorry, that number is too large for me to calculate.")
+
+
+def evaluate(expression):
+    """Evaluate a plain arithmetic expression string with bounded cost"""
+    if len(expression) > config.CALC_MAX_LENGTH:
+        raise CalculationError("Sorry, that expression is too long for me to calculate.")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except (SyntaxError, ValueError, RecursionError):
+        raise CalculationError("Sorry, I couldn't understand that calculation.")
+    return _Evaluator().visit(tree)
+
+
+def format_number(value):
+    """Format a result the way it should be spoken"""
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return f"{value:.10g}"
+    return str(value)
+
+
+def calculate(expression):
+    """Evaluate a spoken arithmetic question and return the result as text
+
+    Raises CalculationError with a user-facing message on failure.
+    """
+    return format_number(evaluate(parse_spoken(expression)))
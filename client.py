@@ -1,29 +1,243 @@
-"""Gemini (Google Generative AI) client placeholder for Orion.
+"""Gemini (Google Generative AI) client for Orion.
 
-This module provides a simple wrapper `get_ai_response` that will
-use the configured `GOOGLE_API_KEY`. Full Gemini integration can be
-implemented here (for example using `google-generativeai`), but for
-now this placeholder checks for the API key and returns `None` when
-no key is present so the code falls back to other behaviors.
+This module owns the single Gemini client shared by the console
+(`main.py`) and web (`app.py`) front-ends. The API key is configured once
+and each `GenerativeModel` is built lazily on first use and then reused,
+so the underlying gRPC channel stays warm between requests. Every call
+carries a timeout and an output-token limit sized for spoken answers.
+Functions return `None` when no `GOOGLE_API_KEY` is set or the request
+fails, so callers can fall back to other behaviors.
 """
+import threading
+
+import google.generativeai as genai
+from google.generativeai import protos
+from google.api_core import retry as api_retry
+from google.api_core import retry_async as api_retry_async
+
 import config
+from metrics import backend_call
+
+# Steers general answers towards something short enough to read aloud
+SPOKEN_ANSWER_INSTRUCTION = (
+    "You are a voice assistant. Answer in two or three short, plain sentences "
+    "that sound natural when read aloud. Do not use markdown, lists or code."
+)
+
+MAX_TOKENS = protos.Candidate.FinishReason.MAX_TOKENS
+
+
+def _stopped_at_token_limit(response):
+    """True when generation ended because max_output_tokens ran out"""
+    return any(candidate.finish_reason == MAX_TOKENS for candidate in response.candidates)
+
+
+def _response_text(response):
+    """Return a response's text, handling answers cut off by max_output_tokens
+
+    gemini-2.5 models spend part of the budget on thinking, and when that
+    uses it all up there is no text part at all (``response.text`` raises).
+    A cut-off answer that did produce text is returned as it is.
+    """
+    if not _stopped_at_token_limit(response):
+        return response.text
+    parts = [part.text for candidate in response.candidates for part in candidate.content.parts if part.text]
+    if not parts:
+        raise ValueError("max_output_tokens used up before any answer text (thinking counts towards it)")
+    print("Gemini API: answer cut off at max_output_tokens")
+    return ''.join(parts)
+
+
+class GeminiClient:
+    """Thread-safe wrapper around lazily constructed, reused Gemini models"""
+
+    def __init__(self, api_key=None, model_name=None, timeout=None, max_output_tokens=None):
+        self.api_key = api_key if api_key is not None else config.GOOGLE_API_KEY
+        self.model_name = model_name or config.GEMINI_MODEL
+        self.timeout = timeout or config.GEMINI_TIMEOUT
+        self.max_output_tokens = max_output_tokens or config.GEMINI_MAX_OUTPUT_TOKENS
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    @property
+    def enabled(self):
+        """True when an API key is available"""
+        return bool(self.api_key)
+
+    def _get_model(self, system_instruction=None):
+        """Return the shared model for a system instruction, creating it once"""
+        model = self._models.get(system_instruction)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if not self._configured:
+                genai.configure(api_key=self.api_key)
+                self._configured = True
+            model = self._models.get(system_instruction)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+                self._models[system_instruction] = model
+        return model
+
+    def _call_options(self, max_output_tokens, timeout, retry_class=api_retry.Retry):
+        timeout = timeout or self.timeout
+        request_options = {'timeout': timeout}
+        if retry_class is not None:
+            # The SDK's default retry policy keeps retrying transient errors for
+            # minutes, so bound the whole call (retries included) by the timeout.
+            request_options['retry'] = retry_class(initial=0.25, maximum=1.0, multiplier=2.0, timeout=timeout)
+        return {
+            'generation_config': {'max_output_tokens': max_output_tokens or self.max_output_tokens},
+            'request_options': request_options,
+        }
+
+    def generate(self, contents, system_instruction=None, max_output_tokens=None, timeout=None):
+        """Return generated text, or None if disabled or the request fails"""
+        if not self.enabled:
+            return None
+
+        with backend_call('gemini') as call:
+            try:
+                model = self._get_model(system_instruction)
+                response = model.generate_content(contents, **self._call_options(max_output_tokens, timeout))
+                return _response_text(response)
+            except Exception as e:
+                call.failed()
+                print(f"Gemini API Error: {type(e).__name__}: {str(e)}")
+                return None
 
-def get_ai_response(user_query, conversation_history=None):
-    """Return an AI response using Google Gemini if configured.
+    def stream(self, contents, system_instruction=None, max_output_tokens=None, timeout=None):
+        """Yield partial text as it is generated; yields nothing on failure"""
+        if not self.enabled:
+            return
 
-    Currently a placeholder: returns None if no `GOOGLE_API_KEY` is set.
-    Implement actual Gemini calls here when ready.
+        with backend_call('gemini') as call:
+            try:
+                model = self._get_model(system_instruction)
+                response = model.generate_content(
+                    contents, stream=True, **self._call_options(max_output_tokens, timeout)
+                )
+                for chunk in response:
+                    if _stopped_at_token_limit(chunk):
+                        print("Gemini API: streamed answer cut off at max_output_tokens")
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # chunk carried no text parts (e.g. safety metadata)
+                    if text:
+                        yield text
+            except Exception as e:
+                call.failed()
+                print(f"Gemini API Stream Error: {type(e).__name__}: {str(e)}")
+
+    async def generate_async(self, contents, system_instruction=None, max_output_tokens=None, timeout=None):
+        """Awaitable counterpart of ``generate`` for the ASGI server"""
+        if not self.enabled:
+            return None
+
+        with backend_call('gemini') as call:
+            try:
+                model = self._get_model(system_instruction)
+                response = await model.generate_content_async(
+                    contents, **self._call_options(max_output_tokens, timeout, api_retry_async.AsyncRetry)
+                )
+                return _response_text(response)
+            except Exception as e:
+                call.failed()
+                print(f"Gemini API Error: {type(e).__name__}: {str(e)}")
+                return None
+
+    async def stream_async(self, contents, system_instruction=None, max_output_tokens=None, timeout=None):
+        """Async generator counterpart of ``stream`` for the ASGI server"""
+        if not self.enabled:
+            return
+
+        with backend_call('gemini') as call:
+            try:
+                model = self._get_model(system_instruction)
+                # A half-delivered stream can't be retried, so no retry policy here
+                response = await model.generate_content_async(
+                    contents, stream=True, **self._call_options(max_output_tokens, timeout, retry_class=None)
+                )
+                async for chunk in response:
+                    if _stopped_at_token_limit(chunk):
+                        print("Gemini API: streamed answer cut off at max_output_tokens")
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue
+                    if text:
+                        yield text
+            except Exception as e:
+                call.failed()
+                print(f"Gemini API Stream Error: {type(e).__name__}: {str(e)}")
+
+
+def _build_contents(user_query, conversation_history=None):
+    """Convert history entries ({'command', 'response'}) into Gemini chat turns"""
+    if not conversation_history:
+        return user_query
+
+    contents = []
+    for entry in conversation_history:
+        contents.append({'role': 'user', 'parts': [entry['command']]})
+        contents.append({'role': 'model', 'parts': [entry['response']]})
+    contents.append({'role': 'user', 'parts': [user_query]})
+    return contents
+
+
+# Shared client used by main.py and app.py
+gemini = GeminiClient()
+
+
+def get_ai_response(user_query, conversation_history=None, timeout=None):
+    """Return a spoken-style AI answer using Google Gemini if configured.
+
+    Returns None if no `GOOGLE_API_KEY` is set or the request fails.
     """
-    if not config.GOOGLE_API_KEY:
-        return None
+    return gemini.generate(
+        _build_contents(user_query, conversation_history),
+        system_instruction=SPOKEN_ANSWER_INSTRUCTION,
+        timeout=timeout,
+    )
+
+
+def stream_ai_response(user_query, conversation_history=None, timeout=None):
+    """Yield a spoken-style AI answer from Google Gemini as it is generated"""
+    return gemini.stream(
+        _build_contents(user_query, conversation_history),
+        system_instruction=SPOKEN_ANSWER_INSTRUCTION,
+        timeout=timeout,
+    )
+
+
+async def get_ai_response_async(user_query, conversation_history=None, timeout=None):
+    """Awaitable version of `get_ai_response`"""
+    return await gemini.generate_async(
+        _build_contents(user_query, conversation_history),
+        system_instruction=SPOKEN_ANSWER_INSTRUCTION,
+        timeout=timeout,
+    )
+
+
+def stream_ai_response_async(user_query, conversation_history=None, timeout=None):
+    """Async generator version of `stream_ai_response`"""
+    return gemini.stream_async(
+        _build_contents(user_query, conversation_history),
+        system_instruction=SPOKEN_ANSWER_INSTRUCTION,
+        timeout=timeout,
+    )
+
 
-    # TODO: Implement real Gemini client using `google-generativeai`.
-    # For now, return None so the assistant falls back to Wikipedia.
-    return None
+def generate_text(prompt, max_output_tokens=None, timeout=None):
+    """Run a raw prompt (no spoken-answer instruction) through the shared client"""
+    return gemini.generate(prompt, max_output_tokens=max_output_tokens, timeout=timeout)
 
 
 if __name__ == "__main__":
-    if config.USE_GEMINI:
+    if gemini.enabled:
         print("Gemini is configured. Use `get_ai_response()` to query the model.")
     else:
-        print("Gemini API key not configured. Add your API key to .env file.")
\ No newline at end of file
+        print("Gemini API key not configured. Add your API key to .env file.")
@@ -5,28 +5,130 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Gemini / Google API Configuration
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-# Optional: model name for Gemini integration if used by `client.py`
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini")
-
 # Using Google Gemini (Generative AI)
 # Google / Gemini API key
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
-# Optional: model name for Gemini integration if used by `client.py`
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini")
+# Model name used by the shared client in `client.py`
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_TIMEOUT = 10  # seconds per request
+# Caps include gemini-2.5's thinking tokens, and google.generativeai can't set a
+# thinking budget, so leave room for thinking on top of the answer itself
+GEMINI_MAX_OUTPUT_TOKENS = 2048  # spoken answers (the prompt keeps them short)
+GEMINI_SONG_MAX_OUTPUT_TOKENS = 1024  # song lookups only need a URL back
+
+# General question answering (see answer_race.py)
+# "sequential": Wikipedia only after Gemini fails; "parallel": both at once;
+# "hedged": Wikipedia starts after ANSWER_HEDGE_DELAY or when Gemini fails
+ANSWER_STRATEGY = os.getenv("ANSWER_STRATEGY", "hedged")
+ANSWER_DEADLINE = 8.0  # seconds to wait for any answer
+ANSWER_HEDGE_DELAY = 1.5  # seconds before the Wikipedia hedge starts
+ANSWER_RACE_WORKERS = 32
+
+# Response Cache Settings (Gemini and Wikipedia answers)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_TTLS = {  # seconds, per backend
+    "gemini": 60 * 60,
+    "wikipedia": 24 * 60 * 60,
+}
+# Optional SQLite file (e.g. "cache/responses.db") to keep answers across restarts
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")
+
+# Offline Wikipedia store (see knowledge_store.py); used only if the file exists
+KNOWLEDGE_DB = os.getenv("KNOWLEDGE_DB", os.path.join("cache", "knowledge.db"))
+
+# Song resolution cache (Gemini YouTube lookups for songs outside the library)
+SONG_CACHE_DB = os.path.join("cache", "songs.db")
+SONG_CACHE_SEARCH_TTL = 24 * 60 * 60  # seconds before a search-page fallback is retried
+SONG_PROMOTE_AFTER_HITS = 2  # cache hits before a direct video joins the library
+SONG_PROMOTE_MIN_CONFIDENCE = 0.8
+
+# Calculator limits (see calculator.py)
+CALC_MAX_LENGTH = 200  # characters in the rewritten expression
+CALC_MAX_NODES = 100  # syntax tree nodes
+CALC_MAX_EXPONENT = 1000
+CALC_MAX_MAGNITUDE = 1e100  # largest intermediate or final result
+
+# /api/songs responses (see app.py)
+SONGS_CACHE_MAX_AGE = 60  # seconds browsers may reuse the catalog before revalidating
+SONG_SEARCH_MAX_LIMIT = 50
+
+# /api/process/batch
+BATCH_MAX_COMMANDS = 500  # per request
+BATCH_WORKERS = 8  # commands processed concurrently across all batches
+
+# Request tracing (see tracing.py)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))  # share of requests traced
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")  # e.g. "logs/traces.jsonl" for JSON trace lines
+
+# Async serving mode (asgi.py)
+ASYNC_BLOCKING_WORKERS = 256  # threads for blocking Wikipedia/gTTS calls
+
+# Web sessions (per-browser history, see sessions.py)
+SESSION_COOKIE_NAME = "orion_session"
+SESSION_HISTORY_SIZE = 50  # entries kept per session
+SESSION_MAX_SESSIONS = 1000  # least recently used sessions are dropped past this
+SESSION_IDLE_TIMEOUT = 60 * 60  # seconds before an idle session is evicted
+
+# Shared state backend (see state_store.py): "memory" for a single worker,
+# "sqlite" or "kv" when the web app runs under several worker processes
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", os.path.join("cache", "state.db"))
+STATE_KV_URL = os.getenv("STATE_KV_URL", "kv://127.0.0.1:6390")  # or redis://host:6379/0
+# Shared secret for kv:// and serve-kv; there is no default, since the server unpickles
+# whatever authenticated clients send
+STATE_KV_AUTHKEY = os.getenv("STATE_KV_AUTHKEY", "")
 
 # Speech Recognition Settings
 PHRASE_TIME_LIMIT = 5  # seconds
-AMBIENT_NOISE_DURATION = 1  # seconds
-WAKE_WORD_TIME_LIMIT = 3  # seconds
+AMBIENT_NOISE_DURATION = 1  # seconds, measured once when the microphone opens
+COMMAND_WAIT_TIMEOUT = 8  # seconds to wait for a command after a bare wake word
+LISTEN_POLL_TIMEOUT = 1  # seconds; how often the capture threads check for shutdown
+LISTEN_QUEUE_SIZE = 4  # phrases awaiting recognition before the oldest is dropped
+
+# Barge-in: talking over Orion cuts its speech (see listener.py)
+BARGE_IN_ENABLED = True
+BARGE_IN_RATIO = 2.0  # speech must be this many times louder than Orion's echo
+BARGE_IN_MIN_SECONDS = 0.2  # of sustained loud audio before playback is cut
+BARGE_IN_WARMUP = 0.3  # seconds at the start of each utterance spent learning the echo level
+
+# Local pre-filter for wake-word phrases (see wake_filter.py)
+WAKE_FILTER_ENABLED = True
+WAKE_TEMPLATES = os.path.join("cache", "wake_templates.npz")  # from `python wake_filter.py enroll`
+WAKE_MATCH_THRESHOLD = 6.0  # DTW distance; lower rejects more (tune with `wake_filter.py evaluate`)
+VAD_FRAME_MS = 25
+VAD_HOP_MS = 10
+VAD_ENERGY_MARGIN_DB = 12  # voiced frames are this far above the clip's noise floor
+VAD_MIN_ENERGY_DB = -50  # dBFS
+VAD_MAX_ZCR = 0.25  # zero crossings per sample; hiss and fricatives sit above this
+VAD_BRIDGE_FRAMES = 8  # gaps up to this many frames inside speech count as voiced
+VAD_MIN_SPEECH = 0.25  # seconds of voiced audio needed to consider a phrase
 
 # Text-to-Speech Settings
 TTS_LANGUAGE = "en"  # Language for text-to-speech
 
+# TTS engines (see tts_backends.py): "gtts" (network), "espeak" or "pyttsx3" (offline)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+TTS_FALLBACK_BACKENDS = ["espeak", "pyttsx3"]  # tried in order when the preferred engine fails
+TTS_BACKEND_TIMEOUT = 3.0  # seconds before a slow network engine hands over to a fallback
+TTS_BACKEND_RETRY_AFTER = 60  # seconds a failed network engine is skipped
+TTS_BACKEND_WORKERS = 8  # threads for network synthesis calls
+TTS_ESPEAK_VOICE = os.getenv("TTS_ESPEAK_VOICE", "")  # defaults to TTS_LANGUAGE
+TTS_LOCAL_RATE = 170  # words per minute for offline engines
+TTS_LOCAL_TIMEOUT = 15  # seconds
+
+# TTS Cache Settings
+TTS_CACHE_ENABLED = True
+TTS_CACHE_DIR = os.path.join("cache", "tts")
+TTS_CACHE_MEMORY_BYTES = 16 * 1024 * 1024  # in-memory LRU tier budget
+TTS_CACHE_DISK_BYTES = 256 * 1024 * 1024  # on-disk tier budget
+
+# Streaming TTS Settings (/api/tts with "stream": true)
+TTS_STREAM_WORKERS = 3  # sentences synthesized in parallel
+TTS_STREAM_MIN_CHUNK = 20  # characters; shorter fragments are merged
+
 # Assistant Settings
 ASSISTANT_NAME = "Orion"
-TEMP_AUDIO_FILE = "temp.mp3"
 
 # Logging Settings
 LOG_FILE = "logs/orion.log"
@@ -0,0 +1,213 @@
+"""Intent router shared by the console and web front-ends
+
+Intents are declared once as regular expressions with a priority, and
+each may name a few trigger keywords. A command only runs the patterns
+of intents whose keywords it contains, in priority order, so the usual
+general question is dismissed with a handful of substring checks rather
+than a regex scan per pattern. Anything that matches no intent is a
+``general`` question.
+
+New intents can be added with ``router.register(...)`` without touching
+the front-ends' handler chains; they only need a handler for the name.
+An intent may also pass ``accept``, a check on its slots: when it says
+no, the command falls through to the next matching intent (or general).
+
+Run ``python intents.py`` to compare the router with the old if/elif
+chain of substring checks. The chain remains faster: most commands cost
+the router a few microseconds more, and calculations pay for a parse by
+the calculator. In exchange the router does not misclassify commands
+such as "calculate 12 times 7" or "what time does the store open".
+"""
+import re
+from collections import namedtuple
+
+from calculator import is_calculation
+
+IntentMatch = namedtuple("IntentMatch", ["name", "slots"])
+
+GENERAL = "general"
+
+# Websites that can be opened by name: name -> (display name, url)
+WEBSITES = {
+    "google": ("Google", "https://google.com"),
+    "youtube": ("YouTube", "https://youtube.com"),
+    "facebook": ("Facebook", "https://facebook.com"),
+    "linkedin": ("LinkedIn", "https://linkedin.com"),
+}
+
+
+class IntentRouter:
+    """Registry of intent patterns, tried in priority order behind keyword checks"""
+
+    def __init__(self):
+        self._intents = []
+        self._compiled = None
+
+    def register(self, name, *patterns, priority=0, accept=None, keywords=()):
+        """Register patterns for an intent; higher priority wins when several match
+
+        ``accept(slots)``, if given, must return True for a match to count.
+        ``keywords``, if given, are substrings every match contains; the
+        patterns are skipped for commands containing none of them.
+        """
+        for pattern in patterns:
+            re.compile(pattern)  # fail fast on a bad pattern
+            self._intents.append((priority, len(self._intents), name, pattern, accept, tuple(keywords)))
+        self._compiled = None
+
+    @property
+    def intent_names(self):
+        return sorted({intent[2] for intent in self._intents})
+
+    def compile(self):
+        """Build the priority-ordered list of (name, keywords, accept, patterns)"""
+        self._compiled = []
+        ordered = sorted(self._intents, key=lambda intent: (-intent[0], intent[1]))
+        for _, _, name, pattern, accept, keywords in ordered:
+            regex = re.compile(pattern, re.DOTALL)
+            previous = self._compiled[-1] if self._compiled else None
+            # Consecutive patterns of one intent share a single keyword check
+            if previous and previous[:3] == (name, keywords, accept):
+                previous[3].append(regex)
+            else:
+                self._compiled.append((name, keywords, accept, [regex]))
+        return self._compiled
+
+    def classify(self, command):
+        """Return the IntentMatch for a command"""
+        compiled = self._compiled if self._compiled is not None else self.compile()
+        text = " ".join(command.lower().split())
+        for name, keywords, accept, patterns in compiled:
+            if keywords:
+                for keyword in keywords:
+                    if keyword in text:
+                        break
+                else:
+                    continue
+            for regex in patterns:
+                found = regex.search(text)
+                if found is None:
+                    continue
+                values = {slot: value.strip() if value else "" for slot, value in found.groupdict().items()}
+                if accept is None or accept(values):
+                    return IntentMatch(name, values)
+        return IntentMatch(GENERAL, {})
+
+
+def _default_router():
+    router = IntentRouter()
+    # Exit only on a bare command, so "bye bye love song" is still a question
+    router.register(
+        "exit",
+        r"^(?:(?:please|ok|okay|hey|orion),? )*(?:exit|quit|bye(?: bye)?|good ?bye)(?:,? orion)?[.!]*$",
+        priority=100,
+        keywords=("exit", "quit", "bye"),
+    )
+    router.register("show_songs", r"\b(?:show|list)(?: me)?(?: all| the| available| my)* songs\b", priority=90,
+                    keywords=("songs",))
+    router.register(
+        "time",
+        r"^(?:what(?:'s|s| is) the )?(?:current )?time(?: is it)?(?: now)?\??$",
+        r"\bwhat time is it\b",
+        r"\bwhat(?:'s|s| is) the (?:current )?time\b",
+        r"\b(?:tell me|say) the time\b",
+        priority=80,
+        keywords=("time",),
+    )
+    router.register(
+        "date",
+        r"^(?:what(?:'s|s| is) )?(?:the |today'?s )?date(?: today)?\??$",
+        # ...but "what is the date of the moon landing" is a question
+        r"\bwhat(?:'s|s| is) (?:the |today'?s )?date\b(?! (?:of|for|on|when|that)\b)",
+        r"\bwhat day is (?:it|today)\b",
+        r"^(?:what(?:'s|s| is) )?today\??$",
+        priority=80,
+        keywords=("date", "day"),
+    )
+    # Only commands the calculator can parse; "what is covid-19" stays a question
+    router.register(
+        "calculate",
+        r"^(?:calculate|compute|evaluate)\s+(?P<expression>.+)$",
+        r"^(?:what(?:'s| is)|whats|how much is)\s+(?P<expression>"
+        r"(?=.*(?:plus|minus|times|divided|multiplied|over|squared|cubed|percent|"
+        r"square root|power|mod|\bx\b|[-+*/^%])).+)$",
+        priority=70,
+        accept=lambda slots: is_calculation(slots["expression"]),
+        keywords=("calculate", "compute", "evaluate", "what", "how much"),
+    )
+    router.register(
+        "open_site",
+        r"\bopen\s+(?P<site>" + "|".join(WEBSITES) + r")\b",
+        r"\bopen\s+(?P<site>[\w-]+(?:\.[\w-]+)*\.(?:com|org|net|io|in|dev|co))\b",
+        priority=60,
+        keywords=("open",),
+    )
+    router.register("play", r"^play\b\s*(?P<song>.*)$", priority=50, keywords=("play",))
+    return router
+
+
+# Shared router used by main.py and app.py
+router = _default_router()
+
+
+def classify(command):
+    """Classify a command with the shared router"""
+    return router.classify(command)
+
+
+def website_for(site):
+    """Return (display name, url) for an open_site slot value"""
+    if site in WEBSITES:
+        return WEBSITES[site]
+    return site, site if site.startswith("http") else f"https://{site}"
+
+
+def _legacy_classify(command):
+    """The substring if/elif chain the router replaced, kept for benchmarking"""
+    command = command.lower()
+    if "exit" in command or "quit" in command or "bye" in command:
+        return "exit"
+    elif "show songs" in command or "list songs" in command:
+        return "show_songs"
+    elif "time" in command:
+        return "time"
+    elif "date" in command or "today" in command:
+        return "date"
+    elif "calculate" in command or ("what" in command and any(op in command for op in ["plus", "minus", "times", "divided", "+", "-", "*", "/"])):
+        return "calculate"
+    elif any(f"open {site}" in command for site in WEBSITES) or ("open" in command and ".com" in command):
+        return "open_site"
+    elif command.startswith("play"):
+        return "play"
+    return GENERAL
+
+
+def benchmark(iterations=20000):
+    """Compare router throughput with the legacy chain and return the results"""
+    import timeit
+
+    commands = [
+        "what time is it", "what is the date today", "calculate 12 times 7",
+        "open youtube", "open github.com", "play blinding lights", "show songs",
+        "what time does the store open", "who wrote pride and prejudice",
+        "tell me about the history of the roman empire in detail", "exit",
+    ]
+    rounds = max(1, iterations // len(commands))
+    total = rounds * len(commands)
+    results = {}
+    for label, function in (("router", classify), ("legacy_chain", _legacy_classify)):
+        seconds = timeit.timeit(lambda: [function(c) for c in commands], number=rounds)
+        results[label] = {
+            "commands_per_second": round(total / seconds),
+            "microseconds_per_command": round(seconds / total * 1e6, 2),
+        }
+    results["disagreements"] = {
+        c: {"router": classify(c).name, "legacy_chain": _legacy_classify(c)}
+        for c in commands if classify(c).name != _legacy_classify(c)
+    }
+    return results
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(benchmark(), indent=2))
@@ -0,0 +1,205 @@
+"""Offline Wikipedia summary store for Orion Voice Assistant
+
+A SQLite FTS5 database of article titles and lead summaries that can be
+bulk-loaded from a dump file and answers Wikipedia-style questions in
+milliseconds without touching the network. When the store is missing or
+has no match, lookups fall back to the live Wikipedia API.
+
+Dump files are JSON lines (``{"title": ..., "summary": ...}``; ``extract``
+or ``text`` are accepted for the summary) or tab-separated
+``title<TAB>summary`` lines, optionally gzip-compressed.
+
+Usage:
+    python knowledge_store.py load enwiki-leads.jsonl.gz
+    python knowledge_store.py query "what is python"
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import wikipedia
+
+import config
+from metrics import backend_call
+
+# Question words that say nothing about which article is wanted
+QUERY_STOP_WORDS = {
+    "what", "whats", "who", "whos", "where", "when", "which", "is", "are", "was", "were",
+    "tell", "me", "about", "define", "explain", "search", "for", "wikipedia",
+    "a", "an", "the", "please", "do", "you", "know",
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _query_terms(query):
+    """Return the meaningful, FTS-safe words of a query"""
+    words = re.findall(r"\w+", query.lower())
+    return [word for word in words if word not in QUERY_STOP_WORDS] or words
+
+
+def _first_sentences(text, sentences):
+    return " ".join(_SENTENCE_END.split(text.strip())[:sentences])
+
+
+def _open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _parse_dump_line(line):
+    """Return (title, summary) for a dump line, or None if it is unusable"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        record = json.loads(line)
+        title = record.get("title")
+        summary = record.get("summary") or record.get("extract") or record.get("text")
+    else:
+        title, _, summary = line.partition("\t")
+    if not title or not summary:
+        return None
+    return title.strip(), summary.strip()
+
+
+class KnowledgeStore:
+    """Full-text indexed store of Wikipedia titles and lead summaries"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5("
+            "title, summary, tokenize='porter unicode61 remove_diacritics 2')"
+        )
+
+    def load_dump(self, path, batch_size=5000):
+        """Bulk-load articles from a dump file and return the number loaded"""
+        loaded = 0
+        batch = []
+        with self._lock, _open_dump(path) as dump:
+            for line in dump:
+                try:
+                    article = _parse_dump_line(line)
+                except ValueError:
+                    continue  # skip malformed JSON lines
+                if article is None:
+                    continue
+                batch.append(article)
+                if len(batch) >= batch_size:
+                    self._conn.executemany("INSERT INTO articles (title, summary) VALUES (?, ?)", batch)
+                    loaded += len(batch)
+                    batch = []
+            if batch:
+                self._conn.executemany("INSERT INTO articles (title, summary) VALUES (?, ?)", batch)
+                loaded += len(batch)
+            # Merge index segments so lookups touch as few b-trees as possible
+            self._conn.execute("INSERT INTO articles (articles) VALUES ('optimize')")
+            self._conn.commit()
+        return loaded
+
+    def add(self, title, summary):
+        """Add a single article"""
+        with self._lock:
+            self._conn.execute("INSERT INTO articles (title, summary) VALUES (?, ?)", (title, summary))
+            self._conn.commit()
+
+    def count(self):
+        """Return the number of stored articles"""
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM articles").fetchone()[0]
+
+    def lookup(self, query, sentences=2):
+        """Return the lead of the best matching article, or None
+
+        Titles containing every query term win (an exact title first);
+        otherwise the best full-text match across titles and summaries is used.
+        """
+        terms = _query_terms(query)
+        if not terms:
+            return None
+        phrase = " ".join(f'"{term}"' for term in terms)
+        wanted_title = " ".join(terms)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM articles WHERE articles MATCH ?"
+                " ORDER BY (lower(title) = ?) DESC, bm25(articles, 10.0, 1.0) LIMIT 1",
+                (f"title : ({phrase})", wanted_title),
+            ).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT summary FROM articles WHERE articles MATCH ?"
+                    " ORDER BY bm25(articles, 10.0, 1.0) LIMIT 1",
+                    (phrase,),
+                ).fetchone()
+        if row is None:
+            return None
+        return _first_sentences(row[0], sentences)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the shared store, or None when no knowledge database exists"""
+    global _store
+    if _store is None and config.KNOWLEDGE_DB and os.path.exists(config.KNOWLEDGE_DB):
+        with _store_lock:
+            if _store is None:
+                _store = KnowledgeStore(config.KNOWLEDGE_DB)
+    return _store
+
+
+def wikipedia_summary(query, sentences=2):
+    """Return a Wikipedia summary, preferring the local store over the live API
+
+    Raises the same exceptions as ``wikipedia.summary`` when the live API is used.
+    """
+    store = get_store()
+    if store is not None:
+        try:
+            summary = store.lookup(query, sentences=sentences)
+        except sqlite3.Error as e:
+            print(f"Knowledge Store Error: {e}")
+            summary = None
+        if summary:
+            return summary
+    expected = (wikipedia.exceptions.DisambiguationError, wikipedia.exceptions.PageError)
+    with backend_call("wikipedia", expected=expected):
+        return wikipedia.summary(query, sentences=sentences)
+
+
+def main():
+    """Command line entry point for loading and querying the store"""
+    parser = argparse.ArgumentParser(description="Manage Orion's offline Wikipedia store")
+    parser.add_argument("--db", default=config.KNOWLEDGE_DB, help="database path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load_parser = subparsers.add_parser("load", help="bulk-load a dump file")
+    load_parser.add_argument("dump")
+    query_parser = subparsers.add_parser("query", help="look up a question")
+    query_parser.add_argument("text")
+    args = parser.parse_args()
+
+    store = KnowledgeStore(args.db)
+    if args.command == "load":
+        loaded = store.load_dump(args.dump)
+        print(f"✅ Loaded {loaded} articles ({store.count()} total) into {args.db}")
+    else:
+        print(store.lookup(args.text) or "❌ No local match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Continuous microphone capture for the Orion console assistant
+
+One capture thread keeps a single microphone stream open and cuts it
+into phrases with ``Recognizer.listen``; a recognition worker turns
+queued phrases into text. Speech said while an earlier phrase is being
+recognized is therefore still captured, and nothing reopens or
+recalibrates the microphone between turns.
+
+The ambient noise level is measured once at startup. After that the
+recognizer's dynamic energy threshold adapts incrementally during the
+silence between phrases.
+
+Phrases that overlap a ``muted()`` block (the assistant talking) are
+dropped so Orion doesn't answer itself. While muted, every microphone
+chunk is still checked for barge-in: speech clearly louder than Orion's
+own echo for ``BARGE_IN_MIN_SECONDS`` calls ``on_barge_in`` (which cuts
+playback) and lets the phrase through. With a ``wake_filter`` (see
+wake_filter.py) phrases that can't contain the wake word are dropped
+locally instead of costing a cloud recognition call, except while a
+command is expected (``expect_command()``).
+"""
+import contextlib
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import speech_recognition as sr
+
+import config
+from wake_filter import pcm_to_samples
+
+# text is None when nothing was understood; error is None, "unknown", "request" or "microphone"
+Heard = namedtuple("Heard", ["text", "error", "detail"])
+
+
+def split_wake_word(text, name=None):
+    """Return (woke, command) for a transcript
+
+    "orion play believer" gives (True, "play believer"); a bare "orion"
+    gives (True, "").
+    """
+    name = (name or config.ASSISTANT_NAME).lower()
+    lowered = text.lower()
+    position = lowered.find(name)
+    if position < 0:
+        return False, ""
+    return True, text[position + len(name):].strip(" ,.!?")
+
+
+class Listener:
+    """Capture thread plus recognition worker feeding a queue of Heard results"""
+
+    def __init__(self, recognizer=None, source_factory=sr.Microphone, recognize=None, wake_filter=None,
+                 on_barge_in=None):
+        self.recognizer = recognizer or sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = True
+        self._source_factory = source_factory
+        self._recognize = recognize or self.recognizer.recognize_google
+        self.wake_filter = wake_filter
+        self.stats = {'phrases': 0, 'filtered': 0, 'recognized': 0}
+        self._command_deadline = 0.0
+        self.on_barge_in = on_barge_in
+        self._barge_in_at = 0.0
+        self._muted_since = None
+        self._echo_level = 0.0
+        self._loud_seconds = 0.0
+        self.phrases = queue.Queue(maxsize=config.LISTEN_QUEUE_SIZE)
+        self.heard = queue.Queue()
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._mute_lock = threading.Lock()
+        self._muted = 0
+        self._unmuted_at = 0.0
+        self._threads = []
+
+    def start(self):
+        """Start the capture and recognition threads"""
+        for target, name in ((self._capture, "orion-capture"), (self._recognize_phrases, "orion-recognize")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    @contextlib.contextmanager
+    def muted(self):
+        """Drop phrases heard while the block runs (e.g. while Orion speaks)"""
+        with self._mute_lock:
+            self._muted += 1
+            if self._muted_since is None:
+                self._muted_since = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._mute_lock:
+                self._muted -= 1
+                self._unmuted_at = time.monotonic()
+                if self._muted == 0:
+                    self._muted_since = None
+
+    def expect_command(self, seconds):
+        """Send every phrase for the next ``seconds`` to recognition, skipping the wake filter"""
+        self._command_deadline = time.monotonic() + seconds
+
+    def _overlaps_mute(self, started):
+        with self._mute_lock:
+            if self._barge_in_at >= started:
+                return False  # the user talked over Orion during this phrase
+            return self._muted > 0 or started < self._unmuted_at
+
+    def _watch_barge_in(self, buffer, sample_width, seconds):
+        """Track one microphone chunk; fire on_barge_in on sustained speech over the echo"""
+        muted_since = self._muted_since
+        if self.on_barge_in is None or muted_since is None:
+            self._echo_level = self._loud_seconds = 0.0
+            return
+        samples = pcm_to_samples(buffer, sample_width) * 32768
+        energy = float(np.sqrt(np.mean(samples ** 2))) if len(samples) else 0.0
+        # Learn the echo level first: a decaying peak of what the speaker alone sounds like
+        warming_up = time.monotonic() - muted_since < config.BARGE_IN_WARMUP
+        threshold = max(self._echo_level * config.BARGE_IN_RATIO, self.recognizer.energy_threshold)
+        if warming_up or energy <= threshold:
+            decay = 0.5 ** seconds
+            self._echo_level = max(energy, self._echo_level * decay)
+            self._loud_seconds = 0.0
+            return
+        # Fire once when the loud stretch reaches the minimum length, not again while it lasts
+        before = self._loud_seconds
+        self._loud_seconds += seconds
+        if before < config.BARGE_IN_MIN_SECONDS <= self._loud_seconds:
+            with self._mute_lock:
+                self._barge_in_at = time.monotonic()
+            self.on_barge_in()
+
+    def _capture(self):
+        """Keep one stream open and queue each phrase as it ends"""
+        while not self._stop.is_set():
+            try:
+                with self._source_factory() as source:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=config.AMBIENT_NOISE_DURATION)
+                    self.ready.set()
+                    stream = source.stream
+                    source.stream = _WatchedStream(stream, self, source)
+                    try:
+                        self._capture_phrases(source)
+                    finally:
+                        source.stream = stream
+                return
+            except Exception as e:
+                # Microphone unplugged or busy: reopen after a pause
+                print(f"Microphone Error: {e}")
+                self.heard.put(Heard(None, "microphone", str(e)))
+                self._stop.wait(1)
+
+    def _capture_phrases(self, source):
+        while not self._stop.is_set():
+            try:
+                # The timeout only lets the loop notice stop(); silence keeps the threshold adapting
+                audio = self.recognizer.listen(
+                    source, timeout=config.LISTEN_POLL_TIMEOUT, phrase_time_limit=config.PHRASE_TIME_LIMIT
+                )
+            except sr.WaitTimeoutError:
+                continue
+            ended = time.monotonic()
+            duration = len(audio.frame_data) / float(audio.sample_rate * audio.sample_width)
+            if self._overlaps_mute(ended - duration):
+                continue
+            try:
+                self.phrases.put_nowait(audio)
+            except queue.Full:
+                # Recognition has fallen behind: keep the newest speech
+                with contextlib.suppress(queue.Empty):
+                    self.phrases.get_nowait()
+                self.phrases.put_nowait(audio)
+
+    def _recognize_phrases(self):
+        """Turn queued phrases into Heard results"""
+        while not self._stop.is_set():
+            try:
+                audio = self.phrases.get(timeout=config.LISTEN_POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+            self.stats['phrases'] += 1
+            if self.wake_filter is not None and time.monotonic() > self._command_deadline:
+                try:
+                    decision = self.wake_filter.check_audio(audio)
+                except Exception as e:
+                    print(f"Wake Filter Error: {type(e).__name__}: {e}")
+                else:
+                    if not decision.accept:
+                        self.stats['filtered'] += 1
+                        continue
+            self.stats['recognized'] += 1
+            try:
+                self.heard.put(Heard(self._recognize(audio), None, None))
+            except sr.UnknownValueError:
+                self.heard.put(Heard(None, "unknown", None))
+            except sr.RequestError as e:
+                self.heard.put(Heard(None, "request", str(e)))
+            except Exception as e:
+                self.heard.put(Heard(None, "request", f"{type(e).__name__}: {e}"))
+
+
+class _WatchedStream:
+    """Microphone stream wrapper that shows every chunk to the barge-in detector"""
+
+    def __init__(self, stream, listener, source):
+        self._stream = stream
+        self._listener = listener
+        self._sample_width = source.SAMPLE_WIDTH
+        self._sample_rate = source.SAMPLE_RATE
+
+    def read(self, size):
+        buffer = self._stream.read(size)
+        if buffer:
+            self._listener._watch_barge_in(buffer, self._sample_width, size / float(self._sample_rate))
+        return buffer
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
@@ -1,17 +1,25 @@
-import speech_recognition as sr
 import webbrowser
 import wikipedia
 import musiclibrary
-from gtts import gTTS
 import pygame
 import os
 import time
 import sys
+import queue
 import logging
-import re
 from datetime import datetime
 import config
 from client import get_ai_response
+from tts_cache import PhraseBank
+from response_cache import response_cache
+from knowledge_store import wikipedia_summary
+from song_cache import get_song_cache
+from intents import classify, website_for, GENERAL
+import calculator
+import answer_race
+from listener import Listener, split_wake_word
+from speaker import Speaker
+from wake_filter import WakeWordFilter
 
 # Initialize pygame mixer
 pygame.mixer.init()
@@ -28,31 +36,28 @@ if config.ENABLE_LOGGING:
 else:
     logger = None
 
+# Fixed prompts, rendered into the phrase bank at startup so they play without a TTS round trip
+WAKE_REPLY = "Yes? How can I help you?"
+NOT_UNDERSTOOD = "Sorry, I did not catch that. Could you repeat?"
+RECOGNITION_FAILED = "Sorry, there was an error with the speech recognition service."
+COMMAND_FAILED = "Sorry, I encountered an error processing your command."
+THINKING = "Let me think about that..."
+NO_ANSWER = "Sorry, I couldn't find an answer to that right now."
+NO_SONG = "Sorry, I don't have that song in my library."
+GOODBYE = "Shutting down. Goodbye!"
+
+phrase_bank = PhraseBank([WAKE_REPLY, NOT_UNDERSTOOD, RECOGNITION_FAILED, COMMAND_FAILED,
+                          THINKING, NO_ANSWER, NO_SONG, GOODBYE])
+
+# Plays queued speech on its own thread; the listener is attached at startup
+speaker = Speaker(phrase_bank)
+
 def speak(text):
-    """Speak text aloud using gTTS + pygame and print formatted output"""
+    """Print text and queue it for playback; returns without waiting for the audio"""
     print(f"🤖 {config.ASSISTANT_NAME}: {text}")
     if logger:
         logger.info(f"Assistant: {text}")
-    
-    try:
-        tts = gTTS(text, lang=config.TTS_LANGUAGE)
-        tts.save(config.TEMP_AUDIO_FILE)
-        pygame.mixer.music.load(config.TEMP_AUDIO_FILE)
-        pygame.mixer.music.play()
-
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
-
-        pygame.mixer.music.stop()
-        pygame.mixer.music.unload()
-        
-        # Clean up temp file
-        if os.path.exists(config.TEMP_AUDIO_FILE):
-            os.remove(config.TEMP_AUDIO_FILE)
-    except Exception as e:
-        print(f"Speech Error: {e}")
-        if logger:
-            logger.error(f"Speech error: {e}")
+    speaker.say(text)
 
 def get_greeting():
     """Return a greeting based on the current time"""
@@ -66,26 +71,21 @@ def get_greeting():
     else:
         return "Hello"
 
-def search_wikipedia(query):
-    """Search Wikipedia and speak the result"""
+def fetch_wikipedia(query):
+    """Return (summary or message, cache_status) for a Wikipedia search
+    
+    Ambiguous and unknown topics produce a spoken message; other errors propagate.
+    """
     try:
-        summary = wikipedia.summary(query, sentences=2)
-        speak(summary)
-        if logger:
-            logger.info(f"Wikipedia search: {query}")
-    except wikipedia.exceptions.DisambiguationError as e:
-        speak(f"There are multiple results for {query}. Please be more specific.")
+        return response_cache.cached('wikipedia', query, lambda q: wikipedia_summary(q, sentences=2))
+    except wikipedia.exceptions.DisambiguationError:
         if logger:
             logger.warning(f"Wikipedia disambiguation for: {query}")
+        return f"There are multiple results for {query}. Please be more specific.", 'miss'
     except wikipedia.exceptions.PageError:
-        speak("Sorry, I could not find anything on Wikipedia for that query.")
         if logger:
             logger.warning(f"Wikipedia page not found: {query}")
-    except Exception as e:
-        print(f"Wiki Error: {e}")
-        speak("Sorry, I encountered an error searching Wikipedia.")
-        if logger:
-            logger.error(f"Wikipedia error: {e}")
+        return "Sorry, I could not find anything on Wikipedia for that query.", 'miss'
 
 def get_current_time():
     """Get and speak the current time"""
@@ -102,97 +102,91 @@ def get_current_date():
 def calculate(expression):
     """Perform basic mathematical calculations"""
     try:
-        # Remove 'calculate' or 'what is' from the expression
-        expression = re.sub(r'(calculate|what is|whats)', '', expression, flags=re.IGNORECASE).strip()
-        
-        # Replace word operators with symbols
-        expression = expression.replace('plus', '+').replace('minus', '-')
-        expression = expression.replace('times', '*').replace('multiplied by', '*')
-        expression = expression.replace('divided by', '/').replace('divide', '/')
-        
-        # Evaluate the expression safely
-        result = eval(expression, {"__builtins__": None}, {})
+        result = calculator.calculate(expression)
         speak(f"The answer is {result}")
         if logger:
             logger.info(f"Calculation: {expression} = {result}")
-    except Exception as e:
-        speak("Sorry, I couldn't perform that calculation.")
+    except calculator.CalculationError as e:
+        speak(str(e))
         if logger:
             logger.error(f"Calculation error: {e}")
 
-def processCommand(command):
-    """Process and execute user commands"""
-    command = command.lower()
-    
-    if logger:
-        logger.info(f"Processing command: {command}")
+def exit_assistant(command):
+    """Say goodbye and stop the assistant"""
+    speak(GOODBYE)
+    speaker.wait(timeout=10)
+    sys.exit(0)
 
-    # Exit command
-    if "exit" in command or "quit" in command or "bye" in command:
-        speak("Shutting down. Goodbye!")
-        sys.exit(0)
+def show_songs(command):
+    """Speak and print the available songs"""
+    speak("Here are the available songs:")
+    for i, song in enumerate(musiclibrary.music.keys(), 1):
+        song_name = song.replace("_", " ").title()
+        print(f"{i}. {song_name}")
 
-    # Show available songs
-    elif "show songs" in command or "list songs" in command:
-        speak("Here are the available songs:")
-        for i, song in enumerate(musiclibrary.music.keys(), 1):
-            song_name = song.replace("_", " ").title()
-            print(f"{i}. {song_name}")
-        return
+def open_website(command, site):
+    """Open a known website or a spoken domain in the browser"""
+    name, url = website_for(site)
+    speak(f"Opening {name}")
+    webbrowser.open(url)
 
-    # Time and date
-    elif "time" in command:
-        get_current_time()
-    elif "date" in command or "today" in command:
-        get_current_date()
+def play_song(command, song):
+    """Play the best library match for a spoken song name"""
+    match = musiclibrary.find_song(song) if song else None
+    if match:
+        speak(f"Playing {match.name}")
+        webbrowser.open(match.url)
+    else:
+        speak(NO_SONG)
 
-    # Calculations
-    elif "calculate" in command or ("what" in command and any(op in command for op in ["plus", "minus", "times", "divided", "+", "-", "*", "/"])):
-        calculate(command)
+def answer_question(command):
+    """Answer a general question, racing Gemini and Wikipedia per config.ANSWER_STRATEGY"""
+    backends = []
+    started = time.monotonic()
+    if config.USE_GEMINI:
+        def ask_gemini(query):
+            # Only announce the wait when we actually have to call Gemini
+            speak(THINKING)
+            return get_ai_response(query, timeout=answer_race.capped_timeout(config.GEMINI_TIMEOUT, started))
+        backends.append(('gemini', lambda: response_cache.cached('gemini', command, ask_gemini)))
+    backends.append(('wikipedia', lambda: fetch_wikipedia(command)))
+    
+    result = answer_race.race(backends)
+    if logger:
+        for backend, error in result.errors.items():
+            logger.warning(f"Answer backend {backend} failed: {error}")
+        logger.info(f"Answer for '{command}' from {result.backend} in {result.elapsed:.2f}s")
+    if result.answer:
+        speak(result.answer)
+    else:
+        speak(NO_ANSWER)
 
-    # Web browsing
-    elif "open google" in command:
-        speak("Opening Google")
-        webbrowser.open("https://google.com")
-    elif "open youtube" in command:
-        speak("Opening YouTube")
-        webbrowser.open("https://youtube.com")
-    elif "open facebook" in command:
-        speak("Opening Facebook")
-        webbrowser.open("https://facebook.com")
-    elif "open linkedin" in command:
-        speak("Opening LinkedIn")
-        webbrowser.open("https://linkedin.com")
-    elif "open" in command and ".com" in command:
-        # Extract website name
-        website = command.replace("open", "").strip()
-        if not website.startswith("http"):
-            website = f"https://{website}"
-        speak(f"Opening {website}")
-        webbrowser.open(website)
+# Intent name -> handler(command, **slots); see intents.py for the patterns
+INTENT_HANDLERS = {
+    "exit": exit_assistant,
+    "show_songs": show_songs,
+    "time": lambda command: get_current_time(),
+    "date": lambda command: get_current_date(),
+    "calculate": lambda command, expression: calculate(expression),
+    "open_site": open_website,
+    "play": play_song,
+    GENERAL: answer_question,
+}
 
-    # Music playback
-    elif command.startswith("play"):
-        song_name = command.replace("play", "").strip().lower().replace(" ", "_")
-        if song_name in musiclibrary.music:
-            speak(f"Playing {song_name.replace('_', ' ')}")
-            webbrowser.open(musiclibrary.music[song_name])
-        else:
-            speak("Sorry, I don't have that song in my library.")
+def processCommand(command):
+    """Process and execute user commands"""
+    command = command.lower()
+    
+    if logger:
+        logger.info(f"Processing command: {command}")
 
-    # Wikipedia search or AI response
+    intent = classify(command)
+    handler = INTENT_HANDLERS.get(intent.name)
+    if handler is None:
+        # Intent registered without a console handler: treat as a question
+        answer_question(command)
     else:
-        # Try AI response first if available
-        if config.USE_GEMINI:
-            speak("Let me think about that...")
-            ai_response = get_ai_response(command)
-            if ai_response:
-                speak(ai_response)
-                return
-        
-        # Fall back to Wikipedia
-        speak(f"Searching Wikipedia for {command}")
-        search_wikipedia(command)
+        handler(command, **intent.slots)
 
 # Main loop
 if __name__ == "__main__":
@@ -205,6 +199,9 @@ if __name__ == "__main__":
     else:
         print("ℹ️  Gemini integration disabled (no API key)")
     
+    # Render the fixed prompts while the greeting plays
+    phrase_bank.render()
+    
     greeting = get_greeting()
     startup_message = f"{greeting}! I am {config.ASSISTANT_NAME}, your voice assistant. Say '{config.ASSISTANT_NAME}' to wake me up."
     speak(startup_message)
@@ -212,53 +209,85 @@ if __name__ == "__main__":
     if logger:
         logger.info(f"{config.ASSISTANT_NAME} started successfully")
 
-    recognizer = sr.Recognizer()
+    # Songs promoted from the web app's Gemini lookups are playable here too
+    get_song_cache()
+
+    wake_filter = None
+    if config.WAKE_FILTER_ENABLED:
+        wake_filter = WakeWordFilter.load()
+        if wake_filter.templates:
+            print(f"✅ Local wake-word filter enabled ({len(wake_filter.templates)} templates)")
+        else:
+            print("ℹ️  Local voice filter enabled (enroll the wake word with wake_filter.py for keyword spotting)")
+    # Calibrate only once the greeting has finished, or it would count as ambient noise
+    speaker.wait()
+    listener = Listener(wake_filter=wake_filter,
+                        on_barge_in=speaker.interrupt if config.BARGE_IN_ENABLED else None).start()
+    speaker.listener = listener
+    awaiting_command_until = None
 
+    print("\n🎤 Listening for wake word...")
     while True:
         try:
-            with sr.Microphone() as source:
-                print("\n🎤 Listening for wake word...")
-                recognizer.adjust_for_ambient_noise(source, duration=config.AMBIENT_NOISE_DURATION)
-                audio = recognizer.listen(source, phrase_time_limit=config.WAKE_WORD_TIME_LIMIT)
-
-                try:
-                    word = recognizer.recognize_google(audio)
-                    print(f"🧑 You said: {word}")
-
-                    if config.ASSISTANT_NAME.lower() in word.lower():
-                        speak("Yes? How can I help you?")
-
-                        time.sleep(0.5)
+            try:
+                heard = listener.heard.get(timeout=0.5)
+            except queue.Empty:
+                if awaiting_command_until and time.monotonic() > awaiting_command_until:
+                    awaiting_command_until = None
+                    print("\n🎤 Listening for wake word...")
+                continue
 
-                        with sr.Microphone() as source2:
-                            recognizer.adjust_for_ambient_noise(source2, duration=0.5)
-                            print("🎤 Listening for your command...")
-                            audio2 = recognizer.listen(source2, phrase_time_limit=config.PHRASE_TIME_LIMIT)
+            if heard.error == "request":
+                print(f"Speech Recognition Error: {heard.detail}")
+                if logger:
+                    logger.error(f"Speech recognition error: {heard.detail}")
+                if awaiting_command_until:
+                    awaiting_command_until = None
+                    speak(RECOGNITION_FAILED)
+                continue
+            if heard.error == "unknown":
+                if awaiting_command_until:
+                    speak(NOT_UNDERSTOOD)
+                    awaiting_command_until = time.monotonic() + config.COMMAND_WAIT_TIMEOUT
+                    listener.expect_command(config.COMMAND_WAIT_TIMEOUT)
+                continue  # Otherwise ignore background noise
+            if heard.error:
+                continue  # Microphone errors are reported by the listener, which reopens it
 
-                            try:
-                                command = recognizer.recognize_google(audio2)
-                                print(f"🧑 Command: {command}")
-                                processCommand(command)
-                            except sr.UnknownValueError:
-                                speak("Sorry, I did not catch that. Could you repeat?")
-                            except sr.RequestError:
-                                speak("Sorry, there was an error with the speech recognition service.")
-                            except Exception as e:
-                                print(f"Command Error: {e}")
-                                speak("Sorry, I encountered an error processing your command.")
+            if awaiting_command_until:
+                command = heard.text
+                awaiting_command_until = None
+                listener.expect_command(0)
+            else:
+                print(f"🧑 You said: {heard.text}")
+                woke, command = split_wake_word(heard.text)
+                if not woke:
+                    continue
+                if not command:
+                    # Bare wake word: the command is the next phrase
+                    speak(WAKE_REPLY)
+                    print("🎤 Listening for your command...")
+                    awaiting_command_until = time.monotonic() + config.COMMAND_WAIT_TIMEOUT
+                    listener.expect_command(config.COMMAND_WAIT_TIMEOUT)
+                    continue
 
-                except sr.UnknownValueError:
-                    pass  # Ignore background noise
-                except sr.RequestError as e:
-                    print(f"Speech Recognition Error: {e}")
-                    if logger:
-                        logger.error(f"Speech recognition error: {e}")
-                except Exception:
-                    pass  # Ignore other audio errors
+            print(f"🧑 Command: {command}")
+            # A new command replaces whatever Orion was still saying
+            speaker.interrupt()
+            try:
+                processCommand(command)
+            except Exception as e:
+                print(f"Command Error: {e}")
+                speak(COMMAND_FAILED)
+            print("\n🎤 Listening for wake word...")
 
         except KeyboardInterrupt:
             print("\n\n👋 Keyboard interrupt detected")
-            speak("Shutting down. Goodbye!")
+            listener.stop(timeout=2)
+            stats = listener.stats
+            print(f"🎚️  {stats['filtered']} of {stats['phrases']} phrases were filtered locally")
+            speak(GOODBYE)
+            speaker.wait(timeout=10)
             if logger:
                 logger.info(f"{config.ASSISTANT_NAME} shut down by user")
             break
@@ -0,0 +1,219 @@
+"""Prometheus-style metrics for Orion Voice Assistant
+
+A small in-process registry of counters, gauges and histograms rendered
+in the Prometheus text exposition format by ``/metrics`` in app.py. The
+hot path only takes a per-metric lock to bump a number (histograms find
+their bucket with ``bisect``); anything derived, such as cache hit
+ratios, is computed by collectors when the endpoint is scraped.
+
+Each worker process has its own registry, so scrape every worker (or run
+a single worker) when serving with several processes.
+"""
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+
+import tracing
+
+# Latency buckets in seconds, from cache hits up to the Gemini timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self._header()
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, such as requests in flight"""
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (non-cumulative) counts plus +Inf, then sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register ``collect()`` returning (name, kind, help, [(labels dict, value)]) tuples"""
+        self._collectors.append(collect)
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Metrics Collector Error: {type(e).__name__}: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+COMMANDS = registry.register(Counter(
+    "orion_commands_total", "Commands processed, by intent", ["intent"]))
+COMMAND_ERRORS = registry.register(Counter(
+    "orion_command_errors_total", "Commands that raised an error, by intent", ["intent"]))
+COMMAND_LATENCY = registry.register(Histogram(
+    "orion_command_duration_seconds", "Time to answer a command, by intent", ["intent"]))
+
+BACKEND_CALLS = registry.register(Counter(
+    "orion_backend_calls_total", "Calls to external backends", ["backend"]))
+BACKEND_ERRORS = registry.register(Counter(
+    "orion_backend_errors_total", "Failed calls to external backends", ["backend"]))
+BACKEND_LATENCY = registry.register(Histogram(
+    "orion_backend_duration_seconds", "External backend call latency", ["backend"]))
+BACKEND_IN_FLIGHT = registry.register(Gauge(
+    "orion_backend_calls_in_flight", "External backend calls currently running", ["backend"]))
+
+HTTP_REQUESTS = registry.register(Counter(
+    "orion_http_requests_total", "HTTP requests, by endpoint and status", ["endpoint", "status"]))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "orion_http_requests_in_flight", "HTTP requests currently being served", ["endpoint"]))
+
+
+def observe_command(intent, seconds, failed=False):
+    """Record one processed command"""
+    COMMANDS.inc(intent)
+    COMMAND_LATENCY.observe(seconds, intent)
+    if failed:
+        COMMAND_ERRORS.inc(intent)
+
+
+class backend_call:
+    """Context manager timing one backend call (also a tracing span)
+
+    Exceptions count as errors unless listed in ``expected`` (answers such
+    as "page not found"); code that swallows its own exceptions calls
+    ``failed()`` instead. Closing a generator early or cancelling a task
+    (e.g. the loser of a hedged race) is not an error.
+    """
+
+    def __init__(self, backend, expected=()):
+        self.backend = backend
+        self.expected = (GeneratorExit, asyncio.CancelledError) + tuple(expected)
+        self._failed = False
+
+    def failed(self):
+        self._failed = True
+
+    def __enter__(self):
+        BACKEND_IN_FLIGHT.inc(self.backend)
+        self._span = tracing.span(self.backend).__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.__exit__(exc_type, exc, tb)
+        BACKEND_IN_FLIGHT.dec(self.backend)
+        BACKEND_CALLS.inc(self.backend)
+        BACKEND_LATENCY.observe(time.perf_counter() - self._started, self.backend)
+        if self._failed or (exc_type is not None and not issubclass(exc_type, self.expected)):
+            BACKEND_ERRORS.inc(self.backend)
+        return False
@@ -1,4 +1,5 @@
 """Music Library for Orion Voice Assistant"""
+from song_index import SongIndex
 
 # Music database with YouTube links
 music = {
@@ -113,11 +114,22 @@ def get_all_song_names():
     """Get all song names in readable format"""
     return [song.replace("_", " ").title() for song in music.keys()]
 
-def search_song(query):
-    """Search for a song by partial name match"""
-    query = query.lower().replace(" ", "_")
-    matches = [song for song in music.keys() if query in song]
-    return matches
+def search_song(query, limit=10):
+    """Search for songs by fuzzy name match, best matches first"""
+    return [match.key for match in index.search(query, limit=limit)]
+
+def find_song(query):
+    """Return the best SongMatch (key, name, url, score) for a spoken name, or None"""
+    return index.best_match(query)
+
+def add_song(song_key, url):
+    """Add a song to the library and the search index"""
+    global version
+    song_key = song_key.lower().replace(" ", "_")
+    music[song_key] = url
+    index.add(song_key, url)
+    version += 1
+    return song_key
 
 def get_song_url(song_key):
     """Get URL for a specific song"""
@@ -126,4 +138,10 @@ def get_song_url(song_key):
 # Total songs count
 def get_song_count():
     """Return total number of songs in library"""
-    return len(music)
\ No newline at end of file
+    return len(music)
+
+# Shared fuzzy search index used by main.py and app.py
+index = SongIndex(music)
+
+# Bumped by add_song so derived data (e.g. the /api/songs payload) can be rebuilt
+version = 0
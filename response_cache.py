@@ -0,0 +1,161 @@
+"""Response cache for Gemini and Wikipedia answers
+
+Answers are keyed by backend and a normalized form of the query, so
+"What is Python?" and "hey orion, what is python" share an entry. Each
+backend has its own TTL, the in-memory tier is a size-bounded LRU, and
+entries can optionally be persisted to SQLite so they survive restarts.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# Greetings, politeness and hesitations; anything that could change the
+# question ("can", "you", "the", ...) stays part of the key
+FILLER_WORDS = {"hey", "hi", "hello", "ok", "okay", "um", "uh", "please"}
+
+
+def normalize_query(query):
+    """Return a canonical cache key for a spoken query"""
+    words = re.sub(r"[^\w\s]", " ", query.lower()).split()
+    name = config.ASSISTANT_NAME.lower()
+    kept = [word for word in words if word not in FILLER_WORDS and word != name]
+    # Fall back to the raw words when the query was nothing but filler
+    return " ".join(kept or words)
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache with optional SQLite persistence"""
+
+    def __init__(self, max_entries=None, ttls=None, db_path=None):
+        self.max_entries = max_entries or config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttls = dict(ttls or config.RESPONSE_CACHE_TTLS)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        """Open (or create) the persistence database"""
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " backend TEXT NOT NULL, query_key TEXT NOT NULL, response TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, PRIMARY KEY (backend, query_key))"
+        )
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._db.commit()
+
+    def _count(self, backend, outcome):
+        counters = self._stats.setdefault(backend, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def _store(self, key, response, expires_at):
+        """Insert into the LRU and evict the oldest entries past the limit"""
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, backend, query):
+        """Return a fresh cached response or None"""
+        key = (backend, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(backend, "hits")
+                    return response
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM responses"
+                    " WHERE backend = ? AND query_key = ? AND expires_at > ?",
+                    (backend, key[1], now),
+                ).fetchone()
+                if row:
+                    self._store(key, row[0], row[1])
+                    self._count(backend, "hits")
+                    return row[0]
+
+            self._count(backend, "misses")
+            return None
+
+    def put(self, backend, query, response):
+        """Cache a response for the backend's TTL"""
+        ttl = self.ttls.get(backend)
+        if not ttl or not response:
+            return
+        key = (backend, normalize_query(query))
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store(key, response, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (backend, query_key, response, expires_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (backend, key[1], response, expires_at),
+                )
+                self._db.commit()
+
+    def cached(self, backend, query, fetch):
+        """Return (response, status) using ``fetch(query)`` on a miss
+
+        Status is "hit" or "miss". Falsy results are returned but not cached,
+        and exceptions from ``fetch`` propagate to the caller.
+        """
+        response = self.get(backend, query)
+        if response is not None:
+            return response, "hit"
+        response = fetch(query)
+        self.put(backend, query, response)
+        return response, "miss"
+
+    def stats(self):
+        """Return per-backend hit/miss counters and hit ratios"""
+        with self._lock:
+            result = {"entries": len(self._entries)}
+            for backend, counters in self._stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                result[backend] = dict(
+                    counters, hit_ratio=round(counters["hits"] / lookups, 4) if lookups else 0.0
+                )
+            return result
+
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+class _DisabledCache(ResponseCache):
+    """Cache stand-in used when RESPONSE_CACHE_ENABLED is off"""
+
+    def get(self, backend, query):
+        return None
+
+    def put(self, backend, query, response):
+        pass
+
+
+# Shared cache instance used by main.py and app.py
+if config.RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(db_path=config.RESPONSE_CACHE_DB or None)
+else:
+    response_cache = _DisabledCache()
@@ -0,0 +1,73 @@
+"""Per-session conversation state for the Orion web interface
+
+Each browser gets an opaque session id in a cookie. Its command history
+is a fixed-size ring buffer kept in a shared state backend (see
+state_store.py): process-local deques by default, or SQLite / a KV
+server so several worker processes see the same history. Idle sessions
+expire and the number of sessions is capped.
+"""
+import secrets
+from datetime import datetime
+
+from state_store import create_state_store
+
+
+class SessionState:
+    """Handle on one browser session's state in the backend"""
+
+    def __init__(self, session_id, backend):
+        self.session_id = session_id
+        self._backend = backend
+
+    def record(self, command, response):
+        """Append a command/response pair and return the stored entry"""
+        return self._backend.append(self.session_id, self._entry(command, response))
+
+    def record_many(self, exchanges):
+        """Append (command, response) pairs in one atomic step and return the stored entries"""
+        entries = [self._entry(command, response) for command, response in exchanges]
+        return self._backend.extend(self.session_id, entries) if entries else []
+
+    @staticmethod
+    def _entry(command, response):
+        return {
+            'command': command,
+            'response': response,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def get_history(self, since=0, limit=None):
+        """Return up to ``limit`` entries with an id above ``since``, oldest first"""
+        return self._backend.history(self.session_id, since, limit)
+
+    def version(self):
+        """Return a token that changes whenever the history changes"""
+        return self._backend.version(self.session_id)
+
+    def clear(self):
+        self._backend.clear(self.session_id)
+
+
+class SessionStore:
+    """Resolves session cookies to SessionState handles"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else create_state_store()
+
+    def resolve(self, session_id):
+        """Return (session_id, state, created) for a cookie value
+
+        Unknown, expired or missing ids get a fresh session.
+        """
+        created = not (session_id and self.backend.exists(session_id))
+        if created:
+            session_id = secrets.token_urlsafe(16)
+            self.backend.create(session_id)
+        return session_id, SessionState(session_id, self.backend), created
+
+    def __len__(self):
+        return len(self.backend)
+
+    def stats(self):
+        """Return backend session counts"""
+        return self.backend.stats()
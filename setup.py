@@ -41,6 +41,7 @@ def check_dependencies():
         "pygame",
         "wikipedia",
         "google.generativeai",
+        "numpy",
         "dotenv"
     ]
     
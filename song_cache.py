@@ -0,0 +1,161 @@
+"""Persistent cache of Gemini song resolutions for Orion Voice Assistant
+
+Songs that are not in `musiclibrary.music` are resolved to YouTube URLs
+by Gemini, which takes seconds. Each resolution is stored in SQLite with
+a confidence and timestamp so repeat requests skip the LLM call. Direct
+video results that keep getting requested are promoted into the music
+library and its search index, so they are found like any built-in song.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import config
+import musiclibrary
+from song_index import song_tokens
+
+_DIRECT_VIDEO = re.compile(r"^https?://(www\.)?youtube\.com/watch\?v=[\w-]{11}(&\S*)?$")
+
+# Confidence assigned to each kind of resolution
+DIRECT_VIDEO_CONFIDENCE = 0.9
+SEARCH_FALLBACK_CONFIDENCE = 0.2
+
+
+def song_key(song_name):
+    """Return the library-style key for a song title ("Lose You To Love Me" -> "lose_you_to_love_me")"""
+    return "_".join(re.findall(r"[a-z0-9&]+", song_name.lower().replace("_", " ")))
+
+
+def match_key(song_name):
+    """Return the lookup key, with spoken aliases folded ("lose u 2 love me" == "lose you to love me")"""
+    return "_".join(song_tokens(song_name))
+
+
+def resolution_confidence(url):
+    """Rate a resolved URL: a well-formed direct video beats a search page"""
+    return DIRECT_VIDEO_CONFIDENCE if _DIRECT_VIDEO.match(url) else SEARCH_FALLBACK_CONFIDENCE
+
+
+class SongResolutionCache:
+    """SQLite-backed song name -> YouTube URL resolutions"""
+
+    def __init__(self, db_path=None, search_ttl=None, promote_after=None, promote_min_confidence=None):
+        self.db_path = db_path or config.SONG_CACHE_DB
+        self.search_ttl = search_ttl if search_ttl is not None else config.SONG_CACHE_SEARCH_TTL
+        self.promote_after = promote_after or config.SONG_PROMOTE_AFTER_HITS
+        self.promote_min_confidence = (
+            promote_min_confidence if promote_min_confidence is not None
+            else config.SONG_PROMOTE_MIN_CONFIDENCE
+        )
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # song_key holds match_key(); library keys and display names come from song_name
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            " song_key TEXT PRIMARY KEY, song_name TEXT NOT NULL, url TEXT NOT NULL,"
+            " confidence REAL NOT NULL, resolved_at REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0, promoted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+
+    def lookup(self, song_name):
+        """Return a stored resolution dict and count the hit, or None
+
+        Low-confidence (search page) resolutions expire after ``search_ttl``
+        so Gemini gets another chance to find the actual video.
+        """
+        key = match_key(song_name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT song_name, url, confidence, resolved_at, hits, promoted FROM resolutions WHERE song_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            stored_name, url, confidence, resolved_at, hits, promoted = row
+            if confidence < self.promote_min_confidence and time.time() - resolved_at > self.search_ttl:
+                self._conn.execute("DELETE FROM resolutions WHERE song_key = ?", (key,))
+                self._conn.commit()
+                return None
+            hits += 1
+            self._conn.execute("UPDATE resolutions SET hits = ? WHERE song_key = ?", (hits, key))
+            self._conn.commit()
+
+        resolution = {
+            'key': song_key(stored_name), 'url': url, 'confidence': confidence,
+            'resolved_at': resolved_at, 'hits': hits, 'promoted': bool(promoted),
+        }
+        if not promoted and self._should_promote(resolution):
+            self._promote(key, resolution['key'], url)
+            resolution['promoted'] = True
+        return resolution
+
+    def store(self, song_name, url, confidence=None):
+        """Record a fresh resolution (replacing any previous one)"""
+        key = match_key(song_name)
+        if not key:
+            return
+        confidence = resolution_confidence(url) if confidence is None else confidence
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolutions (song_key, song_name, url, confidence, resolved_at, hits, promoted)"
+                " VALUES (?, ?, ?, ?, ?, 0, 0)",
+                (key, song_name, url, confidence, time.time()),
+            )
+            self._conn.commit()
+
+    def _should_promote(self, resolution):
+        return (
+            resolution['confidence'] >= self.promote_min_confidence
+            and resolution['hits'] >= self.promote_after
+        )
+
+    def _promote(self, key, library_key, url):
+        """Add a verified resolution to the searchable music library"""
+        musiclibrary.add_song(library_key, url)
+        with self._lock:
+            self._conn.execute("UPDATE resolutions SET promoted = 1 WHERE song_key = ?", (key,))
+            self._conn.commit()
+        print(f"⭐ Promoted '{library_key}' into the music library")
+
+    def restore_promoted(self):
+        """Load previously promoted songs into the music library; returns the count"""
+        with self._lock:
+            rows = self._conn.execute("SELECT song_name, url FROM resolutions WHERE promoted = 1").fetchall()
+        for song_name, url in rows:
+            if song_key(song_name) not in musiclibrary.music:
+                musiclibrary.add_song(song_key(song_name), url)
+        return len(rows)
+
+    def stats(self):
+        """Return counts of stored and promoted resolutions"""
+        with self._lock:
+            total, promoted = self._conn.execute(
+                "SELECT count(*), coalesce(sum(promoted), 0) FROM resolutions"
+            ).fetchone()
+        return {'resolutions': total, 'promoted': promoted}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_song_cache():
+    """Return the shared resolution cache, restoring promoted songs on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = SongResolutionCache()
+                cache.restore_promoted()
+                _cache = cache
+    return _cache
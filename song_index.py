@@ -0,0 +1,131 @@
+"""Fuzzy song index for Orion Voice Assistant
+
+Song names are indexed by whole tokens and by character trigrams, so a
+lookup only scores songs that share something with the query instead of
+scanning the whole library. Ranking combines trigram similarity (which
+tolerates speech-recognition errors such as "believe her" for "believer")
+with whole-word overlap, and the best ``limit`` matches are returned.
+"""
+import heapq
+import re
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+SongMatch = namedtuple("SongMatch", ["key", "name", "url", "score"])
+
+# Spoken forms that recognizers and song titles spell differently
+TOKEN_ALIASES = {
+    "for": "4", "four": "4",
+    "to": "2", "too": "2", "two": "2",
+    "you": "u",
+    "and": "&", "n": "&",
+}
+
+
+def song_tokens(text):
+    """Split a song key or spoken query into canonical tokens"""
+    words = re.findall(r"[a-z0-9&]+", text.lower().replace("_", " "))
+    return [TOKEN_ALIASES.get(word, word) for word in words]
+
+
+def trigrams(tokens):
+    """Return the set of character trigrams of the joined tokens
+
+    Spaces are dropped so word-boundary mistakes ("bad guy" / "badguy")
+    still share most trigrams; ^ and $ mark the start and end.
+    """
+    compact = f"^{''.join(tokens)}$"
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class SongIndex:
+    """Token and trigram postings over a song library with ranked fuzzy search"""
+
+    def __init__(self, songs=None, min_score=0.45, common_trigram_ratio=0.05):
+        self.min_score = min_score
+        # Trigrams found in more than this share of songs are skipped when
+        # gathering candidates, keeping lookups cheap on very large libraries
+        self.common_trigram_ratio = common_trigram_ratio
+        self._keys = []
+        self._urls = []
+        self._tokens = []
+        self._trigram_counts = []
+        self._ids = {}
+        self._token_postings = defaultdict(list)
+        self._trigram_postings = defaultdict(list)
+        self._lock = threading.Lock()
+        for key, url in (songs or {}).items():
+            self.add(key, url)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, url):
+        """Add a song, or update the URL of an existing one"""
+        with self._lock:
+            song_id = self._ids.get(key)
+            if song_id is not None:
+                self._urls[song_id] = url
+                return
+
+            tokens = song_tokens(key)
+            grams = trigrams(tokens)
+            song_id = len(self._keys)
+            self._ids[key] = song_id
+            self._keys.append(key)
+            self._urls.append(url)
+            self._tokens.append(set(tokens))
+            self._trigram_counts.append(len(grams))
+            for token in set(tokens):
+                self._token_postings[token].append(song_id)
+            for gram in grams:
+                self._trigram_postings[gram].append(song_id)
+
+    def _match(self, song_id, score):
+        key = self._keys[song_id]
+        return SongMatch(key, key.replace("_", " ").title(), self._urls[song_id], round(score, 4))
+
+    def search(self, query, limit=5):
+        """Return up to ``limit`` SongMatch results, best first"""
+        tokens = song_tokens(query)
+        if not tokens:
+            return []
+
+        exact_id = self._ids.get("_".join(tokens))
+        if exact_id is None:
+            exact_id = self._ids.get(query.lower().strip().replace(" ", "_"))
+
+        query_grams = trigrams(tokens)
+        common_limit = max(50, int(len(self._keys) * self.common_trigram_ratio))
+        shared = Counter()
+        postings = sorted((self._trigram_postings.get(gram, ()) for gram in query_grams), key=len)
+        for i, posting in enumerate(postings):
+            # Always use the rarest few trigrams, even if they are common
+            if len(posting) > common_limit and i >= 3:
+                break
+            shared.update(posting)
+
+        query_tokens = set(tokens)
+        candidates = set(shared)
+        for token in query_tokens:
+            posting = self._token_postings.get(token, ())
+            if len(posting) <= common_limit:
+                candidates.update(posting)
+
+        def score(song_id):
+            if song_id == exact_id:
+                return 1.0
+            dice = 2.0 * shared[song_id] / (len(query_grams) + self._trigram_counts[song_id])
+            candidate_tokens = self._tokens[song_id]
+            overlap = len(query_tokens & candidate_tokens) / max(len(query_tokens), len(candidate_tokens))
+            return 0.65 * dice + 0.35 * overlap
+
+        if exact_id is not None:
+            candidates.add(exact_id)
+        best = heapq.nlargest(limit, ((score(song_id), song_id) for song_id in candidates))
+        return [self._match(song_id, value) for value, song_id in best if value >= self.min_score]
+
+    def best_match(self, query):
+        """Return the single best SongMatch or None"""
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
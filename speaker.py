@@ -0,0 +1,109 @@
+"""Non-blocking speech output for the Orion console assistant
+
+``Speaker.say()`` queues text and returns at once; a worker thread
+synthesizes and plays it. Long answers are synthesized sentence by
+sentence (see ``tts_cache.iter_speech_segments``) so playback starts
+after the first sentence. ``interrupt()`` drops everything queued and
+stops the current sentence. The listener calls it when the user talks
+over Orion (barge-in).
+
+While an utterance plays, the listener is muted so Orion doesn't hear
+itself, except for barge-in detection.
+"""
+import contextlib
+import io
+import queue
+import threading
+
+import config
+from tts_backends import audio_format
+from tts_cache import iter_speech_segments
+
+
+def play_with_pygame(audio, stopped):
+    """Play MP3 or WAV bytes through pygame until they end or ``stopped()`` is true"""
+    import pygame
+
+    pygame.mixer.music.load(io.BytesIO(audio), audio_format(audio))
+    pygame.mixer.music.play()
+    clock = pygame.time.Clock()
+    while pygame.mixer.music.get_busy():
+        if stopped():
+            pygame.mixer.music.stop()
+            break
+        clock.tick(20)
+    pygame.mixer.music.unload()
+
+
+class Speaker:
+    """Playback queue with a single output worker"""
+
+    def __init__(self, phrase_bank=None, listener=None, lang=None, play=None, segments=None):
+        self.phrase_bank = phrase_bank
+        self.listener = listener
+        self.lang = lang or config.TTS_LANGUAGE
+        self._play = play or play_with_pygame
+        self._segments = segments or iter_speech_segments
+        self._queue = queue.Queue()
+        self._generation = 0
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def say(self, text):
+        """Queue text for playback and return immediately"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="orion-speaker", daemon=True)
+                self._thread.start()
+        with self._idle:
+            self._pending += 1
+        self._queue.put((self._generation, text))
+
+    def interrupt(self):
+        """Stop the current utterance and drop everything queued"""
+        self._generation += 1
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._done()
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def wait(self, timeout=None):
+        """Block until everything queued has been played (or interrupted)"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _done(self):
+        with self._idle:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _audio_for(self, text):
+        banked = self.phrase_bank.get(text) if self.phrase_bank is not None else None
+        return [banked] if banked else self._segments(text, self.lang)
+
+    def _run(self):
+        while True:
+            generation, text = self._queue.get()
+            try:
+                if generation != self._generation:
+                    continue
+                stopped = lambda: generation != self._generation
+                muted = self.listener.muted() if self.listener is not None else contextlib.nullcontext()
+                with muted:
+                    for audio in self._audio_for(text):
+                        if stopped():
+                            break
+                        self._play(audio, stopped)
+            except Exception as e:
+                print(f"Speech Error: {e}")
+            finally:
+                self._done()
@@ -0,0 +1,554 @@
+"""Shared state backends for the Orion web interface
+
+Session history has to be visible to every worker process when app.py
+runs under several workers. ``sessions.SessionStore`` keeps its data in
+one of these backends, chosen with ``config.STATE_BACKEND``:
+
+* ``memory`` - process-local ring buffers; fastest, single worker only
+* ``sqlite`` - a SQLite file in WAL mode shared by all workers on a host
+* ``kv``     - a Redis-style key-value server (``config.STATE_KV_URL``);
+  ``redis://`` URLs use redis-py if installed, and ``kv://host:port``
+  connects to the local stand-in started with
+  ``python state_store.py serve-kv`` (both sides need
+  ``STATE_KV_AUTHKEY`` set to the same secret)
+
+Every backend exposes ``exists``, ``create``, ``append``, ``extend``
+(several entries in one atomic step), ``history``, ``version``, ``clear``
+and ``stats`` over session ids; histories are
+capped at ``history_size`` entries and idle sessions expire. Appended
+entries get an ``id`` that only ever increases, so clients can fetch
+``history(since=id)`` incrementally, and ``version`` changes whenever a
+session's history does.
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from multiprocessing.managers import BaseManager, MakeProxyType
+
+import config
+
+BACKENDS = ("memory", "sqlite", "kv")
+
+
+def _version(newest_id, count):
+    """History version token: entry ids never repeat, so (newest id, count) is unique"""
+    return f"{newest_id}-{count}"
+
+
+class MemoryStateStore:
+    """Process-local sessions in LRU order with deque ring buffers"""
+
+    def __init__(self, history_size=None, max_sessions=None, idle_timeout=None):
+        self.history_size = history_size or config.SESSION_HISTORY_SIZE
+        self.max_sessions = max_sessions or config.SESSION_MAX_SESSIONS
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.SESSION_IDLE_TIMEOUT
+        # session id -> [last_seen, history deque, lock]
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._evicted = 0
+
+    def _evict_idle(self, now):
+        # Sessions are in last-seen order, so only the idle prefix is visited
+        while self._sessions:
+            session_id, (last_seen, _, _) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            self._evicted += 1
+
+    def exists(self, session_id):
+        """Refresh and report whether a live session exists"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            session[0] = now
+            self._sessions.move_to_end(session_id)
+            return True
+
+    def create(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            self._sessions[session_id] = [now, deque(maxlen=self.history_size), threading.Lock()]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+
+    def _session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            # Evicted while in use; keep serving the request with a fresh session
+            self.create(session_id)
+            with self._lock:
+                session = self._sessions[session_id]
+        return session
+
+    def append(self, session_id, entry):
+        return self.extend(session_id, [entry])[0]
+
+    def extend(self, session_id, entries):
+        _, history, lock = self._session(session_id)
+        with lock:
+            entries = [dict(entry, id=next(self._ids)) for entry in entries]
+            history.extend(entries)
+        return entries
+
+    def history(self, session_id, since=0, limit=None):
+        _, history, lock = self._session(session_id)
+        with lock:
+            # Walk back from the newest entry so an idle poll touches nothing
+            newer = list(itertools.takewhile(lambda entry: entry['id'] > since, reversed(history)))
+        newer.reverse()
+        return newer[:limit] if limit is not None else newer
+
+    def version(self, session_id):
+        _, history, lock = self._session(session_id)
+        with lock:
+            return _version(history[-1]['id'] if history else 0, len(history))
+
+    def clear(self, session_id):
+        _, history, lock = self._session(session_id)
+        with lock:
+            history.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._sessions), 'evicted': self._evicted}
+
+
+class SQLiteStateStore:
+    """Sessions and history in a SQLite file shared by all worker processes"""
+
+    # How often (seconds) a worker sweeps idle sessions and enforces the cap
+    SWEEP_INTERVAL = 30
+
+    def __init__(self, db_path=None, history_size=None, max_sessions=None, idle_timeout=None):
+        self.db_path = db_path or config.STATE_DB
+        self.history_size = history_size or config.SESSION_HISTORY_SIZE
+        self.max_sessions = max_sessions or config.SESSION_MAX_SESSIONS
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.SESSION_IDLE_TIMEOUT
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        conn = self._conn()
+        # WAL lets readers in other workers proceed while one worker writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, last_seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS history ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,"
+            " entry TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id);"
+            "CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);"
+        )
+
+    def _conn(self):
+        """Return this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _sweep(self, conn, now):
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - self.idle_timeout,))
+            conn.execute(
+                "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions"
+                " ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+            conn.execute("DELETE FROM history WHERE session_id NOT IN (SELECT session_id FROM sessions)")
+
+    def exists(self, session_id):
+        now = time.time()
+        conn = self._conn()
+        self._sweep(conn, now)
+        with conn:
+            updated = conn.execute(
+                "UPDATE sessions SET last_seen = ? WHERE session_id = ? AND last_seen >= ?",
+                (now, session_id, now - self.idle_timeout),
+            ).rowcount
+        return updated == 1
+
+    def create(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (session_id, last_seen) VALUES (?, ?)",
+                         (session_id, time.time()))
+            conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+
+    def append(self, session_id, entry):
+        return self.extend(session_id, [entry])[0]
+
+    def extend(self, session_id, entries):
+        conn = self._conn()
+        stored = []
+        with conn:
+            for entry in entries:
+                entry_id = conn.execute(
+                    "INSERT INTO history (session_id, entry) VALUES (?, ?)", (session_id, json.dumps(entry))
+                ).lastrowid
+                stored.append(dict(entry, id=entry_id))
+            # Trim to a ring buffer of history_size entries
+            conn.execute(
+                "DELETE FROM history WHERE session_id = ? AND id <= (SELECT id FROM history"
+                " WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.history_size),
+            )
+        return stored
+
+    def history(self, session_id, since=0, limit=None):
+        rows = self._conn().execute(
+            "SELECT id, entry FROM history WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (session_id, since, -1 if limit is None else limit),
+        ).fetchall()
+        return [dict(json.loads(entry), id=entry_id) for entry_id, entry in rows]
+
+    def version(self, session_id):
+        newest_id, count = self._conn().execute(
+            "SELECT coalesce(max(id), 0), count(*) FROM history WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return _version(newest_id, count)
+
+    def clear(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        # Idle sessions count as gone even before the next sweep deletes them
+        (sessions,) = self._conn().execute(
+            "SELECT count(*) FROM sessions WHERE last_seen >= ?", (time.time() - self.idle_timeout,)
+        ).fetchone()
+        return sessions
+
+    def stats(self):
+        return {'backend': 'sqlite', 'sessions': len(self)}
+
+
+class LocalKV:
+    """In-process stand-in for the subset of Redis commands KVStateStore uses"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        # Reentrant so execute_many can run the other commands under it
+        self._lock = threading.RLock()
+
+    def _live(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._live(key))
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = value
+            self._expires.pop(key, None)
+            if ex is not None:
+                self._expires[key] = time.time() + ex
+            return True
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._live(key) else None
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._live(key):
+                return False
+            self._expires[key] = time.time() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._live(key):
+                    del self._data[key]
+                    self._expires.pop(key, None)
+                    removed += 1
+            return removed
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def incrby(self, key, amount):
+        with self._lock:
+            value = (int(self._data[key]) if self._live(key) else 0) + amount
+            self._data[key] = str(value)
+            return value
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._data[key]) if self._live(key) else 0
+
+    def rpush(self, key, *values):
+        with self._lock:
+            if not self._live(key):
+                self._data[key] = []
+            self._data[key].extend(values)
+            return len(self._data[key])
+
+    @staticmethod
+    def _range(length, start, end):
+        start = max(start + length if start < 0 else start, 0)
+        end = end + length if end < 0 else min(end, length - 1)
+        return start, end + 1
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            if not self._live(key):
+                return []
+            values = self._data[key]
+            start, stop = self._range(len(values), start, end)
+            return values[start:stop]
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            if self._live(key):
+                values = self._data[key]
+                start, stop = self._range(len(values), start, end)
+                self._data[key] = values[start:stop]
+            return True
+
+    def dbsize(self):
+        with self._lock:
+            return sum(1 for key in list(self._data) if self._live(key))
+
+    def scan_iter(self, match="*"):
+        """Return live keys matching a glob pattern (a list, so it can cross the kv:// proxy)"""
+        with self._lock:
+            return [key for key in list(self._data) if fnmatch.fnmatchcase(key, match) and self._live(key)]
+
+    def execute_many(self, commands):
+        """Run (method, args) commands as one atomic step, returning their results"""
+        with self._lock:
+            return [getattr(self, name)(*args) for name, args in commands]
+
+    def pipeline(self, transaction=True):
+        return KVPipeline(self)
+
+
+class KVPipeline:
+    """Queues commands for a LocalKV and runs them atomically, like a redis-py MULTI pipeline"""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self._commands.append((name, args))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return self._client.execute_many(commands)
+
+
+class _KVManager(BaseManager):
+    pass
+
+
+_KVProxyBase = MakeProxyType('_KVProxyBase', (
+    'exists', 'get', 'set', 'expire', 'delete', 'incr', 'incrby', 'llen', 'rpush', 'lrange', 'ltrim',
+    'dbsize', 'scan_iter', 'execute_many',
+))
+
+
+class _KVProxy(_KVProxyBase):
+    """Client for a served LocalKV; pipelines queue locally and run in one call"""
+
+    def pipeline(self, transaction=True):
+        return KVPipeline(self)
+
+
+def kv_authkey():
+    """Return STATE_KV_AUTHKEY as bytes, refusing to run the kv:// protocol without one"""
+    if not config.STATE_KV_AUTHKEY:
+        raise ValueError("STATE_KV_AUTHKEY must be set to a shared secret to serve or connect to kv://")
+    return config.STATE_KV_AUTHKEY.encode()
+
+
+def serve_kv(host, port, authkey):
+    """Serve a LocalKV to other processes until interrupted
+
+    Authenticated clients can make the server unpickle arbitrary data, so
+    ``authkey`` is required; bind to a non-local ``host`` only on a
+    trusted network.
+    """
+    if not authkey:
+        raise ValueError("serve_kv needs an authkey")
+    kv = LocalKV()
+    _KVManager.register('kv', callable=lambda: kv)
+    manager = _KVManager(address=(host, port), authkey=authkey)
+    print(f"🗄️ Orion KV store listening on {host}:{port}")
+    manager.get_server().serve_forever()
+
+
+def connect_kv(url):
+    """Return a KV client for a redis:// or kv://host:port URL"""
+    if url.startswith(("redis://", "rediss://")):
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+    if url.startswith("kv://"):
+        host, _, port = url[len("kv://"):].partition(":")
+        _KVManager.register('kv', proxytype=_KVProxy)
+        manager = _KVManager(address=(host, int(port)), authkey=kv_authkey())
+        manager.connect()
+        return manager.kv()
+    raise ValueError(f"Unsupported STATE_KV_URL {url!r}; use redis://... or kv://host:port")
+
+
+class KVStateStore:
+    """Sessions as expiring keys and history as capped lists in a KV store
+
+    Idle sessions expire through key TTLs, which also bounds the number
+    of live sessions; ``max_sessions`` is not enforced separately. Each
+    session has an id counter that advances in the same transaction as
+    its list, so entry ids are derived from list positions.
+    """
+
+    def __init__(self, client=None, history_size=None, idle_timeout=None, prefix="orion"):
+        self.client = client if client is not None else connect_kv(config.STATE_KV_URL)
+        self.history_size = history_size or config.SESSION_HISTORY_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.SESSION_IDLE_TIMEOUT
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        """Return the session, history list and history id counter keys"""
+        return (f"{self.prefix}:session:{session_id}", f"{self.prefix}:history:{session_id}",
+                f"{self.prefix}:history_id:{session_id}")
+
+    def exists(self, session_id):
+        session_key, history_key, counter_key = self._keys(session_id)
+        if not self.client.expire(session_key, self.idle_timeout):
+            return False
+        pipe = self.client.pipeline(transaction=True)
+        pipe.expire(history_key, self.idle_timeout)
+        pipe.expire(counter_key, self.idle_timeout)
+        pipe.execute()
+        return True
+
+    def create(self, session_id):
+        session_key, history_key, counter_key = self._keys(session_id)
+        self.client.delete(history_key, counter_key)
+        self.client.set(session_key, "1", ex=self.idle_timeout)
+
+    def append(self, session_id, entry):
+        return self.extend(session_id, [entry])[0]
+
+    def extend(self, session_id, entries):
+        _, history_key, counter_key = self._keys(session_id)
+        # Push, advance the id counter, trim and refresh TTLs in one MULTI block,
+        # so list order always matches id order and no id is left without an entry
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(history_key, *(json.dumps(entry) for entry in entries))
+        pipe.incrby(counter_key, len(entries))
+        pipe.ltrim(history_key, -self.history_size, -1)
+        pipe.expire(history_key, self.idle_timeout)
+        pipe.expire(counter_key, self.idle_timeout)
+        last_id = pipe.execute()[1]
+        first_id = last_id - len(entries) + 1
+        return [dict(entry, id=first_id + offset) for offset, entry in enumerate(entries)]
+
+    def _read(self, session_id):
+        """Return the history entries with their ids, read in one MULTI block"""
+        _, history_key, counter_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(history_key, 0, -1)
+        pipe.get(counter_key)
+        values, last_id = pipe.execute()
+        last_id = int(last_id or 0)
+        # The list holds the newest entries, whose ids run consecutively up to the counter
+        first_id = last_id - len(values) + 1
+        return [dict(json.loads(value), id=first_id + offset) for offset, value in enumerate(values)]
+
+    def history(self, session_id, since=0, limit=None):
+        entries = self._read(session_id)
+        newer = [entry for entry in entries if entry['id'] > since]
+        return newer[:limit] if limit is not None else newer
+
+    def version(self, session_id):
+        _, history_key, counter_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.llen(history_key)
+        pipe.get(counter_key)
+        count, last_id = pipe.execute()
+        return _version(int(last_id or 0) if count else 0, count)
+
+    def clear(self, session_id):
+        # The id counter is kept, so ids (and versions) never repeat after a clear
+        self.client.delete(self._keys(session_id)[1])
+
+    def __len__(self):
+        # Only session keys count; history lists, counters and unrelated keys are skipped
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}:session:*"))
+
+    def stats(self):
+        return {'backend': 'kv', 'sessions': len(self)}
+
+
+def create_state_store(backend=None):
+    """Build the state backend named by ``backend`` or config.STATE_BACKEND"""
+    backend = backend or config.STATE_BACKEND
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "kv":
+        return KVStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND {backend!r}; expected one of {BACKENDS}")
+
+
+def main():
+    """Command line entry point for running the local KV stand-in"""
+    parser = argparse.ArgumentParser(description="Orion shared state tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve-kv", help="run the local KV store for multi-worker mode")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="interface to bind (default: localhost only)")
+    serve_parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    if args.command == "serve-kv":
+        try:
+            authkey = kv_authkey()
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            serve_kv(args.host, args.port, authkey)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -467,8 +467,8 @@ async function sendCommand(command) {
     }, 400);
 
     try {
-        console.log('Making fetch request to /api/process with command:', command);
-        const response = await fetch('/api/process', {
+        console.log('Making streaming request to /api/process/stream with command:', command);
+        const response = await fetch('/api/process/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -476,17 +476,43 @@ async function sendCommand(command) {
             body: JSON.stringify({ command: command })
         });
 
-        // Clear loading animation
-        clearInterval(loadingInterval);
-
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
+        let streamedText = '';
+        let data = null;
+
+        await readEventStream(response, (event, payload) => {
+            if (event === 'delta') {
+                // First partial answer: stop the loading animation and open the card
+                if (!streamedText) {
+                    clearInterval(loadingInterval);
+                    beginStreamingMessage();
+                    updateStatusText('Answering...');
+                }
+                streamedText += payload.text;
+                appendStreamingText(payload.text);
+            } else if (event === 'done') {
+                data = payload;
+            } else if (event === 'error') {
+                throw new Error(payload.error || 'Stream error');
+            }
+        });
+
+        // Clear loading animation
+        clearInterval(loadingInterval);
+
+        if (!data) {
+            throw new Error('Stream ended without a result');
+        }
 
         // Show assistant response
-        showAssistantMessage(data.response);
+        if (streamedText) {
+            finishStreamingMessage(data.response);
+        } else {
+            showAssistantMessage(data.response);
+        }
         updateStatusText('Waiting for your command...');
 
         // Handle pending actions (URL opening with confirmation button)
@@ -514,6 +540,45 @@ async function sendCommand(command) {
     }
 }
 
+/**
+ * Read a Server-Sent Events response body and dispatch each event
+ *
+ * @param {Response} response - fetch response with a text/event-stream body
+ * @param {function(string, object)} onEvent - called with event name and parsed data
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
 function showUserMessage(text) {
     const userMsg = document.getElementById('userInputText');
     const userDisplay = document.getElementById('userInputDisplay');
@@ -531,7 +596,7 @@ function showUserMessage(text) {
     }, 3000);
 }
 
-function showAssistantMessage(text) {
+function showAssistantMessage(text, options = {}) {
     const responseCard = document.getElementById('responseCard');
     const responseContent = document.getElementById('responseContent');
     const welcomeDisplay = document.getElementById('welcomeDisplay');
@@ -564,7 +629,38 @@ function showAssistantMessage(text) {
     responseContent.innerHTML = '<p></p>';
 
     // Typewriter effect
-    typewriterEffect(text, responseContent);
+    if (options.typewriter !== false) {
+        typewriterEffect(text, responseContent);
+    }
+}
+
+/**
+ * Open the response card for an answer that arrives in pieces
+ */
+function beginStreamingMessage() {
+    // Reuse the regular layout changes with an empty card, without the typewriter
+    showAssistantMessage('', { typewriter: false });
+
+    const paragraph = document.querySelector('#responseContent p');
+    const cursor = document.createElement('span');
+    cursor.className = 'typing-cursor';
+    cursor.textContent = '|';
+    paragraph.appendChild(cursor);
+}
+
+function appendStreamingText(text) {
+    const paragraph = document.querySelector('#responseContent p');
+    if (!paragraph) return;
+    const cursor = paragraph.querySelector('.typing-cursor');
+    paragraph.insertBefore(document.createTextNode(text), cursor);
+}
+
+function finishStreamingMessage(fullText) {
+    const cursor = document.querySelector('#responseContent .typing-cursor');
+    if (cursor) cursor.remove();
+
+    // Speak once the full answer is known
+    speakText(fullText);
 }
 
 function typewriterEffect(text, element) {
@@ -838,24 +934,23 @@ function handleSpecialCommands(command, response) {
 
 async function loadAndPlaySong(command) {
     try {
-        const response = await fetch('/api/songs');
-        const data = await response.json();
-
         // Extract song name: handle "play perfect", "Play Perfect", etc.
         let songName = command.replace(/^play\s+/i, '').trim().toLowerCase();
 
-        // Convert spaces to underscores for matching library keys
-        const songKey = songName.replace(/\s+/g, '_');
+        console.log('Searching for song:', songName); // Debug log
 
-        console.log('Searching for song:', songKey); // Debug log
+        // Ask the server for the best match instead of downloading the whole catalog
+        const response = await fetch(`/api/songs/search?q=${encodeURIComponent(songName)}&limit=1`);
+        const data = await response.json();
 
-        const song = data.songs.find(s => s.key === songKey);
+        // The server's fuzzy match tolerates misspelled or partial names
+        const song = (data.songs || [])[0];
 
         if (song) {
             console.log('Playing:', song.name);
             window.open(song.url, '_blank');
         } else {
-            console.log('Song not found. Available keys:', data.songs.map(s => s.key));
+            console.log('Song not found:', songName);
         }
     } catch (error) {
         console.error('Error loading songs:', error);
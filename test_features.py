@@ -1,9 +1,36 @@
 """Test script for Orion features without voice input"""
 import config
-from client import get_ai_response
-import wikipedia
 from datetime import datetime
 import re
+import json
+import tempfile
+import os
+import time
+import threading
+from tts_cache import TTSCache, PhraseBank
+import tts_cache
+import tts_backends
+from response_cache import ResponseCache, normalize_query
+from knowledge_store import KnowledgeStore
+import musiclibrary
+from intents import classify, IntentRouter
+from calculator import calculate, CalculationError
+import answer_race
+import metrics
+import tracing
+from concurrent.futures import ThreadPoolExecutor
+from sessions import SessionStore
+from state_store import MemoryStateStore, SQLiteStateStore, KVStateStore, LocalKV
+from utils import CommandHistory
+from benchmark import FakeBackends, bench_song_lookup
+from song_index import SongIndex
+from song_cache import SongResolutionCache
+from listener import Listener, split_wake_word
+import speech_recognition as sr
+import struct
+import numpy as np
+from wake_filter import WakeWordFilter, evaluate, write_wav
+from speaker import Speaker
 
 def test_time_feature():
     """Test time functionality"""
@@ -23,56 +50,1142 @@ def test_calculation():
     """Test calculation functionality"""
     print("\n🧮 Testing Calculation Feature:")
     
-    test_expressions = [
-        "2 + 2",
-        "10 * 5",
-        "100 / 4",
-        "15 - 7"
-    ]
+    test_expressions = {
+        "2 + 2": "4",
+        "10 * 5": "50",
+        "100 / 4": "25",
+        "15 - 7": "8",
+        "12 times 7": "84",
+        "5 squared": "25",
+        "15 percent of 80": "12",
+        "square root of 144": "12",
+        "twenty five plus seventeen": "42",
+        "10 % 3": "1",
+        "50 %": "0.5",
+    }
+    
+    for expr, expected in test_expressions.items():
+        result = calculate(expr)
+        print(f"{expr} = {result}")
+        assert result == expected
     
-    for expr in test_expressions:
+    # Unsafe or unbounded input fails fast with a spoken error
+    for expr in ["9**9**9", "10 / 0", "__import__('os')", "2 ** 100000"]:
+        start = time.perf_counter()
         try:
-            result = eval(expr, {"__builtins__": None}, {})
-            print(f"{expr} = {result}")
-        except Exception as e:
-            print(f"Error with {expr}: {e}")
+            calculate(expr)
+            raise AssertionError(f"{expr} should not evaluate")
+        except CalculationError as e:
+            print(f"{expr} -> {e}")
+        assert time.perf_counter() - start < 0.1
 
 def test_wikipedia():
-    """Test Wikipedia search"""
+    """Test the Wikipedia answer path against the offline fake"""
     print("\n📚 Testing Wikipedia Search:")
+    import app
     
-    queries = ["Python programming", "Artificial Intelligence"]
-    
-    for query in queries:
-        try:
-            summary = wikipedia.summary(query, sentences=1)
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}, failing=("gemini",)) as fakes:
+        for query in ["Python programming", "Artificial Intelligence"]:
+            result = app.assistant.process_command(f"who is {query}")
             print(f"\nQuery: {query}")
-            print(f"Result: {summary[:100]}...")
-        except Exception as e:
-            print(f"Error searching '{query}': {e}")
+            print(f"Result: {result['response'][:100]}...")
+            assert result['source'] == 'wikipedia' and query.lower() in result['response']
+        
+        response, _ = app.assistant._lookup_wikipedia("nonexistent topic")
+        print(f"Missing page: {response}")
+        assert "couldn't find information" in response
+        assert fakes.calls["wikipedia"] == 3
 
 def test_gemini():
-    """Test Gemini (Google) integration"""
+    """Test the Gemini answer path and response caching against the offline fake"""
     print("\n🤖 Testing Gemini Integration:")
+    import app
+    
+    test_query = "What is the capital of France?"
+    print(f"\nTest Query: {test_query}")
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}) as fakes:
+        first = app.assistant.process_command(test_query)
+        second = app.assistant.process_command(test_query)
+        print(f"AI Response: {first['response']}")
+        assert first['source'] == 'gemini' and first['cache'] == 'miss'
+        assert second['cache'] == 'hit' and second['response'] == first['response']
+        assert fakes.calls["gemini"] == 1
+    
+    print("✅ Gemini is configured" if config.USE_GEMINI else "ℹ️ Gemini is not configured (no API key)")
 
-    if not config.USE_GEMINI:
-        print("❌ Gemini is not configured (no API key)")
-        return
+def test_gemini_token_limit():
+    """Test that answers cut off by max_output_tokens are handled explicitly"""
+    print("\n✂️ Testing Gemini Token Limit:")
+    from google.generativeai import protos
+    from google.generativeai.types import generation_types
+    from client import GeminiClient, MAX_TOKENS
+    
+    def response(parts, finish_reason):
+        content = protos.Content(role="model", parts=[protos.Part(text=text) for text in parts])
+        return generation_types.GenerateContentResponse.from_response(protos.GenerateContentResponse(
+            candidates=[protos.Candidate(finish_reason=finish_reason, content=content)]
+        ))
+    
+    class FakeModel:
+        def __init__(self, reply):
+            self.reply = reply
+        
+        def generate_content(self, contents, **options):
+            return self.reply
+    
+    gemini = GeminiClient(api_key="test")
+    gemini._models[None] = FakeModel(response(["Paris is the capital"], MAX_TOKENS))
+    assert gemini.generate("capital of France?") == "Paris is the capital"
+    # Thinking used the whole budget: no text at all, reported as a failed call
+    gemini._models[None] = FakeModel(response([], MAX_TOKENS))
+    assert gemini.generate("capital of France?") is None
+    gemini._models[None] = FakeModel(response(["Paris."], protos.Candidate.FinishReason.STOP))
+    assert gemini.generate("capital of France?") == "Paris."
 
-    print("✅ Gemini is configured (placeholder)")
+def read_sse(body):
+    """Parse a Server-Sent Events body into (event, data) pairs"""
+    events = []
+    for message in body.split("\n\n"):
+        if message:
+            event, data = message.split("\n")
+            assert event.startswith("event: ") and data.startswith("data: ")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
 
-    # Test a simple query
-    test_query = "What is the capital of France?"
-    print(f"\nTest Query: {test_query}")
+def test_process_stream():
+    """Test /api/process/stream event order, framing and history recording"""
+    print("\n📡 Testing Streamed Answers:")
+    import app
+    
+    assert app.format_sse('delta', {'text': 'a\nb'}) == 'event: delta\ndata: {"text": "a\\nb"}\n\n'
+    
+    client = app.app.test_client()
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}):
+        timeouts = []
+        stream = app.stream_ai_response
+        app.stream_ai_response = lambda query, timeout=None: timeouts.append(timeout) or stream(query)
+        try:
+            response = client.post('/api/process/stream', json={'command': 'What is the speed of light'})
+        finally:
+            app.stream_ai_response = stream
+        # The stream is capped at what is left of the answer deadline
+        assert 0 < timeouts[0] <= min(config.GEMINI_TIMEOUT, config.ANSWER_DEADLINE)
+        assert response.mimetype == 'text/event-stream'
+        events = read_sse(response.get_data(as_text=True))
+        names = [name for name, _ in events]
+        print(f"Events: {names}")
+        assert names[-1] == 'done' and set(names[:-1]) == {'delta'} and len(names) > 2
+        done = events[-1][1]
+        assert ''.join(data['text'] for _, data in events[:-1]) == done['response']
+        assert done['source'] == 'gemini' and done['command'] == 'What is the speed of light'
+        
+        # Locally answered commands arrive as a single delta
+        local = read_sse(client.get('/api/process/stream?command=what+time+is+it').get_data(as_text=True))
+        assert [name for name, _ in local] == ['delta', 'done']
+        
+        # Both exchanges were recorded in this session once their streams ended
+        history = client.get('/api/history').get_json()['history']
+        assert [entry['id'] for entry in history] == [done['id'], local[-1][1]['id']]
+    for body in ({}, ["what time is it"], "what time is it"):
+        assert client.post('/api/process/stream', json=body).status_code == 400
+
+def test_asgi():
+    """Test the native ASGI routes and their parity with the Flask app"""
+    print("\n⚡ Testing ASGI Mode:")
+    import asyncio
+    import httpx
+    import app
+    import asgi
+    
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://orion.test") as client:
+            general = await client.post('/api/process', json={'command': 'What is the speed of sound'})
+            local = await client.post('/api/process', json={'command': 'what is 12 times 7'})
+            missing = await client.post('/api/process', json={})
+            stream = await client.post('/api/process/stream', json={'command': 'Who wrote Hamlet'})
+            # Delegated to Flask, with the session cookie set by the native routes
+            history = await client.get('/api/history')
+            return general, local, missing, stream, history
+    
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}):
+        general, local, missing, stream, history = asyncio.run(run())
+        flask_client = app.app.test_client()
+        flask_general = flask_client.post('/api/process', json={'command': 'What is the speed of sound'}).get_json()
+        flask_local = flask_client.post('/api/process', json={'command': 'what is 12 times 7'}).get_json()
+        for body in ({}, ["what time is it"], "what time is it", None):
+            assert flask_client.post('/api/process', json=body).status_code == 400
+    
+    assert general.status_code == 200 and 'x-request-id' in general.headers
+    session_id = general.cookies.get(config.SESSION_COOKIE_NAME)
+    assert session_id and local.cookies.get(config.SESSION_COOKIE_NAME) == session_id
+    assert f"Max-Age={config.SESSION_IDLE_TIMEOUT}" in local.headers['set-cookie']
+    print(f"ASGI: {general.json()['response']} ({general.json()['source']})")
+    for asgi_result, flask_result in ((general.json(), flask_general), (local.json(), flask_local)):
+        assert asgi_result['response'] == flask_result['response']
+        assert asgi_result.get('source') == flask_result.get('source')
+    assert local.json()['response'] == "The answer is 84"
+    assert missing.status_code == 400
+    
+    assert stream.headers['content-type'] == 'text/event-stream'
+    events = read_sse(stream.text)
+    assert [name for name, _ in events][-1] == 'done' and len(events) > 2
+    assert ''.join(data['text'] for _, data in events[:-1]) == events[-1][1]['response']
+    assert events[-1][1]['source'] == 'gemini'
+    
+    entries = history.json()['history']
+    assert [entry['command'] for entry in entries] == ['What is the speed of sound', 'what is 12 times 7',
+                                                       'Who wrote Hamlet']
+
+def test_process_batch():
+    """Test /api/process/batch result order, per-item errors, timings and size cap"""
+    print("\n📦 Testing Batch Commands:")
+    import app
+
+    client = app.app.test_client()
+    commands = ["What is the speed of light", "what is 6 times 7", "", 42, "what time is it"]
+    with FakeBackends(latency={"gemini": 0.05, "wikipedia": 0}):
+        response = client.post('/api/process/batch', json={'commands': commands})
+    assert response.status_code == 200
+    data = response.get_json()
+    print(f"Batch: {data['count']} results, {data['errors']} errors in {data['elapsed_ms']} ms")
+    results = data['results']
+    assert [item['index'] for item in results] == list(range(len(commands)))
+    assert [item['command'] for item in results] == commands
+    assert results[0]['source'] == 'gemini' and results[1]['response'] == "The answer is 42"
+    assert results[2]['error'] == results[3]['error'] == 'No command provided'
+    assert 'response' not in results[2] and data['errors'] == 2
+    assert all(isinstance(item['elapsed_ms'], float) and item['elapsed_ms'] >= 0 for item in results)
+    assert results[0]['elapsed_ms'] >= 50
+
+    # Only the successful exchanges reach the history, in request order
+    history = client.get('/api/history').get_json()['history']
+    assert [entry['id'] for entry in history] == [results[i]['id'] for i in (0, 1, 4)]
+
+    saved = config.BATCH_MAX_COMMANDS
+    config.BATCH_MAX_COMMANDS = 2
+    try:
+        assert client.post('/api/process/batch', json={'commands': ["a", "b", "c"]}).status_code == 413
+    finally:
+        config.BATCH_MAX_COMMANDS = saved
+    for body in ({}, {'commands': []}, {'commands': "what time is it"}, ["what time is it"]):
+        response = client.post('/api/process/batch', json=body)
+        assert response.status_code == 400 and response.get_json()['error'] == 'No commands provided'
+
+def test_tts_cache():
+    """Test the TTS audio cache tiers and eviction"""
+    print("\n🔊 Testing TTS Cache:")
+    with FakeBackends(latency={"gtts": 0}) as fakes:
+        first = tts_cache.synthesize_speech("Yes? How can I help you?", "en")
+        second = tts_cache.synthesize_speech("Yes?  How can I help you?", "en")
+        assert first == second and fakes.calls["gtts"] == 1
+        
+        # A fresh instance over the same directory is served from disk
+        reloaded = TTSCache(cache_dir=tts_cache.tts_cache.cache_dir)
+        assert reloaded.get("Yes? How can I help you?", "en") == first
+        assert reloaded.stats()["disk_hits"] == 1
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = TTSCache(cache_dir=cache_dir, max_memory_bytes=1024, max_disk_bytes=1024)
+        for i in range(20):
+            cache.put(f"phrase number {i}", "en", b"x" * 200)
+        stats = cache.stats()
+        assert stats["memory_bytes"] <= 1024 and stats["disk_bytes"] <= 1024
+        print(f"Cache stats: {stats}")
+
+class FakeNetworkTTS(tts_backends.TTSBackend):
+    name = "fake-network"
+    network = True
+    delay = 0.0
+    failing = False
+
+    def synthesize(self, text, lang):
+        failing = self.failing
+        time.sleep(self.delay)
+        if failing:
+            raise ConnectionError("network TTS down")
+        return b"ID3" + text.encode("utf-8")
+
+class FakeLocalTTS(tts_backends.TTSBackend):
+    name = "fake-local"
+    format = "wav"
+
+    def synthesize(self, text, lang):
+        return b"RIFF" + text.encode("utf-8")
+
+def test_tts_backends():
+    """Test falling back from a slow or failing network TTS engine to a local one"""
+    print("\n🔈 Testing TTS Backends:")
+    saved = (config.TTS_BACKEND, config.TTS_FALLBACK_BACKENDS, config.TTS_BACKEND_TIMEOUT, tts_cache.tts_cache)
+    tts_backends.BACKENDS.update({"fake-network": FakeNetworkTTS, "fake-local": FakeLocalTTS})
+    network = tts_backends.get_backend("fake-network")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config.TTS_BACKEND, config.TTS_FALLBACK_BACKENDS = "fake-network", ["fake-local"]
+        config.TTS_BACKEND_TIMEOUT = 0.2
+        tts_cache.tts_cache = TTSCache(cache_dir=cache_dir)
+        tts_cache._resting_until.clear()
+        try:
+            assert tts_cache.synthesize_speech("hello there", "en") == b"ID3hello there"
+            
+            # A slow network engine hands over to the local one and is rested
+            network.delay = 0.5
+            audio = tts_cache.synthesize_speech("slow answer", "en")
+            assert tts_backends.audio_format(audio) == "wav"
+            assert tts_backends.audio_mimetype(audio) == "audio/wav"
+            assert "fake-network" in tts_cache._resting_until
+            # Falling back still counts as one cache miss per request
+            assert tts_cache.tts_cache.stats()["misses"] == 2
+            
+            # MP3-only callers (the web stream) never get the WAV engine
+            network.failing, network.delay = True, 0.0
+            tts_cache._resting_until.clear()
+            try:
+                tts_cache.synthesize_speech("failing", "en", formats=("mp3",))
+                assert False, "expected RuntimeError"
+            except RuntimeError as e:
+                print(f"No MP3 engine: {e}")
+            assert tts_cache.synthesize_speech("failing", "en") == b"RIFFfailing"
+            
+            # Audio is cached per engine: the same text has one entry for each
+            assert TTSCache.make_key("hello there", "en", "fake-network") != TTSCache.make_key("hello there", "en", "fake-local")
+            assert tts_cache.tts_cache.get("failing", "en", "fake-local", "wav") == b"RIFFfailing"
+            time.sleep(0.5)  # the slow call finished late and was cached for next time
+            assert tts_cache.tts_cache.get("slow answer", "en", "fake-network") == b"ID3slow answer"
+        finally:
+            config.TTS_BACKEND, config.TTS_FALLBACK_BACKENDS, config.TTS_BACKEND_TIMEOUT, tts_cache.tts_cache = saved
+            tts_cache._resting_until.clear()
+            for name in ("fake-network", "fake-local"):
+                tts_backends.BACKENDS.pop(name)
+                tts_backends._instances.pop(name, None)
+    print(f"Chain: {[backend.name for backend in tts_backends.backend_chain()]}")
+
+def test_tts_streaming():
+    """Test sentence chunking and ordered, fault-tolerant speech segments"""
+    print("\n🎙️ Testing Streamed TTS:")
+    chunks = tts_cache.split_sentences("Hi. Dr. Smith is on the line. He says the results look fine. OK!", min_length=20)
+    print(f"Chunks: {chunks}")
+    assert chunks == ["Hi. Dr. Smith is on the line.", "He says the results look fine. OK!"]
+    assert tts_cache.split_sentences("   ") == []
+    
+    # Segments come out in sentence order even when a later one is ready first; failures are skipped
+    def fake_synthesize(sentence, lang, formats=None):
+        if sentence.startswith("First"):
+            time.sleep(0.1)
+        if "broken" in sentence:
+            raise ConnectionError("TTS unavailable")
+        return sentence.encode("utf-8")
+    
+    text = "First sentence is slow to render. This broken sentence will fail. Last sentence is quick to render."
+    saved = tts_cache.synthesize_speech
+    tts_cache.synthesize_speech = fake_synthesize
+    try:
+        segments = list(tts_cache.iter_speech_segments(text, "en", workers=3))
+    finally:
+        tts_cache.synthesize_speech = saved
+    assert segments == [b"First sentence is slow to render.", b"Last sentence is quick to render."]
+    
+    # /api/tts in stream mode sends the segments back to back as one MP3 body
+    import app
+    sentences = tts_cache.split_sentences(text)
+    with FakeBackends(latency={"gtts": 0}) as fakes:
+        response = app.app.test_client().post('/api/tts', json={'text': text, 'stream': True})
+        body = response.get_data()
+        assert fakes.calls["gtts"] == len(sentences)
+        expected = b"".join(fakes.gtts(sentence, "en") for sentence in sentences)
+    print(f"Streamed {len(body)} bytes in {len(sentences)} segments")
+    assert response.status_code == 200 and response.mimetype == 'audio/mpeg'
+    assert body == expected
+    
+    # Non-object or non-JSON bodies get a JSON 400, not a 500 or an HTML 415
+    client = app.app.test_client()
+    for response in (client.post('/api/tts', json=["hello"]), client.post('/api/tts', json="hello"),
+                     client.post('/api/tts', data="text=hello")):
+        assert response.status_code == 400 and response.get_json() == {'error': 'No text provided'}
+
+def test_phrase_bank():
+    """Test that fixed phrases are rendered once and served from memory"""
+    print("\n🗣️ Testing Phrase Bank:")
+    calls = []
+    
+    def fake_synthesize(text, lang):
+        calls.append(text)
+        if text == "broken":
+            raise ConnectionError("TTS unavailable")
+        return f"{lang}:{text}".encode("utf-8")
+    
+    bank = PhraseBank(["Yes? How can I help you?", "Goodbye!", "Goodbye!", "broken"], synthesize=fake_synthesize)
+    assert bank.get("Goodbye!") is None
+    bank.render(wait=True)
+    print(f"Banked {len(bank)} phrases")
+    assert bank.get("Yes? How can I help you?") == b"en:Yes? How can I help you?"
+    assert bank.get("broken") is None and bank.get("Something else") is None
+    assert sorted(calls) == sorted(["Yes? How can I help you?", "Goodbye!", "broken"])
+
+def test_response_cache():
+    """Test query normalization, TTL expiry and SQLite persistence"""
+    print("\n🗄️ Testing Response Cache:")
+    assert normalize_query("Hey Orion, what is Python?") == normalize_query("what is python")
+    # Only politeness is dropped: different questions keep different keys
+    for first, second in [("what can you do", "what would you do"), ("tell me about you", "tell me about me"),
+                          ("who is the president", "who is a president")]:
+        assert normalize_query(first) != normalize_query(second), (first, second)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        db_path = os.path.join(cache_dir, "responses.db")
+        cache = ResponseCache(max_entries=2, ttls={"wikipedia": 60, "gemini": 0.05}, db_path=db_path)
+        answer, status = cache.cached("wikipedia", "What is Python?", lambda q: "A language.")
+        assert (answer, status) == ("A language.", "miss")
+        assert cache.cached("wikipedia", "please what is python", lambda q: "other")[1] == "hit"
+        cache.put("wikipedia", "what can you do", "I can answer questions.")
+        assert cache.get("wikipedia", "what would you do") is None
+
+        cache.put("gemini", "capital of france", "Paris.")
+        time.sleep(0.1)
+        assert cache.get("gemini", "capital of france") is None
+
+        # Entries survive a restart through the SQLite file
+        restarted = ResponseCache(ttls={"wikipedia": 60}, db_path=db_path)
+        assert restarted.get("wikipedia", "what is python") == "A language."
+        print(f"Cache stats: {cache.stats()}")
+
+def test_knowledge_store():
+    """Test the offline Wikipedia store loads a dump and answers locally"""
+    print("\n📖 Testing Offline Knowledge Store:")
+    with tempfile.TemporaryDirectory() as store_dir:
+        dump_path = os.path.join(store_dir, "dump.jsonl")
+        with open(dump_path, "w", encoding="utf-8") as dump:
+            dump.write('{"title": "Python (programming language)", "summary": "Python is a programming language. It is popular. It is old."}\n')
+            dump.write('{"title": "Python", "summary": "Python is a genus of snakes."}\n')
+            dump.write("Paris\tParis is the capital of France.\n")
+
+        store = KnowledgeStore(os.path.join(store_dir, "knowledge.db"))
+        assert store.load_dump(dump_path) == 3
+        assert store.lookup("what is python") == "Python is a genus of snakes."
+        assert store.lookup("python programming language") == "Python is a programming language. It is popular."
+        assert store.lookup("tell me about Paris") == "Paris is the capital of France."
+        assert store.lookup("quantum chromodynamics") is None
+        print(f"Articles stored: {store.count()}")
+
+def test_song_search():
+    """Test fuzzy song lookup tolerates speech-recognition errors"""
+    print("\n🎵 Testing Song Search:")
+    spoken = {
+        "blinding lights": "blinding_lights",
+        "blinding light": "blinding_lights",
+        "believe her": "believer",
+        "good for you": "good_4_u",
+        "stairway to heaven": "stairway_to_heaven",
+    }
+    for query, expected in spoken.items():
+        match = musiclibrary.find_song(query)
+        print(f"{query} -> {match.name if match else None}")
+        assert match is not None and match.key == expected
+    assert musiclibrary.find_song("qqq zzz xxx") is None
+    
+    # Ranking: the exact title first, then near spellings; unrelated titles never match
+    index = SongIndex({key: f"https://example.com/{key}" for key in
+                       ["love_story", "love_stories", "love_me_like_you_do", "lover", "without_me"]})
+    ranked = index.search("love story", limit=5)
+    print(f"love story -> {[(match.key, match.score) for match in ranked]}")
+    assert [match.key for match in ranked] == ["love_story", "love_stories"]
+    assert ranked[0].score == 1.0 > ranked[1].score
+    assert [match.key for match in index.search("love story", limit=1)] == ["love_story"]
+    assert index.best_match("lov story").key == "love_story"
+    
+    # Scale: lookups stay fast and accurate on a 100k-song library
+    results = bench_song_lookup(sizes=(100000,), queries=30)["100000"]
+    print(f"100k songs: build {results['build_ms']:.0f} ms, "
+          f"misspelled p99 {results['misspelled']['p99_ms']:.1f} ms")
+    # Synthetic titles share a small vocabulary, so some slips are genuinely ambiguous
+    assert results["exact"]["hit_rate"] == 1.0 and results["misspelled"]["hit_rate"] >= 0.5
+    assert results["missing"]["hit_rate"] == 1.0
+    for kind in ("exact", "misspelled", "missing"):
+        assert results[kind]["p99_ms"] < 100, (kind, results[kind])
+
+def test_song_resolution_cache():
+    """Test storing, looking up, promoting and reloading Gemini song resolutions"""
+    print("\n💾 Testing Song Resolution Cache:")
+    saved = (dict(musiclibrary.music), musiclibrary.index, musiclibrary.version)
+    url = "https://www.youtube.com/watch?v=zABLecsR5UE"
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            db_path = os.path.join(cache_dir, "songs.db")
+            cache = SongResolutionCache(db_path=db_path, promote_after=2)
+            assert cache.lookup("Lose You To Love Me") is None
+            cache.store("Lose You To Love Me", url)
+            cache.store("some obscure demo", "https://www.youtube.com/results?search_query=some+obscure+demo")
+            
+            # Spoken aliases find the same resolution; keys keep the title's own words
+            first = cache.lookup("lose u 2 love me")
+            assert first['url'] == url and first['key'] == "lose_you_to_love_me" and not first['promoted']
+            assert cache.lookup("some obscure demo")['confidence'] < cache.promote_min_confidence
+            
+            second = cache.lookup("Lose you to love me")
+            assert second['hits'] == 2 and second['promoted']
+            match = musiclibrary.find_song("lose you to love me")
+            print(f"Promoted: {match.key} ({match.name})")
+            assert match.key == "lose_you_to_love_me" and match.name == "Lose You To Love Me"
+            assert cache.lookup("some obscure demo")['promoted'] is False
+            assert cache.stats() == {'resolutions': 2, 'promoted': 1}
+            
+            # A restart (fresh library) reloads promoted songs from the database
+            musiclibrary.music.pop("lose_you_to_love_me")
+            musiclibrary.index = SongIndex(musiclibrary.music)
+            reloaded = SongResolutionCache(db_path=db_path)
+            assert reloaded.restore_promoted() == 1
+            assert musiclibrary.get_song_url("lose_you_to_love_me") == url
+    finally:
+        music, musiclibrary.index, musiclibrary.version = saved
+        musiclibrary.music.clear()
+        musiclibrary.music.update(music)
+
+def test_songs_api():
+    """Test /api/songs caching headers, gzip and invalidation, and /api/songs/search"""
+    print("\n🎶 Testing Songs API:")
+    import gzip
+    import app
+
+    client = app.app.test_client()
+    # The fakes point the song resolution cache at a temporary directory
+    with FakeBackends():
+        saved = (dict(musiclibrary.music), musiclibrary.index, musiclibrary.version)
+        try:
+            plain = client.get('/api/songs')
+            etag = plain.headers['ETag']
+            songs = plain.get_json()['songs']
+            print(f"{len(songs)} songs, ETag {etag}")
+            assert 'Content-Encoding' not in plain.headers and plain.headers['Vary'] == 'Accept-Encoding'
+            assert {'name': 'Blinding Lights', 'key': 'blinding_lights', 'url': musiclibrary.music['blinding_lights']} in songs
+
+            compressed = client.get('/api/songs', headers={'Accept-Encoding': 'gzip, deflate'})
+            assert compressed.headers['Content-Encoding'] == 'gzip' and compressed.headers['ETag'] != etag
+            assert gzip.decompress(compressed.get_data()) == plain.get_data()
+            # Each encoding validates only against its own ETag
+            gz_etag = compressed.headers['ETag']
+            assert client.get('/api/songs', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gz_etag}).status_code == 304
+            assert client.get('/api/songs', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 200
+            assert client.get('/api/songs', headers={'If-None-Match': gz_etag}).status_code == 200
+
+            cached = client.get('/api/songs', headers={'If-None-Match': etag})
+            assert cached.status_code == 304 and cached.get_data() == b'' and cached.headers['ETag'] == etag
+
+            # Adding a song bumps musiclibrary.version, which rebuilds the payload
+            musiclibrary.add_song("brand new tune", "https://www.youtube.com/watch?v=brandnewtune")
+            changed = client.get('/api/songs', headers={'If-None-Match': etag})
+            assert changed.status_code == 200 and changed.headers['ETag'] != etag
+            assert 'brand_new_tune' in [song['key'] for song in changed.get_json()['songs']]
+
+            # Search ranks the closest title first and honours limit
+            musiclibrary.add_song("blinding lights remix", "https://www.youtube.com/watch?v=blindingremix")
+            results = client.get('/api/songs/search?q=blinding+lights').get_json()['songs']
+            print(f"blinding lights -> {[(song['key'], song['score']) for song in results]}")
+            assert [song['key'] for song in results] == ['blinding_lights', 'blinding_lights_remix']
+            assert results[0]['score'] == 1.0 > results[1]['score'] and set(results[0]) == {'key', 'name', 'url', 'score'}
+            for limit, count in (("1", 1), ("0", 1), ("50", 2)):
+                found = client.get(f'/api/songs/search?q=blinding+lights&limit={limit}').get_json()['songs']
+                assert [song['key'] for song in found] == ['blinding_lights', 'blinding_lights_remix'][:count]
+            assert client.get('/api/songs/search?q=blindin+light&limit=1').get_json()['songs'][0]['key'] == 'blinding_lights'
+        finally:
+            music, musiclibrary.index, musiclibrary.version = saved
+            musiclibrary.music.clear()
+            musiclibrary.music.update(music)
+        assert client.get('/api/songs/search?q=+').status_code == 400
+
+def test_intent_router():
+    """Test command classification and slot extraction"""
+    print("\n🧭 Testing Intent Router:")
+    expected = {
+        "what time is it": ("time", {}),
+        "what time does the store open": ("general", {}),
+        "what is the weather today": ("general", {}),
+        "what is 5 plus 3": ("calculate", {"expression": "5 plus 3"}),
+        "open youtube": ("open_site", {"site": "youtube"}),
+        "open github.com": ("open_site", {"site": "github.com"}),
+        "play Blinding Lights": ("play", {"song": "blinding lights"}),
+        "bye": ("exit", {}),
+        "okay bye orion": ("exit", {}),
+        "how do i exit vim": ("general", {}),
+        "bye bye love song": ("general", {}),
+        "exit the matrix movie summary": ("general", {}),
+        "whats the time": ("time", {}),
+        "whats the date": ("date", {}),
+        "what is the date today": ("date", {}),
+        "what is the date of the moon landing": ("general", {}),
+        # Only expressions the calculator can parse are calculations
+        "what is two plus two": ("calculate", {"expression": "two plus two"}),
+        "whats 10 % 3": ("calculate", {"expression": "10 % 3"}),
+        "calculate 10 / 0": ("calculate", {"expression": "10 / 0"}),
+        "what is ps5 power consumption": ("general", {}),
+        "what is the best minecraft 1.20 mod": ("general", {}),
+        "what is covid-19": ("general", {}),
+        "calculate my taxes": ("general", {}),
+    }
+    for command, (name, slots) in expected.items():
+        intent = classify(command)
+        print(f"{command} -> {intent.name} {intent.slots}")
+        assert (intent.name, intent.slots) == (name, slots)
+
+    # Higher priority wins regardless of registration order
+    router = IntentRouter()
+    router.register("weather", r"\bweather in (?P<city>\w+)", priority=1)
+    router.register("news", r"\bnews\b", priority=5)
+    assert router.classify("news and weather in paris").name == "news"
+    assert router.classify("weather in paris").slots == {"city": "paris"}
+    # A match its check rejects falls through to the next intent
+    router.register("news_topic", r"\bnews about (?P<topic>\w+)", priority=10,
+                    accept=lambda slots: slots["topic"] != "nothing")
+    assert router.classify("news about nothing").name == "news"
+    assert router.classify("news about paris").slots == {"topic": "paris"}
+    # Patterns only run for commands containing one of the intent's keywords
+    router.register("alarm", r"\b(?:wake me|alarm) at (?P<time>\d+)", priority=20, keywords=("alarm", "wake"))
+    assert router.classify("wake me at 7").slots == {"time": "7"}
+    router.register("timer", r"\bset a \w+ for (?P<minutes>\d+)", priority=30, keywords=("timer",))
+    assert router.classify("set a timer for 5").name == "timer"
+    assert router.classify("set a reminder for 5").name == "general"
+
+def test_answer_race():
+    """Test hedged Gemini/Wikipedia answer selection"""
+    print("\n🏁 Testing Answer Race:")
+
+    def backend(answer, delay=0.0, error=None):
+        def fetch():
+            time.sleep(delay)
+            if error:
+                raise error
+            return answer, "miss"
+        return fetch
 
+    def failing_gemini():
+        return backend(None, 0.3, RuntimeError("timeout"))
+
+    # A failing preferred backend hands over to the hedge immediately
+    result = answer_race.race(
+        [("gemini", failing_gemini()), ("wikipedia", backend("wiki answer", 0.05))],
+        strategy="hedged", deadline=2, hedge_delay=5,
+    )
+    print(f"hedged: {result.backend} in {result.elapsed:.2f}s")
+    assert result.backend == "wikipedia" and result.elapsed < 1
+
+    # In parallel mode the fallback is already done when Gemini fails
+    result = answer_race.race(
+        [("gemini", failing_gemini()), ("wikipedia", backend("wiki answer", 0.05))],
+        strategy="parallel", deadline=2,
+    )
+    assert result.backend == "wikipedia" and result.elapsed < 0.4
+
+    # Gemini is preferred even when Wikipedia answers first
+    result = answer_race.race(
+        [("gemini", backend("gemini answer", 0.2)), ("wikipedia", backend("wiki answer"))],
+        strategy="parallel", deadline=2,
+    )
+    assert (result.answer, result.backend) == ("gemini answer", "gemini")
+
+    # The deadline returns the best answer so far
+    result = answer_race.race(
+        [("gemini", backend("late", 1.0)), ("wikipedia", backend("wiki answer", 0.05))],
+        strategy="parallel", deadline=0.3,
+    )
+    assert result.backend == "wikipedia" and result.errors["gemini"] == "deadline exceeded"
+
+    result = answer_race.race([("gemini", backend("late", 1.0))], deadline=0.1)
+    assert result.answer is None
+    
+    # Waiting hedges hold no pool thread: more of them than workers don't block a race
+    started_calls = []
+    waiting = [answer_race.HedgedCall(lambda: started_calls.append(1) or ("hedge", "miss"), None)
+               for _ in range(config.ANSWER_RACE_WORKERS + 8)]
+    result = answer_race.race([("gemini", backend("quick"))], strategy="sequential", deadline=1)
+    assert result.answer == "quick" and result.elapsed < 0.5
+    for call in waiting:
+        call.cancel()
+    assert all(call.future.cancelled() for call in waiting) and not started_calls
+    
+    timed_call = answer_race.HedgedCall(backend("timed"), 0.1)
+    assert not timed_call.future.done()
+    assert timed_call.future.result(timeout=1) == ("timed", "miss")
+    
+    # Backend timeouts are cut to what is left of the deadline
+    assert 0.4 < answer_race.capped_timeout(10, time.monotonic() - 7.5, deadline=8) <= 0.5
+    assert answer_race.capped_timeout(3, time.monotonic(), deadline=8) == 3
+
+def test_sessions():
+    """Test per-session ring-buffer history and session eviction"""
+    print("\n👥 Testing Sessions:")
+    store = SessionStore(MemoryStateStore(history_size=3, max_sessions=2, idle_timeout=60))
+    first_id, first, created = store.resolve(None)
+    assert created
+    assert not store.resolve(first_id)[2]
+    for i in range(5):
+        first.record(f"command {i}", f"response {i}")
+    assert [entry['command'] for entry in first.get_history()] == ["command 2", "command 3", "command 4"]
+
+    second_id, second, _ = store.resolve("unknown-id")
+    assert second_id != first_id and second.get_history() == []
+    store.resolve(None)
+    # The least recently used session is dropped past max_sessions
+    assert len(store) == 2 and store.resolve(first_id)[2]
+
+    store.backend.idle_timeout = 0
+    time.sleep(0.01)
+    store.resolve(None)
+    print(f"Session stats: {store.stats()}")
+    assert len(store) == 1
+
+    # The cookie's Max-Age is refreshed on every request, matching the sliding idle timeout
+    import app
+    client = app.app.test_client()
+    created = client.post('/api/process', json={'command': 'what time is it'}).headers['Set-Cookie']
+    refreshed = client.get('/api/history').headers['Set-Cookie']
+    session_id = created.split(';')[0]
+    assert refreshed.split(';')[0] == session_id
+    assert f"Max-Age={config.SESSION_IDLE_TIMEOUT}" in refreshed
+    
+    history = CommandHistory(max_size=2)
+    for command in ("a", "b", "c"):
+        history.add(command)
+    assert [item["command"] for item in history.get_recent()] == ["b", "c"]
+
+def test_state_backends():
+    """Test that shared backends give every worker the same history"""
+    print("\n🗄️ Testing State Backends:")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "state.db")
+        kv = LocalKV()
+        # Two store instances per backend stand in for two worker processes
+        memory = MemoryStateStore(history_size=3)
+        pairs = {
+            "memory": (memory, memory),
+            "sqlite": (SQLiteStateStore(db_path, history_size=3), SQLiteStateStore(db_path, history_size=3)),
+            "kv": (KVStateStore(kv, history_size=3), KVStateStore(kv, history_size=3)),
+        }
+        kv.set("unrelated", "x")
+        for name, (worker_a, worker_b) in pairs.items():
+            sessions_before = len(SessionStore(worker_b))
+            session_id, session, _ = SessionStore(worker_a).resolve(None)
+            # Only sessions count, not history lists or other keys
+            assert len(SessionStore(worker_b)) == worker_b.stats()['sessions'] == sessions_before + 1
+            for i in range(4):
+                session.record(f"command {i}", f"response {i}")
+
+            other_id, other, created = SessionStore(worker_b).resolve(session_id)
+            commands = [entry['command'] for entry in other.get_history()]
+            print(f"{name}: {commands}")
+            assert other_id == session_id and not created
+            assert commands == ["command 1", "command 2", "command 3"]
+
+            # Incremental reads by monotonic id, and a version that tracks changes
+            ids = [entry['id'] for entry in other.get_history()]
+            assert ids == sorted(ids)
+            assert [e['command'] for e in other.get_history(since=ids[0], limit=1)] == ["command 2"]
+            assert other.get_history(since=ids[-1]) == []
+            version = other.version()
+            assert session.version() == version
+            session.record("command 4", "response 4")
+            assert other.version() != version
+
+            # A batch lands in one step with consecutive ids
+            batch = session.record_many([("batch 1", "r"), ("batch 2", "r")])
+            assert batch[1]['id'] == batch[0]['id'] + 1
+            assert [e['command'] for e in other.get_history()][-2:] == ["batch 1", "batch 2"]
+
+            other.clear()
+            assert session.get_history() == []
+            assert SessionStore(worker_b).resolve("missing")[2]
+
+        # Concurrent writers: list order matches id order, so paging by since misses nothing
+        session_id, session, _ = SessionStore(KVStateStore(kv, history_size=100)).resolve(None)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda i: session.record_many([(f"c{i}a", "r"), (f"c{i}b", "r")]), range(20)))
+        ids, since = [], 0
+        while True:
+            page = session.get_history(since, limit=7)
+            if not page:
+                break
+            ids += [entry['id'] for entry in page]
+            since = page[-1]['id']
+        assert ids == list(range(1, 41))
+
+def test_history_api():
+    """Test /api/history paging with since/limit and per-page ETags"""
+    print("\n📜 Testing History API:")
+    import app
+
+    client = app.app.test_client()
+    for i in range(5):
+        client.post('/api/process', json={'command': f'what is {i} plus 1'})
+    everything = client.get('/api/history').get_json()
+    ids = [entry['id'] for entry in everything['history']]
+    assert len(ids) == 5 and not everything['has_more'] and everything['next_since'] == ids[-1]
+
+    first = client.get('/api/history?limit=2')
+    page = first.get_json()
+    assert [entry['id'] for entry in page['history']] == ids[:2] and page['has_more']
+    second = client.get(f"/api/history?since={page['next_since']}&limit=2").get_json()
+    assert [entry['id'] for entry in second['history']] == ids[2:4] and second['has_more']
+    last = client.get(f"/api/history?since={second['next_since']}&limit=2").get_json()
+    assert [entry['id'] for entry in last['history']] == ids[4:] and not last['has_more']
+    empty = client.get(f"/api/history?since={ids[-1]}").get_json()
+    assert empty == {'history': [], 'next_since': ids[-1], 'has_more': False}
+
+    # Unchanged history gets a 304, but only for the same page
+    etag = first.headers['ETag']
+    print(f"ETag: {etag}")
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/history?limit=2', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/history?limit=3', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get(f'/api/history?since={ids[0]}&limit=2', headers={'If-None-Match': etag}).status_code == 200
+    client.post('/api/process', json={'command': 'what time is it'})
+    changed = client.get('/api/history?limit=2', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+def test_metrics():
+    """Test Prometheus text rendering of counters and histograms"""
+    print("\n📈 Testing Metrics:")
+    registry = metrics.Registry()
+    requests_total = registry.register(metrics.Counter("test_requests_total", "Requests", ["intent"]))
+    latency = registry.register(metrics.Histogram("test_latency_seconds", "Latency", ["intent"], buckets=(0.1, 1.0)))
+    requests_total.inc("time")
+    requests_total.inc("time")
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, "time")
+    registry.add_collector(lambda: [("test_ratio", "gauge", "Ratio", [({"cache": "tts"}, 0.5)])])
+    text = registry.render()
+    print(text)
+    assert 'test_requests_total{intent="time"} 2' in text
+    assert 'test_latency_seconds_bucket{intent="time",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{intent="time",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{intent="time",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{intent="time"} 3' in text
+    assert 'test_ratio{cache="tts"} 0.5' in text
+
+def metric_value(text, sample):
+    """Return the value of one exposition line such as 'name{labels}', or 0 if absent"""
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_metrics_endpoint():
+    """Test that /metrics exposes per-intent, per-backend and cache series after real requests"""
+    print("\n📊 Testing Metrics Endpoint:")
+    import app
+
+    client = app.app.test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}):
+        client.post('/api/process', json={'command': 'what time is it'})
+        client.post('/api/process', json={'command': 'what is the tallest mountain'})
+        client.post('/api/process', json={'command': 'what is the tallest mountain'})
+    with FakeBackends(latency={"gemini": 0, "wikipedia": 0}, failing=("gemini",)):
+        client.post('/api/process', json={'command': 'who painted the mona lisa'})
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+
+    def added(sample):
+        return metric_value(text, sample) - metric_value(before, sample)
+
+    # Local intents are labelled by intent, general questions by the backend that answered
+    assert added('orion_commands_total{intent="time"}') == 1
+    assert added('orion_commands_total{intent="gemini"}') == 2
+    assert added('orion_commands_total{intent="wikipedia"}') == 1
+    assert added('orion_command_duration_seconds_count{intent="gemini"}') == 2
+    assert 'orion_command_duration_seconds_bucket{intent="wikipedia",le="+Inf"}' in text
+    assert added('orion_http_requests_total{endpoint="/api/process",status="200"}') == 4
+    for name in ("orion_backend_calls_total", "orion_backend_duration_seconds", "orion_backend_calls_in_flight"):
+        assert f"# TYPE {name} " in text
+
+    # Scrape-time cache and session series
+    assert re.search(r'^orion_cache_hit_ratio\{cache="gemini"\} [0-9.]+$', text, re.M)
+    assert re.search(r'^orion_cache_hit_ratio\{cache="tts"\} [0-9.]+$', text, re.M)
+    assert added('orion_cache_hits_total{cache="gemini"}') >= 1
+    assert re.search(r'^orion_sessions\{backend="memory"\} [0-9]+$', text, re.M)
+    print('\n'.join(line for line in text.splitlines() if line.startswith('orion_commands_total')))
+
+def test_tracing():
+    """Test spans, Server-Timing output and context propagation into threads"""
+    print("\n⏱️ Testing Tracing:")
+    def worker():
+        with tracing.span("worker"):
+            pass
+    
+    trace = tracing.Trace("req-1", "test")
+    tracing.activate(trace)
+    try:
+        with tracing.span("route"):
+            pass
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(tracing.wrap(worker)).result()
+        with tracing.span("route"):
+            pass
+    finally:
+        tracing.activate(None)
+    with tracing.span("untraced"):
+        pass
+    header = trace.server_timing()
+    print(header)
+    assert [name for name, _, _ in trace.spans] == ["route", "worker", "route"]
+    assert header.startswith("route;dur=") and "worker;dur=" in header and "total;dur=" in header
+    assert header.count("route;") == 1
+    assert tracing.new_request_id("abc-123") == "abc-123"
+    assert tracing.new_request_id("bad id\n") != "bad id\n"
+
+def test_tracing_headers():
+    """Test X-Request-ID and Server-Timing headers on the Flask and native ASGI routes"""
+    print("\n🏷️ Testing Tracing Headers:")
+    import asyncio
+    import httpx
+    import app
+    import asgi
+
+    def span_names(header):
+        return [part.split(";")[0] for part in header.split(", ")]
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://orion.test") as client:
+            native = await client.post('/api/process', json={'command': 'what is 2 plus 2'},
+                                       headers={'X-Request-ID': 'asgi-req-1'})
+            generated = await client.post('/api/process', json={'command': 'what time is it'})
+            delegated = await client.get('/api/history', headers={'X-Request-ID': 'asgi-req-2'})
+            with FakeBackends(latency={"gtts": 0}):
+                tts_stream = await client.post('/api/tts', json={'text': 'Hello there.', 'stream': True})
+            return native, generated, delegated, tts_stream
+
+    saved = config.TRACE_SAMPLE_RATE
+    config.TRACE_SAMPLE_RATE = 1.0
     try:
-        response = get_ai_response(test_query)
-        if response:
-            print(f"AI Response: {response}")
-        else:
-            print("❌ No AI response (Gemini client placeholder)")
-    except Exception as e:
-        print(f"Error: {e}")
+        client = app.app.test_client()
+        with FakeBackends(latency={"gemini": 0, "wikipedia": 0}):
+            flask_general = client.post('/api/process', json={'command': 'what is the longest river'},
+                                        headers={'X-Request-ID': 'flask-req-1'})
+        flask_local = client.post('/api/process', json={'command': 'what time is it'},
+                                  headers={'X-Request-ID': 'bad id!'})
+        before = metrics.registry.render()
+        native, generated, delegated, tts_stream = asyncio.run(run())
+        tts_requests = (metric_value(metrics.registry.render(), 'orion_http_requests_total{endpoint="/api/tts",status="200"}')
+                        - metric_value(before, 'orion_http_requests_total{endpoint="/api/tts",status="200"}'))
+        config.TRACE_SAMPLE_RATE = 0.0
+        unsampled = client.get('/api/history')
+    finally:
+        config.TRACE_SAMPLE_RATE = saved
+
+    print(f"Flask Server-Timing: {flask_general.headers['Server-Timing']}")
+    assert flask_general.headers['X-Request-ID'] == 'flask-req-1'
+    names = span_names(flask_general.headers['Server-Timing'])
+    assert names[-1] == 'total' and {'route', 'general', 'history', 'serialize'} <= set(names)
+    # Unsafe incoming ids are replaced rather than echoed
+    assert flask_local.headers['X-Request-ID'] not in ('bad id!', '')
+    assert 'time' in span_names(flask_local.headers['Server-Timing'])
+
+    print(f"ASGI Server-Timing: {native.headers['server-timing']}")
+    assert native.headers['x-request-id'] == 'asgi-req-1'
+    assert {'route', 'calculate', 'history', 'total'} <= set(span_names(native.headers['server-timing']))
+    assert len(generated.headers['x-request-id']) == 32 and 'server-timing' in generated.headers
+    assert delegated.headers['x-request-id'] == 'asgi-req-2' and 'server-timing' in delegated.headers
+    # Streaming TTS is handed to Flask whole, so it is traced and counted once
+    assert tts_stream.status_code == 200
+    assert len(tts_stream.headers.get_list('x-request-id')) == 1
+    assert len(tts_stream.headers.get_list('server-timing')) == 1 and tts_requests == 1
+
+    # Unsampled requests still carry an id but no timing
+    assert unsampled.headers['X-Request-ID'] and 'Server-Timing' not in unsampled.headers
+
+class FakeMicrophone(sr.AudioSource):
+    """Audio source playing (seconds, amplitude) segments in real time"""
+    
+    def __init__(self, script):
+        self.SAMPLE_RATE, self.SAMPLE_WIDTH, self.CHUNK = 16000, 2, 1024
+        self.script = list(script)
+        self.stream = None
+        self.amplitude = 0  # of the segment the last read came from
+    
+    def __enter__(self):
+        self.stream = self
+        return self
+    
+    def __exit__(self, *exc):
+        self.stream = None
+    
+    def read(self, frames):
+        time.sleep(frames / self.SAMPLE_RATE)
+        while self.script and self.script[0][0] <= 0:
+            self.script.pop(0)
+        amplitude = 0
+        if self.script:
+            seconds, amplitude = self.script[0]
+            self.script[0] = (seconds - frames / self.SAMPLE_RATE, amplitude)
+        self.amplitude = amplitude
+        return struct.pack(f"<{frames}h", *([amplitude, -amplitude] * (frames // 2)))
+
+def test_listener():
+    """Test that one open microphone yields phrases and speech during muted() is dropped"""
+    print("\n🎤 Testing Listener:")
+    assert split_wake_word("Orion, play believer") == (True, "play believer")
+    assert split_wake_word("orion") == (True, "")
+    assert split_wake_word("hello there") == (False, "")
+    
+    opened = []
+    # Calibration, a phrase while muted, then a louder phrase after unmuting
+    script = [(0.2, 50), (0.4, 3000), (0.6, 50), (0.4, 6000), (1.0, 40)]
+    recognizer = sr.Recognizer()
+    recognizer.pause_threshold, recognizer.non_speaking_duration = 0.2, 0.1
+    
+    def microphone():
+        opened.append(True)
+        return FakeMicrophone(script)
+    
+    def recognize(audio):
+        samples = struct.unpack(f"<{len(audio.frame_data) // 2}h", audio.frame_data)
+        return "play believer" if max(samples) > 5000 else "this is orion talking"
+    
+    ambient_duration = config.AMBIENT_NOISE_DURATION
+    config.AMBIENT_NOISE_DURATION = 0.2
+    listener = Listener(recognizer, source_factory=microphone, recognize=recognize)
+    try:
+        with listener.muted():
+            listener.start()
+            time.sleep(0.8)
+        heard = listener.heard.get(timeout=5)
+    finally:
+        listener.stop(timeout=2)
+        config.AMBIENT_NOISE_DURATION = ambient_duration
+    print(f"Heard: {heard.text}")
+    assert heard.text == "play believer" and listener.heard.empty()
+    assert len(opened) == 1
+
+def test_speaker():
+    """Test that say() doesn't block and interrupt() cuts playback and drops the queue"""
+    print("\n🔈 Testing Speaker:")
+    played, cut = [], []
+    playing, release = threading.Event(), threading.Event()
+    
+    def play(audio, stopped):
+        playing.set()
+        # Each sentence plays until the test releases it or it is interrupted
+        while not release.wait(0.01):
+            if stopped():
+                cut.append(audio)
+                return
+        played.append(audio)
+    
+    def segments(text, lang):
+        return [sentence.encode("utf-8") for sentence in text.split(". ")]
+    
+    speaker = Speaker(play=play, segments=segments)
+    caller = threading.Thread(target=lambda: (speaker.say("One. Two"), speaker.say("Three")))
+    caller.start()
+    caller.join(timeout=5)
+    # say() returned while the first sentence is still playing
+    assert not caller.is_alive() and playing.wait(timeout=5) and speaker.busy and played == []
+    release.set()
+    assert speaker.wait(timeout=5)
+    assert played == [b"One", b"Two", b"Three"]
+    
+    playing.clear()
+    release.clear()
+    speaker.say("Long answer. Still going. And more")
+    speaker.say("Queued")
+    assert playing.wait(timeout=5)
+    speaker.interrupt()
+    assert speaker.wait(timeout=5) and not speaker.busy
+    print(f"Played {played}, cut {cut}")
+    assert cut == [b"Long answer"] and played == [b"One", b"Two", b"Three"]
+
+def test_barge_in():
+    """Test that talking over Orion's echo triggers barge-in and reaches recognition"""
+    print("\n✋ Testing Barge-In:")
+    # Calibration, Orion's echo alone, the user talking over it, echo, silence
+    script = [(0.2, 50), (0.8, 800), (0.5, 6000), (0.4, 800), (1.0, 40)]
+    microphones, barge_ins = [], []
+    barged = threading.Event()
+    recognizer = sr.Recognizer()
+    recognizer.pause_threshold, recognizer.non_speaking_duration = 0.2, 0.1
+    
+    def microphone():
+        microphones.append(FakeMicrophone(script))
+        return microphones[-1]
+    
+    def on_barge_in():
+        # What the microphone was playing, rather than when, so a slow machine can't fail this
+        barge_ins.append(microphones[-1].amplitude)
+        barged.set()
+    
+    ambient_duration = config.AMBIENT_NOISE_DURATION
+    config.AMBIENT_NOISE_DURATION = 0.2
+    listener = Listener(recognizer, source_factory=microphone,
+                        recognize=lambda audio: "orion stop", on_barge_in=on_barge_in)
+    try:
+        listener.start()
+        assert listener.ready.wait(timeout=5)
+        with listener.muted():
+            assert barged.wait(timeout=10)
+        heard = listener.heard.get(timeout=10)
+    finally:
+        listener.stop(timeout=5)
+        config.AMBIENT_NOISE_DURATION = ambient_duration
+    print(f"Barge-in at amplitude {barge_ins}, heard: {heard.text}")
+    # The echo alone must not trigger; the user's speech must
+    assert barge_ins == [6000]
+    assert heard.text == "orion stop"
+
+# Formant pairs (Hz) for synthetic vowels
+VOWEL_FORMANTS = {"o": (500, 900), "i": (300, 2300), "a": (750, 1200), "e": (450, 1900), "u": (320, 800)}
+
+def synthetic_word(vowels, pitch=140, speed=1.0, level=0.3, seed=0):
+    """Return 16 kHz samples of a voiced, vowel-only 'word' between pauses"""
+    rng = np.random.default_rng(seed)
+    parts = [np.zeros(8000)]
+    for vowel, seconds in vowels:
+        t = np.arange(int(seconds / speed * 16000)) / 16000
+        phase = 2 * np.pi * np.cumsum(pitch * (1 + 0.05 * np.sin(6 * np.pi * t))) / 16000
+        first, second = VOWEL_FORMANTS[vowel]
+        harmonics = np.arange(1, int(3800 / pitch))[:, None]
+        gains = (np.exp(-((harmonics * pitch - first) / 150) ** 2)
+                 + 0.6 * np.exp(-((harmonics * pitch - second) / 200) ** 2) + 0.02)
+        voiced = (gains * np.sin(harmonics * phase)).sum(axis=0)
+        parts += [voiced * np.sin(np.pi * np.linspace(0, 1, len(t))) ** 0.5, np.zeros(640)]
+    parts.append(np.zeros(9600))
+    samples = np.concatenate(parts)
+    return level * samples / np.abs(samples).max() + 0.003 * rng.standard_normal(len(samples))
+
+def test_wake_filter():
+    """Test VAD and keyword spotting false-accept/false-reject rates on WAV fixtures"""
+    print("\n👂 Testing Wake-Word Filter:")
+    orion = [("o", 0.18), ("i", 0.12), ("o", 0.22)]
+    rng = np.random.default_rng(5)
+    wake = [synthetic_word(orion, pitch, speed, level, seed)
+            for seed, (pitch, speed, level) in enumerate([(120, 1.0, 0.3), (160, 0.85, 0.5), (180, 1.2, 0.1), (140, 0.9, 0.05)])]
+    # "Orion, ..." followed by a command still counts
+    wake.append(np.concatenate([synthetic_word(orion, seed=9), synthetic_word([("e", 0.15), ("a", 0.2), ("i", 0.2)], seed=10)]))
+    other = [
+        0.002 * rng.standard_normal(32000),  # silence
+        0.2 * rng.standard_normal(32000),  # hiss
+        0.2 * np.sin(2 * np.pi * 60 * np.arange(32000) / 16000),  # mains hum
+        synthetic_word([("a", 0.2), ("e", 0.25)], seed=11),
+        synthetic_word([("u", 0.15), ("a", 0.3), ("e", 0.15), ("u", 0.2)], seed=12),
+    ]
+    
+    with tempfile.TemporaryDirectory() as fixtures:
+        for label, clips in (("wake", wake), ("other", other)):
+            os.makedirs(os.path.join(fixtures, label))
+            for i, samples in enumerate(clips):
+                write_wav(os.path.join(fixtures, label, f"{i}.wav"), samples)
+        
+        # VAD only: every clip with speech goes to the cloud
+        report = evaluate(WakeWordFilter(), fixtures)
+        print(f"VAD only: FAR {report['far']}, FRR {report['frr']}")
+        assert report['frr'] == 0 and report['false_accepts'] == 2
+        
+        wake_filter = WakeWordFilter()
+        wake_filter.enroll(synthetic_word(orion, seed=20))
+        wake_filter.enroll(synthetic_word(orion, pitch=200, speed=1.1, seed=21))
+        templates = os.path.join(fixtures, "templates.npz")
+        wake_filter.save(templates)
+        report = evaluate(WakeWordFilter.load(templates), fixtures)
+        print(f"With templates: FAR {report['far']}, FRR {report['frr']}, {report['ms_per_clip']} ms per clip")
+        assert report['far'] == 0 and report['frr'] == 0
 
 def test_configuration():
     """Test configuration settings"""
@@ -95,6 +1208,32 @@ def main():
     test_calculation()
     test_wikipedia()
     test_gemini()
+    test_gemini_token_limit()
+    test_process_stream()
+    test_asgi()
+    test_process_batch()
+    test_tts_cache()
+    test_tts_backends()
+    test_tts_streaming()
+    test_phrase_bank()
+    test_response_cache()
+    test_knowledge_store()
+    test_song_search()
+    test_song_resolution_cache()
+    test_songs_api()
+    test_intent_router()
+    test_answer_race()
+    test_sessions()
+    test_state_backends()
+    test_history_api()
+    test_metrics()
+    test_metrics_endpoint()
+    test_tracing()
+    test_tracing_headers()
+    test_listener()
+    test_speaker()
+    test_barge_in()
+    test_wake_filter()
     
     print("\n" + "="*50)
     print("✅ Testing Complete!")
@@ -0,0 +1,131 @@
+"""Lightweight per-request stage tracing for Orion Voice Assistant
+
+A request that is sampled (``config.TRACE_SAMPLE_RATE``) gets a Trace
+held in a context variable; ``span(name)`` blocks anywhere below it
+record how long each stage took. Unsampled requests pay for one context
+variable lookup per span and nothing else. Finished traces become a
+``Server-Timing`` header and, when ``config.TRACE_LOG_FILE`` is set, one
+JSON line per request tagged with its request id.
+
+Context variables don't follow work into thread pools on their own, so
+code that hands work to a thread uses ``wrap()`` to carry the trace along.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import config
+
+_current = contextvars.ContextVar("orion_trace", default=None)
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """Spans recorded for one request"""
+
+    def __init__(self, request_id, name=""):
+        self.request_id = request_id
+        self.name = name
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, start, duration):
+        # list.append is atomic, so spans from worker threads need no lock
+        self.spans.append((name, start - self.started, duration))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Return a Server-Timing header value; repeated stages are summed"""
+        totals = {}
+        for name, _, duration in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + duration
+        parts = [f"{name};dur={duration * 1000:.2f}" for name, duration in totals.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            'request_id': self.request_id,
+            'name': self.name,
+            'timestamp': self.timestamp,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            'spans': [
+                {'name': name, 'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+                for name, start, duration in list(self.spans)
+            ],
+        }
+
+
+class span:
+    """Context manager timing one stage of the current trace (no-op when untraced)"""
+
+    __slots__ = ('name', '_trace', '_start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._trace = _current.get()
+        if self._trace is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._trace is not None:
+            self._trace.add(self.name, self._start, time.perf_counter() - self._start)
+        return False
+
+
+def new_request_id(incoming=None):
+    """Reuse a sane incoming X-Request-ID or make a new one"""
+    if incoming and len(incoming) <= 64 and incoming.replace('-', '').isalnum():
+        return incoming
+    return uuid.uuid4().hex
+
+
+def start(request_id, name=""):
+    """Return a new Trace if this request is sampled, else None"""
+    if random.random() >= config.TRACE_SAMPLE_RATE:
+        return None
+    return Trace(request_id, name)
+
+
+def activate(trace):
+    """Make ``trace`` (or None) the current trace for this thread or task"""
+    _current.set(trace)
+
+
+def current():
+    return _current.get()
+
+
+def wrap(func):
+    """Bind ``func`` to a copy of the caller's context so spans in another thread join its trace
+
+    Each wrapped function must not run in two threads at once.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return run
+
+
+def finish(trace):
+    """Write a sampled trace as a JSON line if TRACE_LOG_FILE is set"""
+    if trace is None or not config.TRACE_LOG_FILE:
+        return
+    line = json.dumps(trace.to_dict())
+    directory = os.path.dirname(config.TRACE_LOG_FILE)
+    with _log_lock:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(config.TRACE_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
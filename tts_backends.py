@@ -0,0 +1,141 @@
+"""Text-to-speech engines for Orion Voice Assistant
+
+Every engine implements ``synthesize(text, lang) -> bytes`` and declares
+the audio ``format`` it produces. ``config.TTS_BACKEND`` picks the
+preferred engine and ``config.TTS_FALLBACK_BACKENDS`` the local ones that
+take over when it is slow or failing (see ``tts_cache.synthesize_speech``).
+
+* ``gtts``    - Google Translate TTS over the network (MP3)
+* ``espeak``  - espeak-ng / espeak command line, fully offline (WAV)
+* ``pyttsx3`` - the platform's speech engine via pyttsx3 (WAV); optional
+"""
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from gtts import gTTS
+
+import config
+from metrics import backend_call
+
+try:
+    import pyttsx3
+except ImportError:  # optional offline engine
+    pyttsx3 = None
+
+
+class TTSBackend:
+    """Base class for speech engines"""
+    name = None
+    format = "mp3"
+    network = False  # network engines are run under config.TTS_BACKEND_TIMEOUT
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS; natural voice, needs the network"""
+    name = "gtts"
+    format = "mp3"
+    network = True
+
+    def synthesize(self, text, lang):
+        audio_fp = io.BytesIO()
+        with backend_call(self.name):
+            gTTS(text, lang=lang).write_to_fp(audio_fp)
+        return audio_fp.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng (or espeak) subprocess writing WAV to stdout"""
+    name = "espeak"
+    format = "wav"
+
+    def __init__(self, executable=None):
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self):
+        return self.executable is not None
+
+    def synthesize(self, text, lang):
+        command = [self.executable, "--stdout", "-v", config.TTS_ESPEAK_VOICE or lang,
+                   "-s", str(config.TTS_LOCAL_RATE), text]
+        with backend_call(self.name):
+            return subprocess.run(command, capture_output=True, check=True, timeout=config.TTS_LOCAL_TIMEOUT).stdout
+
+
+class Pyttsx3Backend(TTSBackend):
+    """pyttsx3 (SAPI5, NSSpeechSynthesizer or espeak), rendered to a WAV file"""
+    name = "pyttsx3"
+    format = "wav"
+
+    def __init__(self):
+        self._engine = None
+        # pyttsx3 engines are not thread-safe
+        self._lock = threading.Lock()
+
+    def available(self):
+        return pyttsx3 is not None
+
+    def synthesize(self, text, lang):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self._lock, backend_call(self.name):
+                if self._engine is None:
+                    self._engine = pyttsx3.init()
+                    self._engine.setProperty("rate", config.TTS_LOCAL_RATE)
+                self._engine.save_to_file(text, path)
+                self._engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "espeak": EspeakBackend,
+    "pyttsx3": Pyttsx3Backend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name):
+    """Return the shared instance of a backend by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend {name!r}; expected one of {sorted(BACKENDS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
+
+
+def backend_chain(formats=None):
+    """Return the configured backends in preference order, skipping unavailable ones
+
+    ``formats`` limits the chain to engines producing one of those formats
+    (e.g. ("mp3",) where segments are concatenated into one stream).
+    """
+    names = [config.TTS_BACKEND] + [name for name in config.TTS_FALLBACK_BACKENDS if name != config.TTS_BACKEND]
+    chain = [get_backend(name) for name in dict.fromkeys(names)]
+    return [backend for backend in chain
+            if backend.available() and (formats is None or backend.format in formats)]
+
+
+def audio_format(audio):
+    """Return "wav" or "mp3" for synthesized audio bytes"""
+    return "wav" if audio[:4] == b"RIFF" else "mp3"
+
+
+def audio_mimetype(audio):
+    return "audio/wav" if audio_format(audio) == "wav" else "audio/mpeg"
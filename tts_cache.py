@@ -0,0 +1,372 @@
+"""Text-to-speech audio cache for Orion Voice Assistant
+
+Synthesized speech is keyed by (text, language, backend) and kept in two
+tiers: a small in-memory LRU for hot phrases and a size-bounded directory
+of audio files under ``config.TTS_CACHE_DIR`` that survives restarts and
+is shared by the console and web front-ends.
+
+``synthesize_speech`` walks the configured engines (see tts_backends.py)
+in order, so a slow or failing network engine falls back to a local one.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import config
+import tracing
+from tts_backends import audio_format, backend_chain
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different strings share a cache entry"""
+    return " ".join(text.split())
+
+
+class TTSCache:
+    """Two-tier (memory + disk) cache for synthesized speech audio"""
+
+    def __init__(self, cache_dir=None, max_memory_bytes=None, max_disk_bytes=None):
+        self.cache_dir = cache_dir or config.TTS_CACHE_DIR
+        self.max_memory_bytes = max_memory_bytes if max_memory_bytes is not None else config.TTS_CACHE_MEMORY_BYTES
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else config.TTS_CACHE_DISK_BYTES
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # computed lazily on first disk access
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, lang, backend="gtts"):
+        """Return the content address for a (text, language, backend) triple"""
+        payload = f"{backend}\0{lang}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key, fmt="mp3"):
+        return os.path.join(self.cache_dir, f"{key}.{fmt}")
+
+    def _remember(self, key, audio):
+        """Insert into the memory tier and evict least recently used entries"""
+        if len(audio) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _scan_disk(self):
+        """Return (path, size, mtime) for every cached file on disk"""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _disk_usage(self):
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+        return self._disk_bytes
+
+    def _evict_disk(self):
+        """Delete the least recently used files until the disk tier fits its budget"""
+        if self._disk_usage() <= self.max_disk_bytes:
+            return
+        entries = sorted(self._scan_disk(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def get(self, text, lang, backend="gtts", fmt="mp3", count_miss=True):
+        """Return cached audio bytes or None
+
+        Callers that try several backends for one request pass
+        ``count_miss=False`` and call ``record_miss()`` once themselves.
+        """
+        key = self.make_key(text, lang, backend)
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        path = self._path(key, fmt)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # mark as recently used for disk eviction
+        except OSError:
+            if count_miss:
+                self.record_miss()
+            return None
+
+        with self._lock:
+            self._remember(key, audio)
+            self.hits += 1
+            self.disk_hits += 1
+        return audio
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, text, lang, audio, backend="gtts"):
+        """Store audio bytes in both tiers"""
+        key = self.make_key(text, lang, backend)
+        with self._lock:
+            self._remember(key, audio)
+            self._disk_usage()
+
+        if len(audio) > self.max_disk_bytes:
+            return
+        path = self._path(key, audio_format(audio))
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"TTS Cache Error: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(audio)
+            self._evict_disk()
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_usage(),
+            }
+
+    def clear(self):
+        """Drop both tiers and reset counters"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path, _, _ in self._scan_disk():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+            self.hits = self.disk_hits = self.misses = 0
+
+
+# Shared cache instance used by main.py and app.py
+tts_cache = TTSCache()
+
+_executor = None
+_executor_lock = threading.Lock()
+_resting_until = {}  # network backend name -> monotonic time it may be tried again
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.TTS_BACKEND_WORKERS, thread_name_prefix="orion-tts")
+    return _executor
+
+
+def _synthesize_and_store(backend, text, lang):
+    """Synthesize and cache, so audio that arrives after a fallback answered is kept"""
+    audio = backend.synthesize(text, lang)
+    if audio and config.TTS_CACHE_ENABLED:
+        tts_cache.put(text, lang, audio, backend.name)
+    return audio
+
+
+def _synthesize_with(backend, text, lang, has_fallback):
+    """Run one backend; a network backend with a fallback behind it gets TTS_BACKEND_TIMEOUT"""
+    if not (backend.network and has_fallback):
+        return _synthesize_and_store(backend, text, lang)
+    future = _get_executor().submit(tracing.wrap(_synthesize_and_store), backend, text, lang)
+    try:
+        return future.result(timeout=config.TTS_BACKEND_TIMEOUT)
+    except FutureTimeoutError:
+        raise TimeoutError(f"no audio within {config.TTS_BACKEND_TIMEOUT}s") from None
+
+
+def synthesize_speech(text, lang=None, formats=None):
+    """Return audio bytes for text from the first configured backend that delivers
+
+    Backends are tried in preference order, each served from the cache
+    when possible. A network backend that fails or is slower than
+    TTS_BACKEND_TIMEOUT hands over to the next one and is skipped for
+    TTS_BACKEND_RETRY_AFTER seconds. ``formats`` restricts the engines by
+    output format (see ``tts_backends.backend_chain``).
+    """
+    lang = lang or config.TTS_LANGUAGE
+    chain = backend_chain(formats)
+    errors = []
+    # One request counts as at most one cache miss, however many backends it tries
+    cache_missed = False
+    for position, backend in enumerate(chain):
+        if config.TTS_CACHE_ENABLED:
+            audio = tts_cache.get(text, lang, backend.name, backend.format, count_miss=False)
+            if audio is not None:
+                return audio
+            cache_missed = True
+        has_fallback = position + 1 < len(chain)
+        if has_fallback and _resting_until.get(backend.name, 0) > time.monotonic():
+            continue
+        try:
+            audio = _synthesize_with(backend, text, lang, has_fallback)
+        except Exception as e:
+            errors.append(f"{backend.name}: {type(e).__name__}: {e}")
+            if backend.network and has_fallback:
+                print(f"TTS Fallback: {backend.name} failed ({type(e).__name__}), using local speech for "
+                      f"{config.TTS_BACKEND_RETRY_AFTER}s")
+                _resting_until[backend.name] = time.monotonic() + config.TTS_BACKEND_RETRY_AFTER
+            continue
+        if audio:
+            if cache_missed:
+                tts_cache.record_miss()
+            return audio
+        errors.append(f"{backend.name}: no audio")
+    if cache_missed:
+        tts_cache.record_miss()
+    raise RuntimeError("No TTS backend produced audio" + (f" ({'; '.join(errors)})" if errors else ""))
+
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def split_sentences(text, min_length=None):
+    """Split text into sentence-sized chunks for incremental synthesis
+
+    Fragments shorter than ``min_length`` are merged into the following
+    sentence so abbreviations and interjections don't become tiny requests.
+    """
+    min_length = config.TTS_STREAM_MIN_CHUNK if min_length is None else min_length
+    chunks = []
+    pending = ""
+    for sentence in _SENTENCE_BOUNDARY.split(normalize_text(text)):
+        pending = f"{pending} {sentence}".strip() if pending else sentence
+        if len(pending) >= min_length:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        if chunks and len(pending) < min_length:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+
+def iter_speech_segments(text, lang=None, workers=None, formats=None):
+    """Yield audio segments for each sentence of text, in order
+
+    Sentences are synthesized in parallel on a small thread pool but are
+    emitted strictly in order, so the first segment is available as soon
+    as the first sentence is ready regardless of the total text length.
+    Pass ``formats=("mp3",)`` when the segments are joined into one stream.
+    """
+    lang = lang or config.TTS_LANGUAGE
+    workers = workers or config.TTS_STREAM_WORKERS
+    sentences = split_sentences(text)
+    if not sentences:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(sentences)))
+    try:
+        futures = [executor.submit(tracing.wrap(synthesize_speech), sentence, lang, formats) for sentence in sentences]
+        for sentence, future in zip(sentences, futures):
+            try:
+                audio = future.result()
+            except Exception as e:
+                print(f"TTS Stream Error for '{sentence[:30]}...': {e}")
+                continue
+            if audio:
+                yield audio
+    finally:
+        # Runs on normal completion and when the client disconnects mid-stream
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PhraseBank:
+    """Fixed phrases synthesized once and held in memory for instant playback
+
+    ``render()`` fills the bank in the background on a small thread pool;
+    until a phrase is ready, ``get()`` returns None and callers synthesize
+    it as usual. The TTS cache sits underneath, so later startups render
+    from disk instead of calling the TTS engine.
+    """
+
+    def __init__(self, phrases, lang=None, synthesize=None):
+        self.phrases = list(dict.fromkeys(phrases))
+        self.lang = lang or config.TTS_LANGUAGE
+        self._synthesize = synthesize or synthesize_speech
+        self._audio = {}
+        self.ready = threading.Event()
+
+    def _render_all(self, workers):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {phrase: executor.submit(self._synthesize, phrase, self.lang) for phrase in self.phrases}
+            for phrase, future in futures.items():
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    print(f"Phrase Bank Error for '{phrase[:30]}...': {e}")
+                    continue
+                if audio:
+                    self._audio[phrase] = audio
+        self.ready.set()
+
+    def render(self, workers=None, wait=False):
+        """Synthesize every phrase; returns at once unless ``wait`` is set"""
+        workers = min(workers or config.TTS_STREAM_WORKERS, max(len(self.phrases), 1))
+        if wait:
+            self._render_all(workers)
+        else:
+            threading.Thread(target=self._render_all, args=(workers,), name="orion-phrase-bank", daemon=True).start()
+        return self
+
+    def get(self, text):
+        """Return the audio bytes (MP3 or WAV, per the backend) for a banked phrase, or None"""
+        return self._audio.get(text)
+
+    def __len__(self):
+        return len(self._audio)
@@ -1,6 +1,7 @@
 """Utility functions for Orion Voice Assistant"""
 import os
 import logging
+from collections import deque
 from datetime import datetime
 
 def ensure_directory_exists(directory_path):
@@ -36,7 +37,8 @@ class CommandHistory:
     """Track command history for the assistant"""
     
     def __init__(self, max_size=10):
-        self.history = []
+        # Ring buffer: appending past max_size drops the oldest item in O(1)
+        self.history = deque(maxlen=max_size)
         self.max_size = max_size
     
     def add(self, command):
@@ -45,14 +47,10 @@ class CommandHistory:
             "command": command,
             "timestamp": datetime.now()
         })
-        
-        # Keep only the last max_size items
-        if len(self.history) > self.max_size:
-            self.history.pop(0)
     
     def get_recent(self, count=5):
         """Get recent commands"""
-        return self.history[-count:] if len(self.history) >= count else self.history
+        return list(self.history)[-count:]
     
     def clear(self):
         """Clear command history"""
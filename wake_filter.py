@@ -0,0 +1,301 @@
+"""Local voice activity detection and wake-word spotting for the console assistant
+
+Before a phrase is sent to Google just to find out whether it contains
+the wake word, two cheap local checks run on the raw audio:
+
+1. Voice activity detection: vectorized per-frame energy and
+   zero-crossing rate. Frames count as voiced when they are well above
+   the clip's own noise floor and cross zero at a voiced-speech rate
+   (hiss and fans cross far more often). Clips with too little voiced
+   audio are dropped.
+2. Keyword spotting: log filterbank features of the voiced audio are
+   matched against recordings of the wake word
+   (``python wake_filter.py enroll``) with subsequence DTW, so
+   "orion, play believer" matches as well as a bare "orion". Without
+   enrolled templates only the VAD runs.
+
+``evaluate`` reports false-accept and false-reject rates over a folder
+of labelled WAV recordings, so thresholds can be tuned on real audio:
+
+    python wake_filter.py enroll orion_1.wav orion_2.wav orion_3.wav
+    python wake_filter.py evaluate fixtures/   # fixtures/wake/*.wav, fixtures/other/*.wav
+"""
+import argparse
+import glob
+import os
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import config
+
+SAMPLE_RATE = 16000
+FILTER_BANDS = 24
+
+# accept: send to the cloud recognizer; reason: "no speech", "speech", "wake word" or "no wake word"
+Decision = namedtuple("Decision", ["accept", "reason", "voiced_seconds", "distance"])
+
+
+def pcm_to_samples(frame_data, sample_width=2):
+    """Convert little-endian PCM bytes to float32 samples in [-1, 1]"""
+    if sample_width == 1:
+        return (np.frombuffer(frame_data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sample_width == 2:
+        return np.frombuffer(frame_data, dtype="<i2").astype(np.float32) / 32768
+    if sample_width == 4:
+        return np.frombuffer(frame_data, dtype="<i4").astype(np.float32) / 2147483648
+    raise ValueError(f"Unsupported sample width: {sample_width}")
+
+
+def audio_samples(audio):
+    """Return 16 kHz float samples for a speech_recognition AudioData"""
+    return pcm_to_samples(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), 2)
+
+
+def read_wav(path):
+    """Return (samples, sample_rate) for a mono or stereo PCM WAV file"""
+    with wave.open(path, "rb") as f:
+        rate, width, channels = f.getframerate(), f.getsampwidth(), f.getnchannels()
+        samples = pcm_to_samples(f.readframes(f.getnframes()), width)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, rate), SAMPLE_RATE
+
+
+def write_wav(path, samples, rate=SAMPLE_RATE):
+    """Write float samples as a 16-bit mono WAV file"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm.tobytes())
+
+
+def resample(samples, rate):
+    """Linearly resample to SAMPLE_RATE (adequate for energy and band features)"""
+    if rate == SAMPLE_RATE or len(samples) == 0:
+        return samples
+    count = int(round(len(samples) * SAMPLE_RATE / rate))
+    return np.interp(np.arange(count) * (rate / SAMPLE_RATE), np.arange(len(samples)), samples).astype(np.float32)
+
+
+def frames(samples, rate=SAMPLE_RATE):
+    """Return overlapping analysis frames as a (count, length) view"""
+    length = int(rate * config.VAD_FRAME_MS / 1000)
+    hop = int(rate * config.VAD_HOP_MS / 1000)
+    if len(samples) < length:
+        samples = np.pad(samples, (0, length - len(samples)))
+    return sliding_window_view(samples, length)[::hop]
+
+
+def frame_features(samples, rate=SAMPLE_RATE):
+    """Return per-frame (energy in dBFS, zero-crossing rate per sample)"""
+    windows = frames(samples, rate)
+    rms = np.sqrt(np.mean(windows ** 2, axis=1))
+    energy = 20 * np.log10(np.maximum(rms, 1e-6))
+    crossings = np.count_nonzero(np.diff(np.signbit(windows), axis=1), axis=1)
+    return energy, crossings / windows.shape[1]
+
+
+def voiced_frames(samples, rate=SAMPLE_RATE):
+    """Return a boolean mask of frames that look like voiced speech"""
+    energy, zcr = frame_features(samples, rate)
+    noise_floor = np.percentile(energy, 10)
+    voiced = (
+        (energy > noise_floor + config.VAD_ENERGY_MARGIN_DB)
+        & (energy > config.VAD_MIN_ENERGY_DB)
+        & (zcr < config.VAD_MAX_ZCR)
+    )
+    # Morphological closing bridges short dips (plosives, gaps between syllables)
+    kernel = np.ones(2 * config.VAD_BRIDGE_FRAMES + 1)
+    dilated = np.convolve(voiced, kernel, mode="same") > 0
+    return np.convolve(~dilated, kernel, mode="same") == 0
+
+
+def filterbank(rate=SAMPLE_RATE, fft_size=512, bands=FILTER_BANDS, low=100, high=4000):
+    """Triangular mel-spaced filters as a (bands, fft_size // 2 + 1) matrix"""
+    mel = lambda hz: 2595 * np.log10(1 + hz / 700)
+    edges_mel = np.linspace(mel(low), mel(high), bands + 2)
+    edges = 700 * (10 ** (edges_mel / 2595) - 1)
+    freqs = np.fft.rfftfreq(fft_size, 1 / rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling))
+
+
+_FILTERBANK = filterbank()
+
+
+def spectral_features(samples, rate=SAMPLE_RATE):
+    """Return level-independent log filterbank energies, one row per frame
+
+    Each frame keeps only its spectral shape (its mean log energy is
+    removed) within a 40 dB range, so loudness and background hiss in the
+    quiet bands matter little.
+    """
+    windows = frames(samples, rate) * np.hanning(int(rate * config.VAD_FRAME_MS / 1000))
+    spectrum = np.abs(np.fft.rfft(windows, n=512, axis=1)) ** 2
+    bands = spectrum @ _FILTERBANK.T
+    features = np.log(np.maximum(bands, bands.max(axis=1, keepdims=True) * 1e-4 + 1e-12))
+    return features - features.mean(axis=1, keepdims=True)
+
+
+def dtw_distance(template, query):
+    """Subsequence DTW: best average frame distance of ``template`` anywhere in ``query``
+
+    Each template frame advances the query by 0, 1 or 2 frames, so a match
+    may be up to twice as slow as the template and any amount faster. The
+    recursion runs one template row at a time with the whole query row
+    vectorized.
+    """
+    # Pairwise Euclidean distances, (template frames, query frames)
+    cost = np.sqrt(np.maximum(
+        (template ** 2).sum(axis=1)[:, None] + (query ** 2).sum(axis=1)[None, :] - 2 * template @ query.T, 0
+    ))
+    row = cost[0].copy()  # the match may start at any query frame
+    for i in range(1, len(template)):
+        previous = row
+        best = previous.copy()
+        best[1:] = np.minimum(best[1:], previous[:-1])
+        best[2:] = np.minimum(best[2:], previous[:-2])
+        row = cost[i] + best
+    return float(row.min() / len(template))
+
+
+class WakeWordFilter:
+    """Decides locally whether a phrase is worth sending to the cloud recognizer"""
+
+    def __init__(self, templates=None, threshold=None):
+        self.templates = list(templates or [])
+        self.threshold = config.WAKE_MATCH_THRESHOLD if threshold is None else threshold
+
+    @classmethod
+    def load(cls, path=None):
+        """Load enrolled templates from an .npz file; a missing file gives a VAD-only filter"""
+        path = path or config.WAKE_TEMPLATES
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            return cls([data[name] for name in sorted(data.files)])
+
+    def save(self, path=None):
+        path = path or config.WAKE_TEMPLATES
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, **{f"template_{i:03d}": template for i, template in enumerate(self.templates)})
+
+    @staticmethod
+    def _speech(samples, rate):
+        """Return (voiced seconds, samples trimmed to the voiced region)"""
+        voiced = voiced_frames(samples, rate)
+        hop = int(rate * config.VAD_HOP_MS / 1000)
+        seconds = float(voiced.sum() * hop / rate)
+        if not voiced.any():
+            return seconds, samples[:0]
+        indices = np.flatnonzero(voiced)
+        return seconds, samples[indices[0] * hop:(indices[-1] + 1) * hop + int(rate * config.VAD_FRAME_MS / 1000)]
+
+    def enroll(self, samples, rate=SAMPLE_RATE):
+        """Add a recording of the wake word on its own as a template"""
+        _, speech = self._speech(resample(samples, rate), SAMPLE_RATE)
+        if len(speech) == 0:
+            raise ValueError("No speech found in the enrollment recording")
+        self.templates.append(spectral_features(speech))
+
+    def check(self, samples, rate=SAMPLE_RATE):
+        """Return a Decision for float samples"""
+        samples = resample(samples, rate)
+        seconds, speech = self._speech(samples, SAMPLE_RATE)
+        if seconds < config.VAD_MIN_SPEECH:
+            return Decision(False, "no speech", seconds, None)
+        if not self.templates:
+            return Decision(True, "speech", seconds, None)
+        features = spectral_features(speech)
+        distance = min(dtw_distance(template, features) for template in self.templates)
+        if distance <= self.threshold:
+            return Decision(True, "wake word", seconds, distance)
+        return Decision(False, "no wake word", seconds, distance)
+
+    def check_audio(self, audio):
+        """Return a Decision for a speech_recognition AudioData"""
+        return self.check(audio_samples(audio))
+
+
+def labelled_fixtures(directory):
+    """Yield (path, is_wake_word) for WAVs under ``directory``/wake and ``directory``/other"""
+    for label, expected in (("wake", True), ("other", False)):
+        for path in sorted(glob.glob(os.path.join(directory, label, "*.wav"))):
+            yield path, expected
+
+
+def evaluate(wake_filter, directory):
+    """Return false-accept/false-reject rates of ``wake_filter`` on labelled WAV fixtures"""
+    results = []
+    started = time.perf_counter()
+    for path, expected in labelled_fixtures(directory):
+        samples, rate = read_wav(path)
+        decision = wake_filter.check(samples, rate)
+        results.append((path, expected, decision))
+    elapsed = time.perf_counter() - started
+    positives = [decision for _, expected, decision in results if expected]
+    negatives = [decision for _, expected, decision in results if not expected]
+    false_rejects = sum(1 for decision in positives if not decision.accept)
+    false_accepts = sum(1 for decision in negatives if decision.accept)
+    return {
+        "wake_clips": len(positives),
+        "other_clips": len(negatives),
+        "false_accepts": false_accepts,
+        "false_rejects": false_rejects,
+        "far": round(false_accepts / len(negatives), 4) if negatives else None,
+        "frr": round(false_rejects / len(positives), 4) if positives else None,
+        "ms_per_clip": round(elapsed / len(results) * 1000, 3) if results else None,
+        "clips": [
+            {"path": path, "wake_word": expected, "accepted": decision.accept, "reason": decision.reason,
+             "distance": None if decision.distance is None else round(decision.distance, 4)}
+            for path, expected, decision in results
+        ],
+    }
+
+
+def main():
+    """Command line entry point for enrollment and evaluation"""
+    parser = argparse.ArgumentParser(description="Orion's local wake-word pre-filter")
+    parser.add_argument("--templates", default=config.WAKE_TEMPLATES, help="template file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enroll_parser = subparsers.add_parser("enroll", help="add WAV recordings of the wake word as templates")
+    enroll_parser.add_argument("wavs", nargs="+")
+    evaluate_parser = subparsers.add_parser("evaluate", help="measure FAR/FRR on <dir>/wake and <dir>/other WAVs")
+    evaluate_parser.add_argument("directory")
+    evaluate_parser.add_argument("--threshold", type=float, help="override WAKE_MATCH_THRESHOLD")
+    evaluate_parser.add_argument("--verbose", action="store_true", help="list every clip")
+    args = parser.parse_args()
+
+    wake_filter = WakeWordFilter.load(args.templates)
+    if args.command == "enroll":
+        for path in args.wavs:
+            wake_filter.enroll(*read_wav(path))
+        wake_filter.save(args.templates)
+        print(f"✅ {len(wake_filter.templates)} template(s) saved to {args.templates}")
+        return
+
+    if args.threshold is not None:
+        wake_filter.threshold = args.threshold
+    report = evaluate(wake_filter, args.directory)
+    if args.verbose:
+        for clip in report["clips"]:
+            mark = "✅" if clip["accepted"] == clip["wake_word"] else "❌"
+            print(f"{mark} {clip['path']}: {clip['reason']} (distance {clip['distance']})")
+    print(f"Templates: {len(wake_filter.templates)}, threshold: {wake_filter.threshold}")
+    print(f"False accepts: {report['false_accepts']}/{report['other_clips']} (FAR {report['far']})")
+    print(f"False rejects: {report['false_rejects']}/{report['wake_clips']} (FRR {report['frr']})")
+    print(f"Average time per clip: {report['ms_per_clip']} ms")
+
+
+if __name__ == "__main__":
+    main()